@@ -19,13 +19,27 @@ static unsigned char origin_response[] = {
 
 static GCState gc_state = gc_default_state;
 static GCStateQueue state_queue;
+static GCMacro macro;
 unsigned int i = 0;
 
+// While a Macro command is being received: the number of bytes of it still
+// to come, and the first byte of the step being received.
+static int macro_bytes_left = 0;
+static unsigned char macro_step_byte;
+
+// Acknowledgements sent back over serial. See PROTOCOL.md.
+static const unsigned char ACK_RECEIVED = 'R';
+static const unsigned char ACK_DONE = 'D';
+
+// True if a command was received since the last ACK_DONE
+static bool busy = false;
+
 
 void setup() {
     gc_setup();
     Serial.begin(115200);
     GCStateQueue_clear(&state_queue);
+    GCMacro_clear(&macro);
 }
 
 void loop() {
@@ -66,18 +80,72 @@ void loop() {
     }
 
     if(Serial.available()) {
-        process_serial_command(Serial.read(), &state_queue);
+        // Macro commands are several bytes long, so read everything that
+        // has arrived.
+        while(Serial.available()) {
+            process_serial_byte(Serial.read());
+        }
         gc_state = *GCStateQueue_peek(&state_queue);
         i = 0;
 
     //TODO: Why every 5 times? Does 4 work? Does 1?
     } else if(i % 5 == 0) {
         gc_state = *GCStateQueue_next(&state_queue);
+        if(GCStateQueue_empty(&state_queue) &&
+                GCMacro_fill(&macro, &state_queue)) {
+            gc_state = *GCStateQueue_peek(&state_queue);
+        }
+        if(busy && GCStateQueue_empty(&state_queue)) {
+            Serial.write(ACK_DONE);
+            busy = false;
+        }
     }
 
     i++;
 }
 
+/**
+ * Handles one byte received over serial: either the start of a command, or
+ * part of a Macro command that is being received.
+ */
+static void process_serial_byte(unsigned char c) {
+    if(macro_bytes_left > 0) {
+        if(macro_bytes_left % 2 == 0) {
+            macro_step_byte = c;
+        } else {
+            GCMacro_push(&macro, (macro_step_byte & 0xF0) >> 4,
+                         (macro_step_byte & 0x0F) + 1, c ? c : 1);
+        }
+        macro_bytes_left--;
+        if(macro_bytes_left == 0) {
+            command_received();
+        }
+        return;
+    }
+
+    // Any new command replaces a macro that's still running
+    switch((c & 0xC0) >> 6) {
+        case 0x2:
+            GCMacro_clear(&macro);
+            GCStateQueue_clear(&state_queue);
+            macro_bytes_left = 2 * (c & 0x3F);
+            if(macro_bytes_left == 0) {
+                command_received();
+            }
+        break;
+        default:
+            GCMacro_clear(&macro);
+            process_serial_command(c, &state_queue);
+            command_received();
+        break;
+    }
+}
+
+static void command_received() {
+    Serial.write(ACK_RECEIVED);
+    busy = true;
+}
+
 /**
  * Adds controller states to the queue based on the command.
  */
@@ -151,20 +219,7 @@ static void process_serial_command_single_button(unsigned char c, GCStateQueue*
     int button = (c & 0x3C) >> 2;
     int repetitions = (c & 0x03) + 1;
 
-    switch(button) {
-        case 0x0: new_state.data1 |= 0x10; break;  // Start
-        case 0x1: new_state.stick_y = 255; break;  // Up
-        case 0x2: new_state.stick_y = 0;   break;  // Down
-        case 0x3: new_state.data1 |= 0x01; break;  // A
-        case 0x4: new_state.data1 |= 0x02; break;  // B
-        case 0x5: new_state.data1 |= 0x04; break;  // X
-        case 0x6: new_state.data1 |= 0x08; break;  // Y
-        case 0x7: break;  // TODO: Left trigger not implemented
-        case 0x8: break;  // TODO: Left trigger not implemented
-        case 0x9: new_state.stick_x = 0;   break;  // Left
-        case 0xA: new_state.stick_x = 255; break;  // Right
-        case 0xB: new_state.data2 |= 0x10; break;  // Z
-    }
+    GCState_set_button(&new_state, button);
 
     for(int i=0; i<repetitions; i++) {
         GCStateQueue_push(queue, &new_state, 1);
@@ -3,6 +3,7 @@
 #define _GC_STATE_QUEUE_H
 
 static const int GC_STATE_QUEUE_MAX = 10;
+static const int GC_MACRO_MAX_STEPS = 63;
 
 typedef struct {
     struct {
@@ -13,9 +14,31 @@ typedef struct {
     int pos;
 } GCStateQueue;
 
+// A sequence of button presses, uploaded with the Macro command (see
+// PROTOCOL.md). It is added to a GCStateQueue one press at a time, each time
+// the queue runs out.
+typedef struct {
+    struct {
+        unsigned char button;  // Same values as the Single Button command
+        unsigned char repetitions;
+        unsigned char wait;  // States to release the controller for
+    } steps[GC_MACRO_MAX_STEPS];
+    int len;
+    int pos;
+    int repetition;
+} GCMacro;
+
+void GCState_set_button(GCState* state, int button);
+
 void GCStateQueue_clear(GCStateQueue* mq);
 void GCStateQueue_push(GCStateQueue* mq, const GCState* state, unsigned int count);
+bool GCStateQueue_empty(const GCStateQueue* mq);
 const GCState* GCStateQueue_peek(const GCStateQueue* mq);
 const GCState* GCStateQueue_next(GCStateQueue* mq);
 
+void GCMacro_clear(GCMacro* macro);
+void GCMacro_push(GCMacro* macro, unsigned char button,
+                  unsigned char repetitions, unsigned char wait);
+bool GCMacro_fill(GCMacro* macro, GCStateQueue* mq);
+
 #endif
@@ -2,6 +2,27 @@
 #include "gc_com.h"
 #include "gc_state_queue.h"
 
+/**
+ * Press a button in `state`. `button` has the same values as the Single
+ * Button command.
+ */
+void GCState_set_button(GCState* state, int button) {
+    switch(button) {
+        case 0x0: state->data1 |= 0x10; break;  // Start
+        case 0x1: state->stick_y = 255; break;  // Up
+        case 0x2: state->stick_y = 0;   break;  // Down
+        case 0x3: state->data1 |= 0x01; break;  // A
+        case 0x4: state->data1 |= 0x02; break;  // B
+        case 0x5: state->data1 |= 0x04; break;  // X
+        case 0x6: state->data1 |= 0x08; break;  // Y
+        case 0x7: break;  // TODO: Left trigger not implemented
+        case 0x8: break;  // TODO: Left trigger not implemented
+        case 0x9: state->stick_x = 0;   break;  // Left
+        case 0xA: state->stick_x = 255; break;  // Right
+        case 0xB: state->data2 |= 0x10; break;  // Z
+    }
+}
+
 void GCStateQueue_clear(GCStateQueue* mq) {
     mq->len = 0;
     mq->pos = 0;
@@ -17,6 +38,10 @@ void GCStateQueue_push(GCStateQueue* mq, const GCState* state, unsigned int coun
     mq->len++;
 }
 
+bool GCStateQueue_empty(const GCStateQueue* mq) {
+    return mq->pos >= mq->len;
+}
+
 const GCState* GCStateQueue_peek(const GCStateQueue* mq) {
     if(mq->pos < 0 || mq->pos >= mq->len) {
         return &gc_default_state;
@@ -36,3 +61,43 @@ const GCState* GCStateQueue_next(GCStateQueue* mq) {
     const GCState* state = GCStateQueue_peek(mq);
     return state;
 }
+
+void GCMacro_clear(GCMacro* macro) {
+    macro->len = 0;
+    macro->pos = 0;
+    macro->repetition = 0;
+}
+
+void GCMacro_push(GCMacro* macro, unsigned char button,
+                  unsigned char repetitions, unsigned char wait) {
+    if(macro->len >= GC_MACRO_MAX_STEPS) {
+        return;
+    }
+    macro->steps[macro->len].button = button;
+    macro->steps[macro->len].repetitions = repetitions;
+    macro->steps[macro->len].wait = wait;
+    macro->len++;
+}
+
+/**
+ * Replace the contents of the queue with the next press of the macro and
+ * the release after it. Returns false if the macro is finished.
+ */
+bool GCMacro_fill(GCMacro* macro, GCStateQueue* mq) {
+    if(macro->pos >= macro->len) {
+        return false;
+    }
+
+    GCState state = gc_default_state;
+    GCState_set_button(&state, macro->steps[macro->pos].button);
+    GCStateQueue_clear(mq);
+    GCStateQueue_push(mq, &state, 1);
+    GCStateQueue_push(mq, &gc_default_state, macro->steps[macro->pos].wait);
+
+    macro->repetition++;
+    if(macro->repetition >= macro->steps[macro->pos].repetitions) {
+        macro->pos++;
+        macro->repetition = 0;
+    }
+    return true;
+}
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+"""
+Measures how long each AI takes to decide on a move.
+
+Every AI is run over the same positions, taken from the board recordings in
+"tests/data" plus synthetic boards at various fill levels. Save the results
+with -o, then compare them to a later run with -c to catch regressions.
+"""
+
+import os
+import sys
+import glob
+import json
+
+import puyo
+from puyo import benchmark
+
+RECORDING_GLOB = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "tests", "data", "*.pickle")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    ai_names = sorted(puyo.AI_REGISTRY.keys())
+    parser.add_argument("-a", "--ai", choices=ai_names, action="append",
+        dest="ais", help="AI to benchmark. May be given more than once "
+        "(default: all of {}).".format(ai_names))
+    parser.add_argument("-o", "--output", default=None,
+        help="Save results to this JSON file.")
+    parser.add_argument("-c", "--compare", default=None, metavar="FILE",
+        help="Compare the results to a JSON file saved with -o.")
+    parser.add_argument("-r", "--repeat", type=int, default=1,
+        help="Number of times to run each position (default: %(default)s).")
+    parser.add_argument("--recording-positions", type=int, default=100,
+        help="Maximum positions to take from each board recording (default: "
+        "%(default)s).")
+    parser.add_argument("--synthetic-positions", type=int, default=10,
+        help="Synthetic positions per fill level (default: %(default)s).")
+    args = parser.parse_args()
+
+    positions = []
+    for filename in sorted(glob.glob(RECORDING_GLOB)):
+        positions.extend(benchmark.load_recording_positions(
+            filename, args.recording_positions))
+    positions.extend(benchmark.synthetic_positions(args.synthetic_positions))
+    if not positions:
+        parser.error("No positions to benchmark.")
+
+    results = benchmark.run_benchmark(args.ais or ai_names, positions,
+                                      args.repeat)
+    print benchmark.format_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old_results = json.load(f)
+        print
+        print benchmark.compare_results(old_results, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+"""
+Measures how fast commands get through to the Arduino Gamecube controller.
+
+Commands are sent in bursts, and the time each call takes is measured. With
+--async-controller, the time each command spends queued, waiting to be
+acknowledged and being executed is measured too. By default the Arduino is
+emulated on a pseudo-terminal (see "emulate_arduino.py"), which also reports
+what the firmware made of the commands: how many it decoded, how many were
+still running when the next one arrived, and anything lost to full
+buffers.
+"""
+
+from __future__ import division
+from time import time, sleep
+
+import puyo
+from puyo.arduino import Firmware, PtyArduino
+from puyo.stats import LatencyHistogram
+
+
+def format_histogram(name, histogram):
+    values = histogram.percentiles() + [histogram.max()]
+    values = ["-" if v is None else "{:.1f}".format(v*1000) for v in values]
+    return "{:<12} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        name, histogram.count, *values)
+
+def send_command(controller, kind, i):
+    if kind == "move":
+        return controller.puyo_move(i % 6, i % 4)
+    elif kind == "button":
+        return controller.push_button(("left", "right")[i % 2])
+    else:
+        controller.run_macro([("up", 0.1), ("down", 0.1)] * 3)
+        return getattr(controller, "last_command", None)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--device", default=None,
+        help="Serial device of a real Arduino. Default: emulate one.")
+    parser.add_argument("--async-controller", default=False,
+        action="store_true", help="Use AsyncGamecubeController, which waits "
+        "for the Arduino to acknowledge each command.")
+    parser.add_argument("--command", "-c", default="button",
+        choices=("move", "button", "macro"), help="Command to send "
+        "(default: %(default)s).")
+    parser.add_argument("-n", "--commands", type=int, default=100,
+        help="Number of commands to send (default: %(default)s).")
+    parser.add_argument("--burst", "-b", type=int, default=1,
+        help="Commands sent back to back in each burst (default: "
+        "%(default)s).")
+    parser.add_argument("--interval", "-i", type=float, default=0.2,
+        help="Seconds between bursts (default: %(default)s).")
+    args = parser.parse_args()
+
+    arduino = None
+    if args.device is None:
+        firmware = Firmware()
+        arduino = PtyArduino(firmware)
+        arduino.start()
+        device = arduino.device
+    else:
+        device = args.device
+    if args.async_controller:
+        controller = puyo.AsyncGamecubeController(device)
+    else:
+        controller = puyo.GamecubeController(device)
+
+    call_times = LatencyHistogram(args.commands)
+    commands = []
+    start = time()
+    for i in range(args.commands):
+        if i and i % args.burst == 0:
+            sleep(args.interval)
+        call_start = time()
+        command = send_command(controller, args.command, i)
+        call_times.add(time() - call_start)
+        if command is not None:
+            commands.append(command)
+    duration = time() - start
+
+    # Let everything finish
+    if commands:
+        for command in commands:
+            command.wait(5)
+    else:
+        sleep(1)
+        while arduino is not None and not firmware.idle:
+            sleep(0.1)
+
+    print "Sent {} commands in {:.2f}s ({:.1f}/s)".format(
+        args.commands, duration, args.commands / duration)
+    print "Times (ms):"
+    print "{:<12} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        "", "n", "p50", "p95", "p99", "max")
+    print format_histogram("call", call_times)
+    if commands:
+        stages = (("queued", "queued_time", "sent_time"),
+                  ("ack", "sent_time", "received_time"),
+                  ("execution", "received_time", "done_time"))
+        for name, begin, end in stages:
+            histogram = LatencyHistogram(len(commands))
+            for command in commands:
+                if not command.failed:
+                    histogram.add(getattr(command, end) -
+                                  getattr(command, begin))
+            print format_histogram(name, histogram)
+        print "{} commands were never acknowledged".format(
+            sum(1 for command in commands if command.failed))
+
+    if arduino is not None:
+        print format_histogram("emulated", firmware.execution_times)
+        print "The emulated firmware decoded {} commands, {} still " \
+              "running when the next arrived".format(
+                  len(firmware.commands),
+                  sum(1 for c in firmware.commands if c.overlapped))
+        print "Dropped {} serial bytes and {} controller states".format(
+            firmware.n_dropped_bytes, firmware.n_dropped_states)
+
+    if args.async_controller:
+        controller.close()
+    if arduino is not None:
+        arduino.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#!/usr/bin/python
+"""
+Builds an opening book: the moves an AI makes in every position of the first
+few moves of a game, saved so that they don't have to be searched again
+during play. Use the book with the --opening-book option of "run.py".
+"""
+from time import time
+
+import puyo
+from puyo import openingbook
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    ai_names = sorted(puyo.AI_REGISTRY.keys())
+    parser.add_argument("-a", "--ai", choices=ai_names, default="value",
+        help="AI that searches each position (default: %(default)s).")
+    parser.add_argument("-n", "--moves", type=int,
+        default=openingbook.DEFAULT_N_MOVES, help="Number of moves from the "
+        "start of the game to cover. Each move multiplies the number of "
+        "positions by roughly 25 (default: %(default)s).")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+        help="Number of processes to search with (default: number of "
+        "CPUs).")
+    parser.add_argument("-o", "--output", default="opening_book.bin",
+        help="Book file to write (default: %(default)s).")
+    args = parser.parse_args()
+
+    start = time()
+    def progress(move_number, n_positions):
+        print "Move {}: {} positions searched ({:.1f}s)".format(
+              move_number + 1, n_positions, time() - start)
+    entries = openingbook.build_book(args.ai, args.moves,
+                                     processes=args.processes,
+                                     callback=progress)
+    openingbook.write_book(entries, args.output)
+    print "{} positions written to {}".format(len(entries), args.output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+"""
+Emulates the Arduino Gamecube controller on a pseudo-terminal.
+
+Prints the device to use in place of the Arduino's serial port, for example
+with "gc_send.py" or "run.py", then logs every command the emulated firmware
+decodes, with timestamps, until interrupted.
+"""
+
+import sys
+from time import sleep
+
+from puyo.arduino import Firmware, PtyArduino
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--log", "-o", default=None,
+        help="File to write the log to. Default: stdout.")
+    args = parser.parse_args()
+
+    log_file = sys.stdout if args.log is None else open(args.log, "a")
+    def log(t, message):
+        log_file.write("{:10.3f} {}\n".format(t, message))
+        log_file.flush()
+
+    firmware = Firmware(log)
+    arduino = PtyArduino(firmware)
+    print "Emulating the Arduino on {}".format(arduino.device)
+    sys.stdout.flush()
+    arduino.start()
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        arduino.close()
+
+    p50, p95, p99 = firmware.execution_times.percentiles()
+    print "{} commands, {} still running when the next arrived".format(
+        len(firmware.commands),
+        sum(1 for c in firmware.commands if c.overlapped))
+    if p50 is not None:
+        print "Execution time (ms): p50={:.1f} p95={:.1f} p99={:.1f}".format(
+            p50*1000, p95*1000, p99*1000)
+    print "Dropped {} serial bytes, {} controller states".format(
+        firmware.n_dropped_bytes, firmware.n_dropped_states)
+
+
+if __name__ == "__main__":
+    main()
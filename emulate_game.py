@@ -0,0 +1,48 @@
+#!/usr/bin/python
+"""
+Plays an emulated game with the whole bot, without a Gamecube.
+
+Each state of the game is drawn into a frame laid out like the real screen
+and given to the Driver, whose moves go through an emulation of the Arduino's
+firmware back into the game. Time is simulated, so games run as fast as the
+Driver can process frames. Prints how fast frames were processed, how long
+the Driver took to decide on each move, and how many moves were missed.
+"""
+
+import puyo
+from puyo.emulator import Emulator
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    ai_names = list(puyo.AI_REGISTRY.keys())
+    parser.add_argument("-a", "--ai", choices=ai_names,
+        default=puyo.DEFAULT_AI_NAME, help="AI to run. Choose one of: {} "
+        "(default: %(default)s).".format(ai_names))
+    parser.add_argument("-s", "--seed", type=int, default=0,
+        help="Seed of the bean sequence (default: %(default)s).")
+    parser.add_argument("-n", "--pairs", type=int, default=100,
+        help="Stop after this many pairs have landed (default: "
+        "%(default)s).")
+    parser.add_argument("-t", "--max-time", type=float, default=None,
+        help="Stop after this many seconds of game.")
+    parser.add_argument("--field", "-f", default=None,
+        type=lambda f: f if f == "alternate" else int(f),
+        choices=(0, 1, "alternate"), help="Only recognize one field of the "
+        "frames, like run.py: 0 (even rows), 1 (odd rows), or alternate "
+        "between them each frame. Default: use the whole frame.")
+    parser.add_argument("--skip-frames", action="store_true", default=False,
+        help="Skip most frames while the board is animating, like run.py.")
+    args = parser.parse_args()
+
+    emulator = Emulator(args.ai, args.seed, field=args.field,
+                        skip_frames=args.skip_frames)
+    try:
+        stats = emulator.run(max_pairs=args.pairs, max_time=args.max_time)
+    finally:
+        emulator.close()
+    print stats.format()
+
+if __name__ == "__main__":
+    main()
@@ -48,7 +48,6 @@ def execute_command(controller, command, errorfunc=lambda x: None):
                 raise RuntimeError()
             return x
 
-        controller = GamecubeController(gc_dev)
         col, rot = command.split(',', 1)
         col = validate("Column", 0, 6, col)
         rot = validate("Rotation", -3, 3, rot)
@@ -2,9 +2,10 @@
 DEFAULT_AI_NAME = "simple_combo"
 
 from puyo.board import Board
-from puyo.beanfinder import BeanFinder
-from puyo.gccontrol import GamecubeController
-from puyo.vision import Vision
+from puyo.beanfinder import BeanFinder, DualBeanFinder
+from puyo.gccontrol import GamecubeController, AsyncGamecubeController, \
+    ControllerCommand
+from puyo.vision import Vision, DualVision
 from puyo.driver import Driver, PASSWORDS
 from puyo import ai
 
@@ -12,6 +13,8 @@ AI_REGISTRY = {
     'simple_combo': ai.SimpleComboAI,
     'random': ai.RandomAI,
     'simple_greedy': ai.SimpleGreedyAI,
+    'tuned_combo': ai.TunedComboAI,
+    'value': ai.ValueAI,
 }
 
 DEFAULT_AI = AI_REGISTRY[DEFAULT_AI_NAME]
@@ -6,9 +6,18 @@ determines the next move that is made. To make an AI available, add it to
 
 """
 
+import os
+import json
 import random
 import itertools
 
+import numpy
+
+from puyo import value
+from puyo.openingbook import OpeningBook
+
+WEIGHTS_DIR = os.path.join(os.path.dirname(__file__), "weights")
+
 
 class AI(object):
     """Abstract base AI class."""
@@ -38,6 +47,28 @@ class AI(object):
                                   "subclass.")
 
 
+class OpeningBookAI(AI):
+    """Plays the moves of an opening book, and asks `ai` everywhere else.
+
+    `book` is a `puyo.openingbook.OpeningBook` or the filename of one. Since
+    the book only holds positions from the start of a game, `ai` is usually
+    only asked once the first few moves are over.
+
+    """
+
+    def __init__(self, ai, book):
+        if isinstance(book, basestring):
+            book = OpeningBook(book)
+        self.ai = ai
+        self.book = book
+
+    def get_move(self, board, beans):
+        move = self.book.lookup(board, beans)
+        if move is not None and board.can_make_move(*move):
+            return move
+        return self.ai.get_move(board, beans)
+
+
 class RandomAI(AI):
     """AI that makes completely random moves."""
 
@@ -105,35 +136,160 @@ class SimpleComboAI(ScoreBasedAI):
     """
     Like the SimpleGreedyAI, but it values moves more when they have the
     potential to make combos.
+
+    How much each part of the heuristic counts is set by `weights`, a dict
+    with the same keys as `DEFAULT_WEIGHTS`:
+
+        potential_chain: Multiplies the score of each chain that a single
+            bean dropped afterwards would cause.
+        single_chain: Multiplies the score of the move if it eliminates beans
+            without a chain.
+        chain: Multiplies the score of the move if it causes a chain.
+        connected: Multiplies the sum of the group size of each bean.
+        danger_fill: Number of filled cells above which the board is in
+            danger.
+        danger_chain: Multiplies the score of the move, on top of the above,
+            if the board is in danger.
+
     """
 
+    DEFAULT_WEIGHTS = {
+        "potential_chain": 1,
+        "single_chain": 0,
+        "chain": 2,
+        "connected": 1,
+        "danger_fill": 36,
+        "danger_chain": 4,
+    }
+
+    def __init__(self, weights=None):
+        self.weights = dict(self.DEFAULT_WEIGHTS)
+        if weights is not None:
+            unknown = set(weights) - set(self.DEFAULT_WEIGHTS)
+            if unknown:
+                raise ValueError("Unknown weights: {}".format(
+                                 ", ".join(sorted(unknown))))
+            self.weights.update(weights)
+
     def score_move(self, board, beans, pos, rot):
+        weights = self.weights
         combo = board.make_move(beans, pos, rot)
         value = 0
 
+        potential = 0
         for color in (b'r', b'g', b'b', b'y', b'p'):
             for x in range(6):
                 tmp_combo = board.copy().drop_bean(x, color)
                 if tmp_combo.length >= 2:
-                    value += tmp_combo.score
+                    potential += tmp_combo.score
+        value += weights["potential_chain"] * potential
 
-        if combo.length < 1:
-            value -= combo.score
+        if combo.length == 1:
+            value += weights["single_chain"] * combo.score
         elif combo.length > 1:
-            value += 2*combo.score
+            value += weights["chain"] * combo.score
 
         n_filled = 0
+        connected = 0
         for x in range(6):
             for y in range(12):
-                value += len(board.get_connected(x, y))
+                connected += len(board.get_connected(x, y))
                 if board[x][y] != b' ':
                     n_filled += 1
+        value += weights["connected"] * connected
 
-        if n_filled > 36 or board[2][9] != b' ':
-            value += 4*combo.score
+        if n_filled > weights["danger_fill"] or board[2][9] != b' ':
+            value += weights["danger_chain"] * combo.score
 
         # Don't give yourself a game over
         if board[2][11] != b' ':
             value = float("-inf")
 
         return value
+
+
+class TunedComboAI(SimpleComboAI):
+    """`SimpleComboAI` with weights tuned by self-play.
+
+    The weights are read from `WEIGHTS_FILENAME`, which is written by
+    "tune_ai.py". They're only read once per process.
+
+    """
+
+    WEIGHTS_FILENAME = os.path.join(WEIGHTS_DIR, "tuned_combo.json")
+    _loaded_weights = None
+
+    def __init__(self):
+        cls = TunedComboAI
+        if cls._loaded_weights is None:
+            with open(cls.WEIGHTS_FILENAME) as f:
+                cls._loaded_weights = json.load(f)["weights"]
+        SimpleComboAI.__init__(self, cls._loaded_weights)
+
+
+class ValueAI(AI):
+    """Searches two moves ahead and scores boards with a learned model.
+
+    Every pair of moves for the current and next beans is tried, then all of
+    the resulting boards are scored in one batch by a `puyo.value.ValueModel`.
+    A move is worth the points scored by both moves plus the model's
+    prediction for the board after them. Moves leading to a game over are
+    never chosen unless there's nothing else.
+
+    The model is read from `MODEL_FILENAME`, written by "train_value.py",
+    the first time it's needed.
+
+    """
+
+    MODEL_FILENAME = os.path.join(WEIGHTS_DIR, "value_mlp.npz")
+
+    def __init__(self, model=None):
+        self._model = model
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = value.get_model(self.MODEL_FILENAME)
+        return self._model
+
+    def get_move(self, board, beans):
+        moves = []
+        boards = []
+        scores = []
+        for move in board.iter_moves():
+            tmp_board = board.copy()
+            combo = tmp_board.make_move(beans, *move)
+            if combo.game_over or tmp_board[2][11] != b' ':
+                continue
+            moves.append(move)
+            boards.append(tmp_board)
+            scores.append(combo.score)
+        if not moves:
+            return next(board.iter_moves())
+
+        if board.next_beans is None:
+            leaves = [tmp_board.get_uint8_array() for tmp_board in boards]
+            values = self.model.evaluate(numpy.array(leaves)) + scores
+            return moves[int(numpy.argmax(values))]
+
+        leaves = []
+        leaf_scores = []
+        owners = []
+        for i, tmp_board in enumerate(boards):
+            for move in tmp_board.iter_moves():
+                leaf = tmp_board.copy()
+                combo = leaf.make_move(board.next_beans, *move)
+                if combo.game_over or leaf[2][11] != b' ':
+                    continue
+                leaves.append(leaf.get_uint8_array())
+                leaf_scores.append(scores[i] + combo.score)
+                owners.append(i)
+
+        values = numpy.full(len(moves), -numpy.inf)
+        if leaves:
+            leaf_values = self.model.evaluate(numpy.array(leaves)) + leaf_scores
+            numpy.maximum.at(values, owners, leaf_values)
+        if numpy.isneginf(values).all():
+            # Every first move loses on the next one. Take the most points.
+            return moves[int(numpy.argmax(scores))]
+        return moves[int(numpy.argmax(values))]
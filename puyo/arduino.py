@@ -0,0 +1,369 @@
+"""An emulator of the Arduino that acts as the Gamecube controller.
+
+`Firmware` reimplements the logic of "arduino/gamecube_control" in Python, one
+poll from the Gamecube at a time: it decodes the serial protocol described in
+"arduino/gamecube_control/PROTOCOL.md", holds each controller state for the
+same number of polls, and sends the same acknowledgements. `PtyArduino` runs
+it in real time behind a pseudo-terminal, so `GamecubeController`,
+"gc_send.py" and "run.py" can be pointed at it instead of "/dev/ttyACM0".
+
+Only the firmware's timing is emulated, not the game, so it's useful for
+testing and benchmarking the control path without any hardware.
+
+"""
+from __future__ import division
+import os
+import pty
+import tty
+import select
+import threading
+from time import time, sleep
+
+from puyo.gccontrol import GamecubeController, ACK_RECEIVED, ACK_DONE, \
+    MACRO_MAX_STEPS
+from puyo.stats import LatencyHistogram
+from puyo.timing import FRAME_TIME
+
+# The Gamecube polls the controller about once a frame, and the firmware
+# holds each controller state for this many polls.
+POLL_TIME = FRAME_TIME
+POLLS_PER_STATE = 5
+
+# Sizes of the Arduino's serial receive buffer and the firmware's state
+# queue. Anything past them is lost.
+SERIAL_BUFFER_SIZE = 64
+STATE_QUEUE_MAX = 10
+
+# A controller state is the set of names of the buttons pressed, using the
+# names of `GamecubeController.BUTTON_BITS`.
+DEFAULT_STATE = frozenset()
+
+BUTTON_NAMES = dict((bits, name) for name, bits
+                    in GamecubeController.BUTTON_BITS.items())
+BUTTON_NAMES.update({0x7: "l", 0x8: "r"})
+
+
+def describe_command(data):
+    """Return a short human readable description of a command's bytes."""
+    c = ord(data[0])
+    kind = c >> 6
+    if kind == 0x0:
+        return "move x={:+d} rotation={}{}".format(
+            ((c >> 3) & 0x7) - 2, (c >> 1) & 0x3,
+            " down_fast" if c & 0x1 else "")
+    elif kind == 0x1:
+        return "button {} x{}".format(BUTTON_NAMES.get((c >> 2) & 0xF, "?"),
+                                      (c & 0x3) + 1)
+    elif kind == 0x2:
+        steps = []
+        for i in range(1, len(data) - 1, 2):
+            step, wait = ord(data[i]), ord(data[i+1])
+            steps.append("{}x{}/{}".format(
+                BUTTON_NAMES.get(step >> 4, "?"), (step & 0xF) + 1,
+                wait or 1))
+        return "macro [{}]".format(" ".join(steps))
+    return "unknown 0x{:02x}".format(c)
+
+
+class FirmwareCommand(object):
+    """A command received by `Firmware`.
+
+    Attributes:
+        data: The bytes of the command.
+        received_time: When its last byte was processed.
+        done_time: When the firmware acknowledged it was done, or None.
+        overlapped: True if another command arrived before it was done.
+            Moves and macros replace whatever was running, while button
+            presses are added after it.
+
+    """
+
+    def __init__(self, data, received_time):
+        self.data = data
+        self.received_time = received_time
+        self.done_time = None
+        self.overlapped = False
+
+    def __str__(self):
+        return describe_command(self.data)
+
+
+class Firmware(object):
+    """The firmware's main loop, run one Gamecube poll at a time.
+
+    This mirrors "gamecube_control.ino" and "gc_state_queue.ino" closely,
+    including their quirks: any serial input restarts the current state's
+    timer, and states past `STATE_QUEUE_MAX` are dropped.
+
+    Attributes:
+        state: The controller state the Gamecube currently reads.
+        commands: Every `FirmwareCommand` received, in order.
+        execution_times: A `LatencyHistogram` of the time from receiving
+            each command to acknowledging it as done.
+        n_polls: Number of polls so far.
+        n_dropped_bytes: Bytes lost because the serial buffer was full.
+        n_dropped_states: States lost because the state queue was full.
+
+    """
+
+    def __init__(self, log=None):
+        """
+        Args:
+            log: If given, called with the time and a message for every
+                command received, every acknowledgement sent and everything
+                lost.
+        """
+        self.log = log
+        self.state = DEFAULT_STATE
+        self.commands = []
+        self.execution_times = LatencyHistogram()
+        self.n_polls = 0
+        self.n_dropped_bytes = 0
+        self.n_dropped_states = 0
+        self.busy = False
+
+        self._time = 0.0
+        self._i = 0
+        self._queue = []  # [state, count] lists
+        self._pos = 0
+        self._macro = []  # (button, repetitions, wait) tuples
+        self._macro_pos = 0
+        self._macro_repetition = 0
+        self._macro_bytes_left = 0
+        self._command_bytes = b""
+        self._running = []  # Commands not acknowledged as done yet
+        self._output = b""
+
+    @property
+    def idle(self):
+        """True if there's nothing left to do."""
+        return not self.busy and not self._macro_bytes_left
+
+    def poll(self, data=b"", t=None):
+        """Run one iteration of the loop, for one poll from the Gamecube.
+
+        Args:
+            data: Bytes that arrived over serial since the last poll.
+            t: The time of the poll, for logging and timing commands.
+                Defaults to `n_polls * POLL_TIME`.
+
+        Returns:
+            The bytes the firmware writes back over serial.
+
+        """
+        self._time = self.n_polls * POLL_TIME if t is None else t
+        if len(data) > SERIAL_BUFFER_SIZE:
+            self.n_dropped_bytes += len(data) - SERIAL_BUFFER_SIZE
+            self._log("serial buffer full, dropped {} bytes".format(
+                len(data) - SERIAL_BUFFER_SIZE))
+            data = data[:SERIAL_BUFFER_SIZE]
+
+        if data:
+            for c in data:
+                self._process_byte(c)
+            self.state = self._peek()
+            self._i = 0
+        elif self._i % POLLS_PER_STATE == 0:
+            self.state = self._next()
+            if self._queue_empty() and self._macro_fill():
+                self.state = self._peek()
+            if self.busy and self._queue_empty():
+                self._done()
+
+        self._i += 1
+        self.n_polls += 1
+        output, self._output = self._output, b""
+        return output
+
+    def _log(self, message):
+        if self.log is not None:
+            self.log(self._time, message)
+
+    def _process_byte(self, c):
+        self._command_bytes += c
+        c = ord(c)
+        if self._macro_bytes_left:
+            if self._macro_bytes_left % 2 == 1:
+                step = ord(self._command_bytes[-2])
+                if len(self._macro) < MACRO_MAX_STEPS:
+                    self._macro.append((step >> 4, (step & 0xF) + 1, c or 1))
+            self._macro_bytes_left -= 1
+            if not self._macro_bytes_left:
+                self._command_received()
+            return
+
+        # Any new command replaces a macro that's still running
+        self._macro_clear()
+        if c >> 6 == 0x2:
+            self._queue_clear()
+            self._macro_bytes_left = 2 * (c & 0x3F)
+            if not self._macro_bytes_left:
+                self._command_received()
+        else:
+            if c >> 6 == 0x0:
+                self._puyo_move(c)
+            elif c >> 6 == 0x1:
+                self._single_button(c)
+            self._command_received()
+
+    def _command_received(self):
+        command = FirmwareCommand(self._command_bytes, self._time)
+        self._command_bytes = b""
+        for running in self._running:
+            running.overlapped = True
+        self._running.append(command)
+        self.commands.append(command)
+        self._log("received {}".format(command))
+        self._output += ACK_RECEIVED
+        self.busy = True
+
+    def _done(self):
+        for command in self._running:
+            command.done_time = self._time
+            self.execution_times.add(self._time - command.received_time)
+        self._log("done with {} command(s)".format(len(self._running)))
+        self._running = []
+        self._output += ACK_DONE
+        self.busy = False
+
+    def _puyo_move(self, c):
+        delta_x = ((c >> 3) & 0x7) - 2
+        rot = (c >> 1) & 0x3
+        down_fast = c & 0x1
+
+        self._queue_clear()
+        while True:
+            state = set()
+            if delta_x > 0:
+                state.add("right")
+                delta_x -= 1
+            elif delta_x < 0:
+                state.add("left")
+                delta_x += 1
+
+            if rot in (1, 2):
+                state.add("x")  # Rotate clockwise
+                rot -= 1
+            elif rot == 3:
+                state.add("a")  # Rotate anticlockwise
+                rot = 0
+
+            self._queue_push(frozenset(state), 1)
+            if delta_x == 0 and rot == 0:
+                break
+            self._queue_push(DEFAULT_STATE, 1)
+
+        if down_fast:
+            self._queue_push(frozenset(["down"]), 8)
+        self._queue_push(DEFAULT_STATE, 1)
+
+    def _single_button(self, c):
+        state = self._button_state((c >> 2) & 0xF)
+        for i in range((c & 0x3) + 1):
+            self._queue_push(state, 1)
+            self._queue_push(DEFAULT_STATE, 1)
+
+    def _button_state(self, button):
+        # The triggers aren't implemented by the firmware
+        if button in (0x7, 0x8) or button not in BUTTON_NAMES:
+            return DEFAULT_STATE
+        return frozenset([BUTTON_NAMES[button]])
+
+    def _queue_clear(self):
+        self._queue = []
+        self._pos = 0
+
+    def _queue_push(self, state, count):
+        if len(self._queue) >= STATE_QUEUE_MAX:
+            self.n_dropped_states += 1
+            self._log("state queue full, dropped a state")
+            return
+        self._queue.append([state, count])
+
+    def _queue_empty(self):
+        return self._pos >= len(self._queue)
+
+    def _peek(self):
+        if self._queue_empty():
+            return DEFAULT_STATE
+        return self._queue[self._pos][0]
+
+    def _next(self):
+        if self._queue_empty():
+            self._queue_clear()
+        else:
+            self._queue[self._pos][1] -= 1
+            if self._queue[self._pos][1] == 0:
+                self._pos += 1
+        return self._peek()
+
+    def _macro_clear(self):
+        self._macro = []
+        self._macro_pos = 0
+        self._macro_repetition = 0
+
+    def _macro_fill(self):
+        if self._macro_pos >= len(self._macro):
+            return False
+        button, repetitions, wait = self._macro[self._macro_pos]
+        self._queue_clear()
+        self._queue_push(self._button_state(button), 1)
+        self._queue_push(DEFAULT_STATE, wait)
+
+        self._macro_repetition += 1
+        if self._macro_repetition >= repetitions:
+            self._macro_pos += 1
+            self._macro_repetition = 0
+        return True
+
+
+class PtyArduino(object):
+    """Runs `Firmware` in real time behind a pseudo-terminal.
+
+    Open `device` like the Arduino's serial port. Bytes written to it are
+    handed to the firmware once per poll, and its acknowledgements can be
+    read back. Times given to the firmware are seconds since `start()`.
+
+    """
+
+    def __init__(self, firmware=None, poll_time=POLL_TIME):
+        self.firmware = Firmware() if firmware is None else firmware
+        self.poll_time = poll_time
+        self._master, self._slave = pty.openpty()
+        # No echo or line editing, like a serial port
+        tty.setraw(self._slave)
+        self.device = os.ttyname(self._slave)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="PtyArduino")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        """Stop the firmware and close the pseudo-terminal."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def _run(self):
+        start = time()
+        next_poll = start
+        while not self._stop.is_set():
+            delay = next_poll - time()
+            if delay > 0:
+                sleep(delay)
+
+            data = b""
+            while select.select([self._master], [], [], 0)[0]:
+                data += os.read(self._master, 1024)
+            output = self.firmware.poll(data, time() - start)
+            if output:
+                os.write(self._master, output)
+
+            # Don't try to catch up on polls missed while falling behind
+            next_poll = max(next_poll + self.poll_time,
+                            time() - self.poll_time)
@@ -0,0 +1,216 @@
+"""Benchmarking how long AIs take to decide on a move.
+
+Every AI in `puyo.AI_REGISTRY` is run over the same corpus of positions, made
+of boards from board recordings (see "tests/data/README.md") plus synthetic
+boards at various fill levels. The corpus is built deterministically, so
+results from different commits can be compared with `compare_results()`.
+
+"""
+from __future__ import division
+import os
+import random
+import pickle
+import subprocess
+from timeit import default_timer
+from collections import namedtuple
+
+import numpy
+
+import puyo
+from puyo.stats import LatencyHistogram
+from puyo.simulation import BEAN_COLORS, random_next_beans
+
+# Number of beans on the synthetic boards. Sampling stops filling a board
+# early if the spawn column gets too high, so the fullest boards have a few
+# less than this.
+SYNTHETIC_FILL_LEVELS = (0, 12, 24, 36, 48, 60)
+
+# Positions are grouped by this many beans for the per fill level summary.
+FILL_BUCKET_SIZE = 12
+
+# A position to benchmark.
+#
+# Items:
+#   board: A `Board`, including its next beans.
+#   beans: The current pair of beans, passed to `AI.get_move()`.
+#   source: Where the position came from, like "board_recording1.pickle" or
+#       "synthetic".
+Position = namedtuple("Position", "board beans source")
+
+
+def _at_rest(board):
+    """Return True if `board` could be a board between moves.
+
+    Recordings include frames where beans are falling or being eliminated.
+    Those are skipped, as well as boards where the spawn point is blocked.
+
+    """
+    filled = board.get_uint8_array() != ord(b' ')
+    if (filled[:,1:] & ~filled[:,:-1]).any():
+        return False
+    return not filled[2][11]
+
+def load_recording_positions(filename, max_positions=None):
+    """Return a list of `Position`s from a board recording.
+
+    Only distinct boards at rest with known next beans are used. The next
+    beans are also used as the current beans. If `max_positions` is given,
+    positions are evenly sampled from the recording to return at most that
+    many.
+
+    """
+    with open(filename, 'rb') as f:
+        data = pickle.load(f)
+
+    source = os.path.basename(filename)
+    positions = []
+    seen = set()
+    last_cells = None
+    last_next_beans = None
+    for cells, next_beans, t in data:
+        if cells is None:
+            cells = last_cells
+        if next_beans is None:
+            next_beans = last_next_beans
+        last_cells, last_next_beans = cells, next_beans
+        if next_beans is None:
+            continue
+
+        board = puyo.Board(cells, next_beans)
+        key = (board.get_array().tostring(), next_beans)
+        if key in seen or not _at_rest(board):
+            continue
+        seen.add(key)
+        positions.append(Position(board, next_beans, source))
+
+    if max_positions is not None and len(positions) > max_positions:
+        indexes = numpy.linspace(0, len(positions)-1, max_positions)
+        positions = [positions[int(round(i))] for i in indexes]
+    return positions
+
+def synthetic_board(n_beans, rng):
+    """Return a board with about `n_beans` beans dropped at random.
+
+    Beans are dropped one at a time, so groups of four are eliminated as they
+    would be in a game, and the board is always at rest.
+
+    """
+    board = puyo.Board(next_beans=random_next_beans(rng))
+    for i in range(n_beans * 4):  # Eliminations can undo some drops
+        if board.count() >= n_beans:
+            break
+        x = rng.randrange(6)
+        if board[x][10] != b' ' or (x == 2 and board[x][9] != b' '):
+            continue  # Keep the spawn point and the top row clear
+        board.drop_bean(x, rng.choice(BEAN_COLORS))
+    return board
+
+def synthetic_positions(n_per_level, seed=0, levels=SYNTHETIC_FILL_LEVELS):
+    rng = random.Random(seed)
+    positions = []
+    for n_beans in levels:
+        for i in range(n_per_level):
+            board = synthetic_board(n_beans, rng)
+            positions.append(Position(board, random_next_beans(rng),
+                                      "synthetic"))
+    return positions
+
+def benchmark_ai(ai, positions, repeat=1, seed=0):
+    """Time `ai.get_move()` on each position and return a result dict.
+
+    The global `random` module is seeded with `seed` first, so AIs that break
+    ties randomly do the same work every run. The returned dict has the
+    number of decisions timed, latency percentiles in milliseconds, decisions
+    per second, and the same percentiles for each fill level in "by_fill",
+    keyed by the lowest number of beans in the bucket.
+
+    """
+    random.seed(seed)
+    overall = LatencyHistogram(len(positions) * repeat)
+    by_fill = {}
+    total_time = 0.0
+    for i in range(repeat):
+        for position in positions:
+            board = position.board.copy()
+            start = default_timer()
+            ai.get_move(board, position.beans)
+            elapsed = default_timer() - start
+
+            total_time += elapsed
+            overall.add(elapsed)
+            bucket = position.board.count() // FILL_BUCKET_SIZE * \
+                     FILL_BUCKET_SIZE
+            if bucket not in by_fill:
+                by_fill[bucket] = LatencyHistogram(len(positions) * repeat)
+            by_fill[bucket].add(elapsed)
+
+    result = _histogram_result(overall)
+    result["moves_per_second"] = \
+        overall.count / total_time if total_time else 0.0
+    result["by_fill"] = dict((str(bucket), _histogram_result(histogram))
+                             for bucket, histogram in by_fill.items())
+    return result
+
+def _histogram_result(histogram):
+    p50, p95 = histogram.percentiles((50, 95))
+    return {
+        "n": histogram.count,
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "max_ms": histogram.max() * 1000,
+    }
+
+def git_commit():
+    """Return the current git commit hash, or None if it can't be found."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                       stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(ai_names, positions, repeat=1):
+    """Benchmark each AI in `ai_names` and return JSON serializable results."""
+    sources = sorted(set(p.source for p in positions))
+    return {
+        "commit": git_commit(),
+        "corpus": dict((source, sum(1 for p in positions if p.source == source))
+                       for source in sources),
+        "repeat": repeat,
+        "ais": dict((name, benchmark_ai(puyo.AI_REGISTRY[name](), positions,
+                                        repeat))
+                    for name in ai_names),
+    }
+
+def format_results(results):
+    lines = ["{:<16} {:>6} {:>9} {:>9} {:>9} {:>10}".format(
+             "ai", "n", "p50 ms", "p95 ms", "max ms", "moves/s")]
+    for name in sorted(results["ais"]):
+        r = results["ais"][name]
+        lines.append("{:<16} {:>6} {:>9.2f} {:>9.2f} {:>9.2f} {:>10.1f}".format(
+                     name, r["n"], r["p50_ms"], r["p95_ms"], r["max_ms"],
+                     r["moves_per_second"]))
+    return "\n".join(lines)
+
+def compare_results(old, new):
+    """Return a table of the change in each metric from `old` to `new`.
+
+    Only AIs in both results are compared. A warning is included if the
+    corpus differs, since the numbers aren't comparable then.
+
+    """
+    lines = []
+    if old["corpus"] != new["corpus"]:
+        lines.append("Warning: the corpus differs between results.")
+    lines.append("{:<16} {:<16} {:>10} {:>10} {:>8}".format(
+                 "ai", "metric", "old", "new", "change"))
+    for name in sorted(set(old["ais"]) & set(new["ais"])):
+        for metric in ("p50_ms", "p95_ms", "max_ms", "moves_per_second"):
+            old_value = old["ais"][name][metric]
+            new_value = new["ais"][name][metric]
+            if old_value:
+                change = "{:+.1%}".format((new_value - old_value) / old_value)
+            else:
+                change = "-"
+            lines.append("{:<16} {:<16} {:>10.2f} {:>10.2f} {:>8}".format(
+                         name, metric, old_value, new_value, change))
+    return "\n".join(lines)
@@ -2,6 +2,7 @@
 import os
 import random
 import itertools
+from time import time
 from collections import namedtuple
 import ctypes
 
@@ -19,6 +20,10 @@ VALID_CELLS = (
     b'k',  # Black
 )
 
+# Colors of the beans that are dropped in pairs, in the order colors are
+# renamed to by `Board.canonicalize()`
+BEAN_COLORS = (b'r', b'g', b'b', b'y', b'p')
+
 # Colors that are drawn for each bean in the `draw()` method
 CELL_COLORS = {
     b' ': (255, 255, 255),
@@ -37,6 +42,34 @@ GROUP_BONUS_TABLE = (0, 0, 0, 0, 0, 2, 3, 4, 5, 6, 7, 10)
 
 Combo = namedtuple("Combo", "score n_beans length game_over")
 
+# One step of a chain, yielded by `Board.resolve_chain()`.
+#
+# Items:
+#   length: Number of steps so far, including this one.
+#   n_beans: Number of beans eliminated in this step, not counting nuisance.
+#   n_colors: Number of different colors eliminated in this step.
+#   group_bonus: Sum of the group bonuses of each group eliminated.
+#   score: Points scored by this step.
+#   total_score: Points scored by this step and all of the previous ones.
+#   board: The board itself, after this step's beans were eliminated and the
+#       rest fell. It's not a copy, so it changes as the chain goes on.
+ChainStep = namedtuple("ChainStep", "length n_beans n_colors group_bonus "
+                                    "score total_score board")
+
+# A way to set off a chain by adding beans, found by
+# `Board.find_chain_seed()`.
+#
+# Items:
+#   placements: A tuple of `(x, color)` tuples, the beans to drop in order.
+#       The last one sets off the chain.
+#   length: Length of the chain that's set off.
+#   score: Points scored by the chain.
+ChainSeed = namedtuple("ChainSeed", "placements length score")
+
+
+class _OutOfTime(Exception):
+    pass
+
 
 libpuyo = None
 ctypes_loaded = False
@@ -158,8 +191,86 @@ class Board(object):
     def get_array(self):
         return self._cells[:]
 
+    def get_uint8_array(self):
+        """Return the cells as a (6, 12) uint8 array of ASCII codes.
+
+        This is a view, not a copy, so it is cheap to get, but modifying it
+        modifies the board. Comparing against `ord(b'r')` and so on is much
+        faster than comparing the strings returned by `get_array()`.
+
+        """
+        return self._cells.view(numpy.uint8)
+
     def copy(self):
-        return Board(self._cells, self.next_beans)
+        # The cells are already known to be valid, so skip the validation
+        # done by `__init__()`. AIs copy the board for every move they try.
+        board = Board.__new__(Board)
+        board._cells = self._cells.copy()
+        board.next_beans = self.next_beans
+        board.c_accelerated = self.c_accelerated
+        return board
+
+    def canonicalize(self, beans=None):
+        """Return the board with its colors renamed to a canonical order.
+
+        Colors are interchangeable, so boards that only differ by which color
+        is which have the same future. They all have the same canonical form,
+        which makes it a good key for caches and opening books.
+
+        Colors are renamed in the order they first appear in `beans`, then
+        `next_beans`, then the cells (column by column, bottom up). The first
+        becomes b'r', the second b'g' and so on, in `BEAN_COLORS` order.
+        Nuisance beans are left alone.
+
+        Moves mean the same thing on the canonical board, and give the same
+        `Combo`, so they don't need to be converted back. Boards and beans
+        can be converted back with `relabel()` and the returned mapping.
+
+        Args:
+            beans: The pair of beans about to be dropped, if any.
+
+        Returns:
+            A tuple `(board, beans, mapping)`. `board` is a new, canonical
+            board, including its `next_beans`. `beans` is `beans` renamed the
+            same way, or None. `mapping` is a dict from each canonical color
+            to the original color.
+
+        """
+        order = []
+        for bean in tuple(beans or ()) + tuple(self.next_beans or ()):
+            if bean not in order:
+                order.append(bean)
+        cells = self.get_uint8_array().ravel()
+        values, first_indexes = numpy.unique(cells, return_index=True)
+        for i in numpy.argsort(first_indexes):
+            bean = chr(values[i])
+            if bean in BEAN_COLORS and bean not in order:
+                order.append(bean)
+
+        mapping = dict(zip(BEAN_COLORS, order))
+        inverse = dict((original, canonical)
+                       for canonical, original in mapping.items())
+        board = self.relabel(inverse)
+        if beans is not None:
+            beans = tuple(inverse[bean] for bean in beans)
+        return board, beans, mapping
+
+    def relabel(self, mapping):
+        """Return a copy of the board with colors renamed by `mapping`.
+
+        `mapping` is a dict from old colors to new colors. Colors that aren't
+        in it stay the same. The next beans are renamed too.
+
+        """
+        table = numpy.arange(256, dtype=numpy.uint8)
+        for old, new in mapping.items():
+            table[ord(old)] = ord(new)
+        board = self.copy()
+        board._cells = table[self.get_uint8_array()].view("|S1")
+        if self.next_beans is not None:
+            board.next_beans = tuple(mapping.get(bean, bean)
+                                     for bean in self.next_beans)
+        return board
 
     def count(self, color=None):
         """
@@ -218,16 +329,44 @@ class Board(object):
 
         A Combo object is returned.
 
+        """
+        total_score = 0
+        total_n_beans = 0
+        length = 0
+        for step in self.iter_drop_beans(xs, colors):
+            total_score = step.total_score
+            total_n_beans += step.n_beans
+            length = step.length
+        return Combo(total_score, total_n_beans, length, False)
+
+    def iter_drop_beans(self, xs, colors):
+        """Like `drop_beans()`, but return an iterator over the chain.
+
+        The beans are dropped right away, then the chain is resolved one step
+        at a time as the returned iterator is advanced. See
+        `resolve_chain()`.
+
         """
         for x, color in zip(xs, colors):
             self._drop(x, color)
+        return self.resolve_chain()
 
-        total_score = 0
-        total_n_beans = 0
-        for i in itertools.count():
+    def resolve_chain(self, length=0, total_score=0):
+        """Eliminate beans and apply gravity until nothing is left to
+        eliminate, yielding a `ChainStep` after each step.
+
+        The caller can stop iterating at any point, for example when the
+        score is already high enough, or when the chain can no longer get
+        there. The board is then left as it was after the last step that was
+        yielded, with the rest of the chain unresolved. To resolve the rest,
+        call this again with the `length` and `total_score` of that step, so
+        the chain power and scores carry on from it.
+
+        """
+        for i in itertools.count(length):
             n_beans, n_colors, group_bonus = self._eliminate_beans()
             if n_beans == 0:
-                break
+                return
 
             self._do_gravity()
 
@@ -243,9 +382,75 @@ class Board(object):
             score = 10 * n_beans * multiplier
 
             total_score += score
-            total_n_beans += n_beans
+            yield ChainStep(i + 1, n_beans, n_colors, group_bonus, score,
+                            total_score, self)
 
-        return Combo(total_score, total_n_beans, i, False)
+    def find_chain_seed(self, max_beans=2, time_limit=None):
+        """Find the longest chain that adding up to `max_beans` beans sets
+        off.
+
+        Beans are added one at a time to the top of any column, in any
+        color. To keep the search small, only beans that land next to a bean
+        of the same color are tried, since any other bean can't be part of a
+        group. Filler beans, added only to raise a column, aren't found.
+        Boards reached by adding the same beans in a different order are only
+        searched once.
+
+        The search is done for 1 bean, then 2, and so on, so if `time_limit`
+        (in seconds) runs out, the best seed found with fewer beans is
+        still returned.
+
+        Returns:
+            The `ChainSeed` with the longest chain, breaking ties by score
+            then by the number of beans, or None if no chain can be set off.
+
+        """
+        deadline = None if time_limit is None else time() + time_limit
+        empty = ord(b' ')
+        bean_colors = frozenset(ord(color) for color in BEAN_COLORS)
+        best = [None]
+        visited = set()
+
+        def search(board, placements, depth):
+            cells = board.get_uint8_array()
+            heights = (cells != empty).sum(axis=1)
+            for x in range(6):
+                y = heights[x]
+                if y >= 12 or (x == 2 and y == 11):
+                    continue
+                neighbors = set()
+                if x > 0:
+                    neighbors.add(cells[x-1, y])
+                if x < 5:
+                    neighbors.add(cells[x+1, y])
+                if y > 0:
+                    neighbors.add(cells[x, y-1])
+                for color in neighbors & bean_colors:
+                    if deadline is not None and time() > deadline:
+                        raise _OutOfTime()
+                    color = chr(color)
+                    tmp_board = board.copy()
+                    combo = tmp_board.drop_bean(x, color)
+                    tmp_placements = placements + ((x, color),)
+                    if combo.length:
+                        seed = best[0]
+                        if seed is None or (combo.length, combo.score) > \
+                                           (seed.length, seed.score):
+                            best[0] = ChainSeed(tmp_placements, combo.length,
+                                                combo.score)
+                    elif depth > 1:
+                        key = tmp_board.get_uint8_array().tostring()
+                        if key not in visited:
+                            visited.add(key)
+                            search(tmp_board, tmp_placements, depth - 1)
+
+        try:
+            for n_beans in range(1, max_beans + 1):
+                visited.clear()
+                search(self, (), n_beans)
+        except _OutOfTime:
+            pass
+        return best[0]
 
     def drop_bean(self, x, color):
         """Shortcut for `drop_beans([x], [color])`."""
@@ -0,0 +1,123 @@
+"""Finding where the game is in the video frame.
+
+Capture cards don't all put the game at the same place in the frame, so the
+screen offset passed to `BeanFinder` depends on the video setup. Instead of
+hardcoding it, `find_screen_offset()` locates the "NEXT" label above the next
+beans, which is always on screen during a match, and works out the offset
+from there. The result is saved to a calibration file so it only has to be
+found once per setup.
+
+"""
+
+import os
+import json
+
+import cv2
+
+from puyo.beanfinder import TEMPLATE_DIR, get_template
+
+# Screen offset of the video setup the game was originally developed with.
+DEFAULT_SCREEN_OFFSET = (38, 13)
+
+DEFAULT_CALIBRATION_FILE = os.path.expanduser("~/.puyo_calibration.json")
+
+NEXT_LABEL_TEMPLATE_FILENAME = os.path.join(TEMPLATE_DIR, "next_label.png")
+
+# Upper left of the "NEXT" label relative to the screen offset.
+NEXT_LABEL_OFFSET = (284, 33)
+
+# The coarse search is done on images downsampled this many times by
+# `cv2.pyrDown`, which halves each dimension.
+COARSE_LEVELS = 2
+COARSE_THRESHOLD = 0.7
+FINE_THRESHOLD = 0.9
+FINE_SEARCH_MARGIN = 8
+
+
+def find_screen_offset(img):
+    """Return the screen offset of the game in `img` as an (x, y) tuple.
+
+    A coarse search over a downsampled copy of `img` finds the approximate
+    location of the "NEXT" label, then a full resolution search in a small
+    window around it finds the exact location. A `ValueError` is raised if the
+    label can't be found, for example if `img` isn't showing a match.
+
+    """
+    template = get_template(NEXT_LABEL_TEMPLATE_FILENAME)
+
+    coarse_img = img
+    coarse_template = template
+    for i in range(COARSE_LEVELS):
+        coarse_img = cv2.pyrDown(coarse_img)
+        coarse_template = cv2.pyrDown(coarse_template)
+    match_img = cv2.matchTemplate(coarse_img, coarse_template,
+                                  cv2.TM_CCOEFF_NORMED)
+    _, max_value, _, max_loc = cv2.minMaxLoc(match_img)
+    if max_value < COARSE_THRESHOLD:
+        raise ValueError("Could not find the game board in the image")
+
+    scale = 2**COARSE_LEVELS
+    h, w = template.shape[:2]
+    x_start = max(0, max_loc[0]*scale - FINE_SEARCH_MARGIN)
+    y_start = max(0, max_loc[1]*scale - FINE_SEARCH_MARGIN)
+    x_end = x_start + w + 2*FINE_SEARCH_MARGIN + scale
+    y_end = y_start + h + 2*FINE_SEARCH_MARGIN + scale
+    match_img = cv2.matchTemplate(img[y_start:y_end, x_start:x_end],
+                                  template, cv2.TM_CCOEFF_NORMED)
+    _, max_value, _, max_loc = cv2.minMaxLoc(match_img)
+    if max_value < FINE_THRESHOLD:
+        raise ValueError("Could not find the game board in the image")
+
+    return (
+        x_start + max_loc[0] - NEXT_LABEL_OFFSET[0],
+        y_start + max_loc[1] - NEXT_LABEL_OFFSET[1],
+    )
+
+
+def load_screen_offset(filename=DEFAULT_CALIBRATION_FILE):
+    """Return the screen offset saved in `filename`, or None if not saved."""
+    try:
+        with open(filename) as f:
+            data = json.load(f)
+    except IOError:
+        return None
+    return tuple(data["screen_offset"])
+
+
+def save_screen_offset(offset, filename=DEFAULT_CALIBRATION_FILE):
+    with open(filename, "w") as f:
+        json.dump({"screen_offset": list(offset)}, f)
+
+
+def calibrate(capture, filename=DEFAULT_CALIBRATION_FILE, recalibrate=False,
+              max_frames=250):
+    """Return the screen offset, calibrating from `capture` if needed.
+
+    If `filename` holds a saved calibration and `recalibrate` is False, it is
+    used without looking at the video. Otherwise frames are read from
+    `capture`, a `LatestFrameCapture`, until the board is found, and the
+    result is saved to `filename`.
+
+    If the board isn't found within `max_frames` frames, a warning is printed
+    and `DEFAULT_SCREEN_OFFSET` is returned without saving anything.
+
+    """
+    if not recalibrate:
+        offset = load_screen_offset(filename)
+        if offset is not None:
+            return offset
+
+    for i in range(max_frames):
+        frame = capture.read_frame()
+        if frame is None:
+            break
+        try:
+            offset = find_screen_offset(frame.img)
+        except ValueError:
+            continue
+        save_screen_offset(offset, filename)
+        return offset
+
+    print 'Warning: Could not find the game board to calibrate the screen ' \
+          'offset. Using the default of {}.'.format(DEFAULT_SCREEN_OFFSET)
+    return DEFAULT_SCREEN_OFFSET
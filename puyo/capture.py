@@ -0,0 +1,158 @@
+"""Video capture that always hands out the most recent frame.
+
+OpenCV buffers frames from capture devices, so reading one frame per loop
+iteration falls further and further behind the game whenever processing is
+slower than the video. `LatestFrameCapture` reads frames on its own thread and
+only keeps the newest one.
+
+"""
+
+import threading
+from time import time
+from collections import namedtuple
+
+import cv2
+
+
+# A single captured frame.
+#
+# Items:
+#   img: The image, as returned by `cv2.VideoCapture.read()`.
+#   timestamp: Value of `time.time()` right after the frame was read.
+#   index: Number of frames captured before this one.
+Frame = namedtuple("Frame", "img timestamp index")
+
+
+def open_video(source):
+    """Open `source` with `cv2.VideoCapture`, or return None on failure.
+
+    If `source` is a string that looks like an integer, it is also tried as a
+    camera index.
+
+    """
+    video = cv2.VideoCapture(source)
+
+    if not video.isOpened():
+        try:
+            integer = int(source)
+        except ValueError:
+            pass
+        else:
+            video = cv2.VideoCapture(integer)
+
+    if not video.isOpened():
+        return None
+    return video
+
+
+class LatestFrameCapture(object):
+    """Reads a video source on a background thread.
+
+    Only the newest frame is kept. Frames that are replaced before anyone
+    reads them are counted in `n_dropped`.
+
+    """
+
+    def __init__(self, source, drop_frames=True):
+        """
+        Args:
+            source: Either an OpenCV video object opened with
+                `cv2.VideoCapture`, or anything `open_video()` accepts.
+            drop_frames: If False, the capture thread waits for each frame to
+                be read before reading the next one. Use this for video files,
+                where dropping frames just skips parts of the recording.
+        """
+        if isinstance(source, (int, basestring)):
+            video = open_video(source)
+            if not video:
+                raise RuntimeError('Could not open video stream "{}"'.format(source))
+        else:
+            video = source
+        self.video = video
+        self.drop_frames = drop_frames
+
+        self.n_captured = 0
+        self.n_dropped = 0
+
+        self._condition = threading.Condition()
+        self._frame = None  # Newest frame
+        self._frame_is_new = False  # Has `_frame` been returned by `read_frame`?
+        self._finished = False
+        self._thread = threading.Thread(target=self._run,
+                                        name="LatestFrameCapture")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            was_read, img = self.video.read()
+            timestamp = time()
+
+            with self._condition:
+                if self._finished:
+                    break
+                if not was_read:
+                    self._finished = True
+                    self._condition.notify_all()
+                    break
+
+                if not self.drop_frames:
+                    while self._frame_is_new and not self._finished:
+                        self._condition.wait(0.1)
+                elif self._frame_is_new:
+                    self.n_dropped += 1
+
+                self._frame = Frame(img, timestamp, self.n_captured)
+                self._frame_is_new = True
+                self.n_captured += 1
+                self._condition.notify_all()
+
+    def read_frame(self, block=True, timeout=None):
+        """Return the newest frame that hasn't been returned yet.
+
+        Frames older than the newest one are never returned. If every captured
+        frame has already been returned, wait for the next one if `block` is
+        True, otherwise return None immediately. None is also returned after
+        the source runs out of frames, or when `timeout` (in seconds) runs out.
+
+        """
+        with self._condition:
+            if block:
+                deadline = None if timeout is None else time() + timeout
+                while not self._frame_is_new and not self._finished:
+                    remaining = 0.1 if deadline is None else deadline - time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(min(remaining, 0.1))
+
+            if not self._frame_is_new:
+                return None
+            self._frame_is_new = False
+            self._condition.notify_all()
+            return self._frame
+
+    def read(self):
+        """Same as `cv2.VideoCapture.read()`, but see `read_frame()`."""
+        frame = self.read_frame()
+        if frame is None:
+            return False, None
+        return True, frame.img
+
+    @property
+    def finished(self):
+        """True once the source is out of frames and the last one was read."""
+        with self._condition:
+            return self._finished and not self._frame_is_new
+
+    def latest(self):
+        """Return the newest frame without waiting, even if already returned."""
+        with self._condition:
+            return self._frame
+
+    def release(self):
+        """Stop the capture thread and release the video source."""
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.video.release()
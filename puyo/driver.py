@@ -1,10 +1,15 @@
 
-from time import time
+from time import time, sleep
 from collections import deque
+import threading
+import Queue
 
 import cv2
 
 import puyo
+from puyo.capture import LatestFrameCapture
+from puyo.gccontrol import ControllerCommand
+from puyo.stats import StageStats, LatencyTracker, LatestQueue
 
 
 PASSWORD_TOKEN_ORDER = (
@@ -22,29 +27,156 @@ PASSWORDS = {
     12: "ggny",
 }
 
-def _open_video(source):
-    video = cv2.VideoCapture(source)
+DRIVER_STAGES = ("vision", "ai", "controller")
 
-    if not video.isOpened():
-        try:
-            integer = int(source)
-        except ValueError:
-            pass
-        else:
-            video = cv2.VideoCapture(integer)
+# Points in the processing of a frame where latency since capture is
+# measured:
+#   vision: The frame has been recognized.
+#   new_move: A new move seen in the frame has been handed to the AI.
+#   ai: The AI has decided on a move.
+#   command: The move has been written to the controller. With controllers
+#       that send from their own thread, like `AsyncGamecubeController`,
+#       this is recorded once the move is done, from when it was written.
+#   done: The controller has finished making the move. Only measured with
+#       controllers that report it, like `AsyncGamecubeController`.
+LATENCY_EVENTS = ("vision", "new_move", "ai", "command", "done")
+
+class ButtonSequencer(object):
+    """Presses buttons in order from a background thread.
+
+    Each press is followed by its own delay before the next one is pressed.
+    Delays are timed from when the press was sent, with `sleep()` instead of
+    being checked once per video frame, so a sequence takes the same time no
+    matter how fast frames are processed, and frames keep being processed
+    while it runs.
+
+    Whole sequences can also be queued as macros, which are handed to the
+    controller at once with `Controller.run_macro()`.
+
+    """
 
-    if not video.isOpened():
-        return None
-    return video
+    # Longest single sleep, so `stop()` doesn't wait for a whole delay.
+    MAX_SLEEP = 0.05
+
+    def __init__(self, press, run_macro):
+        """
+        Args:
+            press: Function called with each button to press it.
+            run_macro: Function called with each macro to run it. It returns
+                how long the macro keeps running after it returns, like
+                `Controller.run_macro()`.
+        """
+        self.press = press
+        self.run_macro = run_macro
+        self.last_press_time = None
+        self._queue = deque()
+        self._pressing = False
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run,
+                                        name="Driver-buttons")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def busy(self):
+        """True while presses are queued, or the last delay isn't over."""
+        with self._condition:
+            return bool(self._queue) or self._pressing
+
+    def put(self, button, delay_after):
+        self._put((button, delay_after))
+
+    def put_macro(self, presses):
+        """Queue a list of `(button, delay_after)` presses to be run as one
+        macro."""
+        self._put((list(presses), None))
+
+    def _put(self, item):
+        with self._condition:
+            self._queue.append(item)
+            self._condition.notify_all()
+
+    def clear(self):
+        """Forget presses that haven't been started."""
+        with self._condition:
+            self._queue.clear()
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """Wait until not `busy`. Return False if `timeout` ran out first."""
+        deadline = None if timeout is None else time() + timeout
+        with self._condition:
+            while self._queue or self._pressing:
+                if deadline is None:
+                    self._condition.wait()
+                else:
+                    remaining = deadline - time()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+        return True
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._queue.clear()
+            self._condition.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                button, delay_after = self._queue.popleft()
+                self._pressing = True
+
+            if delay_after is None:
+                delay_after = self.run_macro(button)
+            else:
+                self.press(button)
+            self.last_press_time = sent = time()
+            while not self._stopped:
+                remaining = sent + delay_after - time()
+                if remaining <= 0:
+                    break
+                sleep(min(remaining, self.MAX_SLEEP))
+
+            with self._condition:
+                self._pressing = False
+                self._condition.notify_all()
 
 
 class Driver(object):
     """
     Coordinates between `Controller`, `AI`, and `Vision` classes to play a game
     of Puyo Puyo.
+
+    By default everything happens in one thread: each frame goes through
+    vision, then the AI, then the controller before the next frame is read.
+    In pipelined mode, each of those stages runs in its own thread, connected
+    by queues that only hold the most recent item. Stale items are dropped
+    instead of making later stages fall behind. Either way, the time taken by
+    each stage is recorded in `stats`, and the latency from frame capture to
+    each of `LATENCY_EVENTS` is recorded in `latency`.
+
+    Button presses for menus, queued with `queue_button_press()`, are made by
+    a `ButtonSequencer` on its own thread with their own timing. Vision keeps
+    running while they're made, but no moves are made until they're done.
+
+    With `skip_frames`, most frames are skipped while the board is animating
+    after a move, until shortly before it's predicted to settle. See
+    `Vision.predict_move()`.
+
+    Controllers that return a `ControllerCommand` for each move, like
+    `AsyncGamecubeController`, report when the move is finished, and
+    `wait_for_move()` can wait for it.
     """
 
-    def __init__(self, controller, ai=puyo.DEFAULT_AI_NAME, player=1, vision_cls=puyo.Vision, debug=False):
+    def __init__(self, controller, ai=puyo.DEFAULT_AI_NAME, player=1, vision_cls=puyo.Vision, debug=False, pipelined=False, screen_offset=None, field=None, skip_frames=False, clock=time):
         """
         Args:
             controller: Instance of the `Controller` class to use to control
@@ -57,6 +189,20 @@ class Driver(object):
             vision_cls: Either the `Vision` class or a subclass. Instantiated
                 and used to recognize game state.
             debug: If True then show video, debug windows, and print info.
+            pipelined: If True, run vision, the AI and the controller
+                concurrently in separate threads. Otherwise (default) do
+                everything in one thread, which is easier to debug.
+            screen_offset: Where the game is in the video frame, passed on to
+                `vision_cls`. Defaults to `DEFAULT_SCREEN_OFFSET`. See
+                `puyo.calibration`.
+            field: Which field of the interlaced video to recognize, passed
+                on to `vision_cls`. See `BeanFinder`.
+            skip_frames: If True, skip recognizing most frames while the
+                board is animating after each move.
+            clock: Function returning the current time, used to time each
+                stage and as the default frame timestamp. Defaults to
+                `time.time()`. Frame timestamps must come from the same
+                clock.
         """
         self.controller = controller
         if isinstance(ai, basestring):
@@ -64,21 +210,42 @@ class Driver(object):
         else:
             self.ai = ai
         self.player = player
+        self.screen_offset = screen_offset
+        self.field = field
         self.vision_cls = vision_cls
         self.vision = self._get_vision_instance()
         self.debug = debug
+        self.pipelined = pipelined
+        self.skip_frames = skip_frames
+        self.clock = clock
+        self.n_skipped_frames = 0
+        # Frames read and dropped by the capture thread in the last `run()`
+        self.n_captured_frames = 0
+        self.n_dropped_frames = 0
 
         self.last_state = None
+        self.last_special_state = None
+        self.last_move_command = None
+        self.stats = dict((name, StageStats(name)) for name in DRIVER_STAGES)
+        self.latency = LatencyTracker(LATENCY_EVENTS)
+
+        # Only one thread may talk to the controller at a time
+        self._controller_lock = threading.Lock()
+        self.buttons = ButtonSequencer(self._press_button, self._run_macro)
 
-        self.button_queue = deque()
-        self.button_next_press_time = float("-inf")
+    def close(self):
+        """Stop the thread pressing buttons. Call this when done with the
+        `Driver`. The controller isn't closed, since it belongs to the
+        caller."""
+        self.buttons.stop()
 
     def run(self, video, video_out=None, on_special_state=None):
         """Play the game using the given video source.
 
         Args:
-            video: Either an OpenCV video object open with `cv2.VideoCapture`,
-                or a string that can be passed to `cv2.VideoCapture`.
+            video: A `LatestFrameCapture`, an OpenCV video object open with
+                `cv2.VideoCapture`, or a string that can be passed to
+                `cv2.VideoCapture`.
             video_out: Filename of AVI file to record video.
             on_special_state: What to do when the game is won or lost. Choices:
                 "exit", None (just keep playing). (Default: None)
@@ -91,89 +258,243 @@ class Driver(object):
             cv2.namedWindow("Frame")
             cv2.namedWindow("Grid")
 
-        if isinstance(video, (int, basestring)):
-            video_name = video
-            video = _open_video(video)
-            if not video:
-                raise RuntimeError('Could not open video stream "{}"'.format(video_name))
+        # Frames are read on a separate thread so we always process the most
+        # recent one, instead of lagging behind the game.
+        if isinstance(video, LatestFrameCapture):
+            capture = video
+        else:
+            capture = LatestFrameCapture(video)
+
+        self.last_special_state = None
+        if self.pipelined:
+            self._start_pipeline(capture)
 
         video_writer = None
+        state = None
+        last_frame_index = None
         while True:
 
-            was_read, img = video.read()
-
-            #TODO: This is a "temporary" hacky solution for a video delay
-            #      issue. I think the issue happens because of how OpenCV
-            #      captures frames in a circular buffer, returning the next
-            #      frame instead of the most recent one, causing the video to
-            #      lag behind the actual game. This can be fixed by making the
-            #      code a lot faster, but that's not always going to work.
-            #      Getting 3 frames each loop iteration solves the issue, but
-            #      of course skips some frames.
-            was_read, img = video.read()
-            was_read, img = video.read()
-
-            if not was_read:
-                print("Error: Could not read video frame!")
-                break
+            if self.pipelined:
+                frame = capture.latest()
+                if frame is not None and frame.index == last_frame_index:
+                    sleep(0.005)
+                    frame = None
+                if frame is None and capture.finished:
+                    print("Error: Could not read video frame!")
+                    break
+                if frame is not None:
+                    state = self.last_state
+                # The vision thread may have moved past a special state
+                # before we got to see it.
+                special_state = self._take_special_state()
+                if special_state is not None:
+                    state = special_state
+            else:
+                frame = capture.read_frame()
+                if frame is None:
+                    print("Error: Could not read video frame!")
+                    break
+                state = self.step(frame.img, frame.timestamp)
 
-            if self.debug:
-                cv2.imshow("Frame", img)
+            if frame is not None:
+                img = frame.img
+                last_frame_index = frame.index
 
-            state = self.step(img)
-            if on_special_state == "exit" and state is not None and state.special_state != "unknown":
-                return state
+                if self.debug:
+                    cv2.imshow("Frame", img)
+                    if state:
+                        cv2.imshow("Grid", state.board.draw())
 
-            if self.debug and state:
-                cv2.imshow("Grid", state.board.draw())
+                if video_out:
+                    if video_writer is None:
+                        fourcc = cv2.cv.CV_FOURCC(*"I420")
+                        video_writer = cv2.VideoWriter(video_out, fourcc, 25,
+                                                (img.shape[1], img.shape[0]), True)
+                    video_writer.write(img)
 
-            if video_out:
-                if video_writer is None:
-                    fourcc = cv2.cv.CV_FOURCC(*"I420")
-                    video_writer = cv2.VideoWriter(video_out, fourcc, 25,
-                                            (img.shape[1], img.shape[0]), True)
-                video_writer.write(img)
+            if on_special_state == "exit" and state is not None and state.special_state != "unknown":
+                break
 
             if self.debug:
                 key = cv2.waitKey(10) % 256
                 if key == 27:  # Escape
                     break
 
+        if self.pipelined:
+            self._stop_pipeline()
         if video_writer is not None:
             video_writer.release()
+        if capture is not video:
+            capture.release()
+        self.n_captured_frames = capture.n_captured
+        self.n_dropped_frames = capture.n_dropped
+        if self.debug:
+            self.print_stats()
+            self.latency.dump()
 
         return state
 
-    def step(self, img):
+    def step(self, img, timestamp=None):
         """Process the given image and take action if necessary.
 
+        `timestamp` is when `img` was captured, as given by `clock`. Defaults
+        to now.
+
         TODO: Return value?
 
         """
+        if timestamp is None:
+            timestamp = self.clock()
 
-        if self.button_queue:
-            self._handle_button_queue()
+        if not self._wants_frame(timestamp):
             return None
-        else:
-            return self._step_normal(img)
+        state = self._vision_stage(img, timestamp)
+        if state.new_move and not self.buttons.busy:
+            move = self._ai_stage(state, timestamp)
+            self._controller_stage(move, timestamp)
+        return state
+
+    def _wants_frame(self, timestamp):
+        if self.skip_frames and not self.vision.wants_frame(timestamp):
+            self.n_skipped_frames += 1
+            return False
+        return True
 
-    def _step_normal(self, img):
+    def _vision_stage(self, img, timestamp):
+        start = self.clock()
         state = self.vision.get_state(img)
 
-        if state.special_state != "unknown":
+        # While buttons are being pressed, the screen may still show the
+        # special state they were pressed for.
+        if state.special_state != "unknown" and not self.buttons.busy:
 
             self._handle_special_state(state.special_state)
-            self.vision = self._get_vision_instance()
-
-        if state.new_move:
-            pos, rot = self.ai.get_move(state.board.copy(), state.current_beans)
-            self.controller.puyo_move(pos, rot)
-            if self.debug:
-                print "Moving pos={} rot={}".format(pos, rot)
+            self.vision.reset()
+            self.last_special_state = state
 
         self.last_state = state
+        end = self.clock()
+        self.stats["vision"].record(start, end, timestamp)
+        self.latency.record("vision", timestamp, end)
+        return state
+
+    def _ai_stage(self, state, timestamp):
+        start = self.clock()
+        self.latency.record("new_move", timestamp, start)
+        move = self.ai.get_move(state.board.copy(), state.current_beans)
+        if self.skip_frames:
+            self.vision.predict_move(state.board, state.current_beans, move,
+                                     timestamp)
+        end = self.clock()
+        self.stats["ai"].record(start, end, timestamp)
+        self.latency.record("ai", timestamp, end)
+        return move
+
+    def _controller_stage(self, move, timestamp):
+        start = self.clock()
+        pos, rot = move
+        with self._controller_lock:
+            command = self.controller.puyo_move(pos, rot)
+        end = self.clock()
+        if isinstance(command, ControllerCommand):
+            # Sent later, from the controller's own thread, so when it was
+            # written is only known once it's done.
+            self.last_move_command = command
+            command.add_done_callback(
+                lambda command: self._move_done(command, timestamp))
+        else:
+            sent = self.controller.last_command_time
+            self.latency.record("command", timestamp,
+                                end if sent is None else sent)
+        if self.debug:
+            print "Moving pos={} rot={}".format(pos, rot)
+        self.stats["controller"].record(start, end, timestamp)
+
+    def _move_done(self, command, timestamp):
+        if command.sent_time is not None:
+            self.latency.record("command", timestamp, command.sent_time)
+        if not command.failed:
+            self.latency.record("done", timestamp, command.done_time)
+
+    def wait_for_move(self, timeout=None):
+        """Wait until the controller has finished the last move.
+
+        Returns True once it's finished, or False if `timeout` seconds pass
+        first. Returns None if the controller doesn't report when moves are
+        finished, or no move has been made.
+
+        """
+        if self.last_move_command is None:
+            return None
+        return self.last_move_command.wait(timeout)
+
+    def _take_special_state(self):
+        """Return the last special state seen by the vision stage, or None
+        if there hasn't been one since the last call."""
+        state = self.last_special_state
+        self.last_special_state = None
         return state
 
+    def _start_pipeline(self, capture):
+        self._pipeline_stop = threading.Event()
+        self._ai_queue = LatestQueue()
+        self._controller_queue = LatestQueue()
+        self._pipeline_threads = [
+            threading.Thread(target=target, args=args, name=name)
+            for target, args, name in (
+                (self._vision_worker, (capture,), "Driver-vision"),
+                (self._ai_worker, (), "Driver-ai"),
+                (self._controller_worker, (), "Driver-controller"),
+            )
+        ]
+        for thread in self._pipeline_threads:
+            thread.daemon = True
+            thread.start()
+
+    def _stop_pipeline(self):
+        self._pipeline_stop.set()
+        for thread in self._pipeline_threads:
+            thread.join()
+
+    def _vision_worker(self, capture):
+        while not self._pipeline_stop.is_set():
+            frame = capture.read_frame(timeout=0.1)
+            if frame is None or not self._wants_frame(frame.timestamp):
+                continue
+            state = self._vision_stage(frame.img, frame.timestamp)
+            if state.new_move and not self.buttons.busy:
+                self._ai_queue.put_latest((state, frame.timestamp))
+
+    def _ai_worker(self):
+        while not self._pipeline_stop.is_set():
+            try:
+                state, timestamp = self._ai_queue.get(timeout=0.1)
+            except Queue.Empty:
+                continue
+            move = self._ai_stage(state, timestamp)
+            self._controller_queue.put_latest((move, timestamp))
+
+    def _controller_worker(self):
+        while not self._pipeline_stop.is_set():
+            try:
+                move, timestamp = self._controller_queue.get(timeout=0.01)
+            except Queue.Empty:
+                continue
+            self._controller_stage(move, timestamp)
+
+    def print_stats(self):
+        """Print throughput and latency of each stage."""
+        for name in DRIVER_STAGES:
+            print self.stats[name].summary()
+        print "Frames dropped: {} of {}".format(self.n_dropped_frames,
+                                                self.n_captured_frames)
+        if self.skip_frames:
+            print "Skipped {} frames while the board was animating".format(
+                self.n_skipped_frames)
+        if self.pipelined:
+            print "Dropped: {} AI inputs, {} controller inputs".format(
+                self._ai_queue.n_dropped, self._controller_queue.n_dropped)
+
     def _handle_special_state(self, state):
 
         if state == "scenario_won":
@@ -189,19 +510,33 @@ class Driver(object):
             raise ValueError("Unknown special state")
 
     def queue_button_press(self, button, delay_after=0.1):
-        self.button_queue.append((button, delay_after))
-
-    def _handle_button_queue(self):
-        t = time()
-        if t >= self.button_next_press_time:
-            button, delay_after = self.button_queue.popleft()
+        """Press `button`, after any presses already queued, and wait
+        `delay_after` seconds before the next one."""
+        self.buttons.put(button, delay_after)
+
+    def queue_macro(self, presses):
+        """Press a list of `(button, delay_after)` presses, after any presses
+        already queued, with the controller timing them itself."""
+        self.buttons.put_macro(presses)
+
+    def wait_for_buttons(self, timeout=None):
+        """Wait until every queued button has been pressed. See
+        `ButtonSequencer.wait()`."""
+        return self.buttons.wait(timeout)
+
+    def _press_button(self, button):
+        with self._controller_lock:
             self.controller.push_button(button)
-            self.button_next_press_time = t + delay_after
+
+    def _run_macro(self, presses):
+        with self._controller_lock:
+            return self.controller.run_macro(presses)
 
     def spell_high_score(self, name):
         assert len(name) == 3
         alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ "
 
+        presses = []
         for letter in name:
             dist = alphabet.index(letter)
             direction = "down"
@@ -210,31 +545,28 @@ class Driver(object):
                 dist = len(alphabet) - dist
                 direction = "up"
 
-            for i in range(dist):
-                self.queue_button_press(direction)
-            self.queue_button_press("a")
+            presses.extend([(direction, 0.1)] * dist)
+            presses.append(("a", 0.1))
+        self.queue_macro(presses)
 
     def _get_vision_instance(self):
-        return self.vision_cls(self.player)
+        return self.vision_cls(player=self.player,
+                               screen_offset=self.screen_offset,
+                               field=self.field)
 
     def reset_to_menu(self):
-        for button in ("z", "up", "a", "up"):
-            self.queue_button_press(button, 0.1)
-        self.queue_button_press("a", 4.55)
-        self.queue_button_press("start", 2)
-        self.queue_button_press("start", 2)
-        self.queue_button_press("start", 2)
+        presses = [(button, 0.1) for button in ("z", "up", "a", "up")]
+        presses.append(("a", 4.55))
+        presses.extend([("start", 2)] * 3)
+        self.queue_macro(presses)
 
     def reset_to_scenario_mode(self):
         self.reset_to_menu()
-        self.queue_button_press("a", 1)
-        self.queue_button_press("a", 1)
+        self.queue_macro([("a", 1), ("a", 1)])
 
     def reset_to_password_screen(self):
         self.reset_to_menu()
-        self.queue_button_press("a", 1)
-        self.queue_button_press("down", 0.1)
-        self.queue_button_press("a", 1.5)
+        self.queue_macro([("a", 1), ("down", 0.1), ("a", 1.5)])
 
     def reset_to_level(self, level):
         if level == 1:
@@ -248,11 +580,12 @@ class Driver(object):
     def enter_password(self, level):
         password = PASSWORDS[level]
 
+        presses = []
         cur_idx = 0
         for token in tuple(password)+("end",):
             token_idx = PASSWORD_TOKEN_ORDER.index(token)
             direction = "left" if cur_idx > token_idx else "right"
-            for i in range(abs(cur_idx - token_idx)):
-                self.queue_button_press(direction, 0.2)
-            self.queue_button_press("b")
+            presses.extend([(direction, 0.2)] * abs(cur_idx - token_idx))
+            presses.append(("b", 0.1))
             cur_idx = token_idx
+        self.queue_macro(presses)
@@ -0,0 +1,498 @@
+"""A closed-loop emulator of the game, for testing the `Driver` offline.
+
+`EmulatedGame` plays one side of the game on a `Board`: pairs appear, fall,
+and are moved and rotated by the buttons pressed on the controller, then land
+and set off chains, timed according to `puyo.timing`. `FrameRenderer` draws
+it into video frames laid out like the game's screen, with a sprite of each
+kind of cell at the cells `BeanFinder` reads for the calibrated screen
+offset. `Emulator` feeds those frames through a `Driver`, and the commands it
+sends go through the firmware model of `puyo.arduino` back into the game.
+
+Time is simulated with a `SimulatedClock`. Nothing waits for the next frame
+to be due, so games are played as fast as the computer allows, but the time
+the `Driver` spends on each frame is counted. A `Driver` that's too slow
+drops frames and makes moves late, just like it would on the real game.
+
+"""
+from __future__ import division
+from collections import namedtuple
+import os
+import random
+from time import time
+
+import numpy
+
+import puyo
+from puyo import timing
+from puyo.board import Board
+from puyo.beanfinder import BeanFinder, TEMPLATE_DIR, CELL_CROP_SIZE, \
+    get_template
+from puyo.calibration import DEFAULT_SCREEN_OFFSET, \
+    NEXT_LABEL_TEMPLATE_FILENAME, NEXT_LABEL_OFFSET
+from puyo.arduino import Firmware, DEFAULT_STATE
+from puyo.gccontrol import GamecubeController
+from puyo.simulation import random_next_beans, is_game_over
+from puyo.stats import LatencyHistogram
+from puyo.timing import FRAME_TIME
+
+# Cells that have a sprite, in the order they're stored in the sprites file.
+# See "vision_training/extract_sprites.py".
+SPRITE_CELLS = (b' ', b'r', b'g', b'b', b'y', b'p', b'k')
+SPRITES_FILENAME = os.path.join(TEMPLATE_DIR, "bean_sprites.png")
+
+# Size of rendered frames, (width, height), and the color of everything that
+# isn't a cell or the "NEXT" label.
+FRAME_SIZE = (720, 480)
+BACKGROUND_COLOR = (40, 24, 16)
+
+# Where the pivot (bottom) bean of a new pair appears, and where the other
+# bean is relative to it for each rotation.
+SPAWN_POSITION = (2, 11)
+PARTNER_OFFSETS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+# A pair that has landed.
+#
+# Items:
+#   index: Number of pairs that appeared before it.
+#   spawn_time, land_time: When it appeared and when it landed.
+#   position, rotation: Where it landed, as a move for `Board.make_move()`.
+#   command: The `(time, position, rotation)` of the move the controller was
+#       told to make with it, or None if it wasn't told any.
+LandedPair = namedtuple("LandedPair", "index spawn_time land_time position "
+                                      "rotation command")
+
+
+class SimulatedClock(object):
+    """A clock that runs at the speed of `time.time()`, but can be moved
+    ahead to skip waiting. It starts at 0."""
+
+    def __init__(self):
+        self._offset = -time()
+
+    def __call__(self):
+        return time() + self._offset
+
+    def advance_to(self, t):
+        """Skip ahead to time `t`, unless it's already later."""
+        now = self()
+        if t > now:
+            self._offset += t - now
+
+
+class FrameRenderer(object):
+    """Draws boards into video frames laid out like the game's screen."""
+
+    def __init__(self, screen_offset=DEFAULT_SCREEN_OFFSET, player=1,
+                 frame_size=FRAME_SIZE):
+        sheet = get_template(SPRITES_FILENAME)
+        w, h = CELL_CROP_SIZE
+        self.sprites = dict((cell, sheet[:,i*w:(i+1)*w])
+                            for i, cell in enumerate(SPRITE_CELLS))
+
+        background = numpy.empty((frame_size[1], frame_size[0], 3),
+                                 numpy.uint8)
+        background[:,:] = BACKGROUND_COLOR
+        label = get_template(NEXT_LABEL_TEMPLATE_FILENAME)
+        x = screen_offset[0] + NEXT_LABEL_OFFSET[0]
+        y = screen_offset[1] + NEXT_LABEL_OFFSET[1]
+        background[y:y+label.shape[0], x:x+label.shape[1]] = label
+        for each_player in (1, 2):
+            for x, y in BeanFinder(screen_offset, each_player).cell_origins:
+                background[y:y+h, x:x+w] = self.sprites[b' ']
+        self.background = background
+        self.cell_origins = BeanFinder(screen_offset, player).cell_origins
+
+    def render(self, cells, next_beans=None):
+        """Return a frame showing `cells` and `next_beans`.
+
+        Args:
+            cells: 6 columns of 12 cells each, indexed like a `Board`.
+            next_beans: Tuple of the two next beans, or None to leave the
+                next beans empty.
+
+        """
+        img = self.background.copy()
+        w, h = CELL_CROP_SIZE
+        for x in range(6):
+            for y in range(12):
+                if cells[x][y] != b' ':
+                    ox, oy = self.cell_origins[x*12 + y]
+                    img[oy:oy+h, ox:ox+w] = self.sprites[cells[x][y]]
+        if next_beans is not None:
+            for (ox, oy), bean in zip(self.cell_origins[72:], next_beans):
+                img[oy:oy+h, ox:ox+w] = self.sprites[bean]
+        return img
+
+
+class FallingPair(object):
+    """The pair being controlled. `x` and `y` are the cell of the pivot
+    (bottom) bean."""
+
+    def __init__(self, beans, spawn_time):
+        self.beans = beans
+        self.spawn_time = spawn_time
+        self.x, self.y = SPAWN_POSITION
+        self.rotation = 0
+        self.fall = 0.0  # Progress towards falling the next row
+        self.command = None
+
+    def cells(self, x=None, y=None, rotation=None):
+        """Return `((x, y, bean), (x, y, bean))` for the pivot and the other
+        bean, at the pair's position or the one given."""
+        x = self.x if x is None else x
+        y = self.y if y is None else y
+        rotation = self.rotation if rotation is None else rotation
+        dx, dy = PARTNER_OFFSETS[rotation]
+        return (x, y, self.beans[1]), (x + dx, y + dy, self.beans[0])
+
+    @property
+    def move(self):
+        """The pair's position as a `(position, rotation)` move."""
+        if self.rotation == 3:
+            return self.x - 1, self.rotation
+        return self.x, self.rotation
+
+
+class EmulatedGame(object):
+    """One player's side of the game, played with controller states.
+
+    Call `update()` once a frame with the state of the controller. Pairs
+    appear `timing.SPAWN_TIME` after the board settles, fall a row every
+    `timing.FALL_ROW_TIME`, or `timing.FAST_FALL_ROW_TIME` while down is
+    held, and move or rotate whenever a direction or rotation button is
+    pressed. Rotations that would overlap something don't happen. After a
+    pair lands, each step of the chain it sets off takes
+    `timing.CHAIN_STEP_TIME`.
+
+    Attributes:
+        board: The beans at rest, not including the falling pair.
+        next_beans: The pair shown as next.
+        pair: The `FallingPair`, or None between pairs.
+        landed: A `LandedPair` for every pair that has landed.
+        score, chain_lengths, game_over: Like in a `GameResult`.
+
+    """
+
+    def __init__(self, seed=0):
+        self._rng = random.Random(seed)
+        self.board = Board()
+        self.next_beans = random_next_beans(self._rng)
+        self.pair = None
+        self.n_pairs = 0
+        self.landed = []
+        self.score = 0
+        self.chain_lengths = []
+        self.game_over = False
+        self.time = 0.0
+        self._prev_state = DEFAULT_STATE
+        # Boards to show as the chain resolves, as (time, board) tuples, and
+        # when the next pair appears.
+        self._chain_boards = []
+        self._spawn_time = timing.SPAWN_TIME
+
+    @property
+    def cells(self):
+        """The cells shown on screen, including the falling pair."""
+        cells = self.board.get_array().copy()
+        if self.pair is not None:
+            for x, y, bean in self.pair.cells():
+                if y < 12:
+                    cells[x][y] = bean
+        return cells
+
+    def update(self, t, state=DEFAULT_STATE):
+        """Advance the game by one frame, to time `t`, with the controller
+        in `state`."""
+        self.time = t
+        if self.game_over:
+            return
+        if self.pair is not None:
+            self._update_pair(state)
+        while self._chain_boards and self._chain_boards[0][0] <= t:
+            self.board = self._chain_boards.pop(0)[1]
+        if self.pair is None and t >= self._spawn_time:
+            self._spawn()
+        self._prev_state = state
+
+    def _spawn(self):
+        if is_game_over(self.board):
+            self.game_over = True
+            return
+        self.pair = FallingPair(self.next_beans, self.time)
+        self.next_beans = random_next_beans(self._rng)
+
+    def _fits(self, x, y, rotation):
+        for cx, cy, bean in self.pair.cells(x, y, rotation):
+            if not 0 <= cx < 6 or cy < 0:
+                return False
+            if cy < 12 and self.board[cx][cy] != b' ':
+                return False
+        return True
+
+    def _update_pair(self, state):
+        pair = self.pair
+        pressed = state - self._prev_state
+        for button, dx in (("left", -1), ("right", 1)):
+            if button in pressed and \
+                    self._fits(pair.x + dx, pair.y, pair.rotation):
+                pair.x += dx
+        for button, turn in (("x", 1), ("a", -1)):
+            rotation = (pair.rotation + turn) % 4
+            if button in pressed and self._fits(pair.x, pair.y, rotation):
+                pair.rotation = rotation
+
+        if "down" in state:
+            pair.fall += FRAME_TIME / timing.FAST_FALL_ROW_TIME
+        else:
+            pair.fall += FRAME_TIME / timing.FALL_ROW_TIME
+        while pair.fall >= 1:
+            pair.fall -= 1
+            if not self._fits(pair.x, pair.y - 1, pair.rotation):
+                self._land()
+                return
+            pair.y -= 1
+
+    def _land(self):
+        pair = self.pair
+        self.pair = None
+        position, rotation = pair.move
+        self.landed.append(LandedPair(self.n_pairs, pair.spawn_time,
+                                      self.time, position, rotation,
+                                      pair.command))
+        self.n_pairs += 1
+
+        # The lower bean is dropped first, so a vertical pair stays in order
+        cells = sorted(pair.cells(), key=lambda cell: cell[1])
+        board = self.board.copy()
+        chain = board.iter_drop_beans([x for x, y, bean in cells],
+                                      [bean for x, y, bean in cells])
+        self.board = board.copy()
+        t = self.time
+        length = 0
+        for step in chain:
+            t += timing.CHAIN_STEP_TIME
+            self._chain_boards.append((t, step.board.copy()))
+            self.score += step.score
+            length = step.length
+        if length:
+            self.chain_lengths.append(length)
+        self._spawn_time = t + timing.SPAWN_TIME
+
+
+class EmulatedController(GamecubeController):
+    """A `GamecubeController` whose commands go to a `Firmware` instead of a
+    serial port.
+
+    Commands are kept until `take_sent()` hands them to the firmware. Every
+    move is also recorded in `moves` as a `(time, position, rotation)` tuple.
+
+    """
+
+    def __init__(self, clock):
+        self.gc_dev = None
+        self.clock = clock
+        self.moves = []
+        self._sent = []  # (time, command) tuples
+
+    def puyo_move(self, pos, rot, down_fast=True):
+        self.moves.append((self.clock(), pos, rot))
+        return GamecubeController.puyo_move(self, pos, rot, down_fast)
+
+    def send(self, command):
+        self.last_command_time = self.clock()
+        self._sent.append((self.last_command_time, command))
+
+    def take_sent(self, t):
+        """Return the bytes of every command sent at or before `t`, and
+        forget them."""
+        n = 0
+        while n < len(self._sent) and self._sent[n][0] <= t:
+            n += 1
+        data = b"".join(command for sent_time, command in self._sent[:n])
+        del self._sent[:n]
+        return data
+
+
+class EmulatorStats(object):
+    """Statistics of an `Emulator` run.
+
+    Attributes:
+        sim_time, wall_time: Simulated and real seconds the run took.
+        n_frames: Frames of the game that were simulated.
+        n_processed: Frames given to the `Driver`.
+        n_dropped: Frames that were dropped because the `Driver` was still
+            busy with an earlier one.
+        decision_latency: `LatencyHistogram` of the simulated time from a
+            pair appearing until the `Driver` sent its move.
+        n_pairs: Pairs that landed.
+        n_missed: Pairs that landed without a move being sent for them.
+        n_misplaced: Pairs that landed somewhere other than the move sent
+            for them, for example because it came too late.
+        n_extra_moves: Moves sent while there was no pair to make them
+            with, or for a pair that already had one.
+        n_board_errors: New moves where the board `Vision` saw didn't match
+            the game's.
+
+    """
+
+    def __init__(self):
+        self.sim_time = 0.0
+        self.wall_time = 0.0
+        self.n_frames = 0
+        self.n_processed = 0
+        self.n_dropped = 0
+        self.decision_latency = LatencyHistogram(window=100000)
+        self.n_pairs = 0
+        self.n_missed = 0
+        self.n_misplaced = 0
+        self.n_extra_moves = 0
+        self.n_board_errors = 0
+        self.score = 0
+        self.chain_lengths = []
+        self.game_over = False
+
+    @property
+    def speedup(self):
+        """How many times faster than real time the run was."""
+        return self.sim_time / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def frames_per_second(self):
+        """Frames processed per real second."""
+        return self.n_processed / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def missed_rate(self):
+        """Fraction of pairs that weren't placed where the `Driver` meant."""
+        if not self.n_pairs:
+            return 0.0
+        return (self.n_missed + self.n_misplaced) / self.n_pairs
+
+    def format(self):
+        latency = ["-" if v is None else "{:.1f}".format(v*1000)
+                   for v in self.decision_latency.percentiles()]
+        return "\n".join([
+            "{:.1f}s of game in {:.1f}s ({:.1f}x real time), {} frames, "
+            "{} processed ({:.1f}/s), {} dropped".format(
+                self.sim_time, self.wall_time, self.speedup, self.n_frames,
+                self.n_processed, self.frames_per_second, self.n_dropped),
+            "decision latency (ms): p50={} p95={} p99={}".format(*latency),
+            "{} pairs: {} missed, {} misplaced ({:.1%}), {} extra moves, "
+            "{} board errors".format(
+                self.n_pairs, self.n_missed, self.n_misplaced,
+                self.missed_rate, self.n_extra_moves, self.n_board_errors),
+            "score: {}, longest chain: {}{}".format(
+                self.score, max(self.chain_lengths or [0]),
+                ", game over" if self.game_over else ""),
+        ])
+
+
+class Emulator(object):
+    """Plays an `EmulatedGame` with a `Driver`, in simulated time.
+
+    Every frame of the game is simulated, with the firmware polled once per
+    frame, like the Gamecube does. The `Driver` is given the most recent
+    frame whenever it's done with the last one.
+
+    """
+
+    def __init__(self, ai=puyo.DEFAULT_AI_NAME, seed=0, vision_cls=None,
+                 screen_offset=DEFAULT_SCREEN_OFFSET, field=None,
+                 skip_frames=False, player=1):
+        """
+        Args:
+            ai: AI instance or name, as for `Driver`.
+            seed: Seed of the bean sequence.
+            vision_cls: Class to recognize frames with, as for `Driver`. It
+                must accept a `clock` keyword argument, like `Vision`.
+                Defaults to `Vision`.
+            screen_offset: Where the game is drawn in the frame.
+            field, skip_frames, player: Passed on to `Driver`.
+        """
+        if vision_cls is None:
+            vision_cls = puyo.Vision
+        self.clock = SimulatedClock()
+        self.game = EmulatedGame(seed)
+        self.firmware = Firmware()
+        self.controller = EmulatedController(self.clock)
+        self.renderer = FrameRenderer(screen_offset, player)
+
+        clock = self.clock
+        def make_vision(**kwargs):
+            return vision_cls(clock=clock, **kwargs)
+        self.driver = puyo.Driver(self.controller, ai, player,
+                                  vision_cls=make_vision,
+                                  screen_offset=screen_offset, field=field,
+                                  skip_frames=skip_frames, clock=self.clock)
+        self.stats = EmulatorStats()
+        self._n_moves = 0
+
+    def close(self):
+        """Stop the `Driver`'s threads."""
+        self.driver.close()
+
+    def run(self, max_pairs=None, max_time=None):
+        """Play until a game over, `max_pairs` pairs have landed, or
+        `max_time` seconds of game have been simulated. Return the
+        `EmulatorStats` of everything run so far."""
+        stats = self.stats
+        wall_start = time()
+        frame = stats.n_frames
+        while not self.game.game_over:
+            if max_pairs is not None and self.game.n_pairs >= max_pairs:
+                break
+            t = frame * FRAME_TIME
+            if max_time is not None and t >= max_time:
+                break
+
+            self.clock.advance_to(t)
+            self._update(t)
+            img = self.renderer.render(self.game.cells, self.game.next_beans)
+            state = self.driver.step(img, t)
+            stats.n_processed += 1
+            self._assign_moves()
+            if state is not None and state.new_move and \
+                    (state.board.get_array() !=
+                     self.game.board.get_array()).any():
+                stats.n_board_errors += 1
+
+            # Frames that went by while the Driver was busy are dropped,
+            # except the latest, which it gets next.
+            next_frame = max(frame + 1, int(self.clock() / FRAME_TIME))
+            for skipped in range(frame + 1, next_frame):
+                self._update(skipped * FRAME_TIME)
+                stats.n_dropped += 1
+            frame = next_frame
+
+        stats.wall_time += time() - wall_start
+        stats.n_frames = frame
+        stats.sim_time = frame * FRAME_TIME
+        self._count_landed()
+        return stats
+
+    def _update(self, t):
+        self.firmware.poll(self.controller.take_sent(t), t)
+        self.game.update(t, self.firmware.state)
+
+    def _assign_moves(self):
+        """Give moves the Driver just made to the pair they were made for."""
+        pair = self.game.pair
+        for move in self.controller.moves[self._n_moves:]:
+            if pair is None or pair.command is not None:
+                self.stats.n_extra_moves += 1
+            else:
+                pair.command = move
+                self.stats.decision_latency.add(move[0] - pair.spawn_time)
+        self._n_moves = len(self.controller.moves)
+
+    def _count_landed(self):
+        stats = self.stats
+        for landed in self.game.landed[stats.n_pairs:]:
+            if landed.command is None:
+                stats.n_missed += 1
+            elif landed.command[1:] != (landed.position, landed.rotation):
+                stats.n_misplaced += 1
+        stats.n_pairs = len(self.game.landed)
+        stats.score = self.game.score
+        stats.chain_lengths = list(self.game.chain_lengths)
+        stats.game_over = self.game.game_over
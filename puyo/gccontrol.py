@@ -1,6 +1,27 @@
 
+from math import ceil
+from time import time, sleep
+import threading
+import Queue
+
 import serial
 
+from puyo.timing import FRAME_TIME, INPUT_STATE_TIME
+
+# Limits of the Macro command. See "arduino/gamecube_control/PROTOCOL.md".
+MACRO_MAX_STEPS = 63
+MACRO_MAX_REPETITIONS = 16
+MACRO_MAX_WAIT = 255
+
+# Acknowledgements the Arduino sends back. See
+# "arduino/gamecube_control/PROTOCOL.md".
+ACK_RECEIVED = b'R'
+ACK_DONE = b'D'
+
+# Longer commands are written in pieces this big, a frame apart, so they
+# don't overflow the Arduino's serial buffer.
+SERIAL_CHUNK_SIZE = 32
+
 
 class Controller(object):
     """Controls a game system.
@@ -10,8 +31,13 @@ class Controller(object):
     commands to a microcontroller that speaks the gamesystem's physical
     controller protocol.
 
+    Implementations should set `last_command_time` to the value of
+    `time.time()` right after each command is sent to the game system.
+
     """
 
+    last_command_time = None
+
     def puyo_move(self, pos, rot, down_fast=True):
         """
         Drop a puyo at `pos` with rotation `rot`. If `down_fast` is True, hold
@@ -34,6 +60,69 @@ class Controller(object):
         raise NotImplementedError("This method must be implemented by a "
                                   "subclass.")
 
+    def run_macro(self, presses):
+        """Press a sequence of buttons.
+
+        Args:
+            presses: A list of `(button, delay_after)` tuples. `button` is
+                the same as for `push_button()`, and `delay_after` is how
+                many seconds to wait before the next press.
+
+        Returns:
+            How many seconds after returning the sequence will be finished.
+            This implementation presses each button with `push_button()`,
+            sleeping in between, so it returns 0. Implementations that can
+            hand the whole sequence to the game system at once return right
+            away instead.
+
+        """
+        for button, delay_after in presses:
+            self.push_button(button)
+            sleep(delay_after)
+        return 0
+
+
+def encode_macro(presses, button_bits):
+    """Return the Macro command for `presses`, and how long it takes to run.
+
+    Delays are rounded up to whole controller states, so none is shorter
+    than asked for, and consecutive presses of the same button with the same
+    delay are combined into one step.
+
+    Args:
+        presses: Same as for `Controller.run_macro()`.
+        button_bits: Dict mapping lowercase button names to their values in
+            the protocol.
+
+    Returns:
+        A tuple `(command, duration)`. `command` is the bytes to send, and
+        `duration` is how long the Arduino takes to run it, in seconds.
+
+    """
+    steps = []
+    for button, delay_after in presses:
+        # The press itself takes one state. The small tolerance keeps delays
+        # that are already whole states from rounding up another one.
+        wait = int(ceil(delay_after / INPUT_STATE_TIME - 1e-6)) - 1
+        wait = max(1, min(MACRO_MAX_WAIT, wait))
+        button = button_bits[button.lower()]
+        if steps and steps[-1][0] == button and steps[-1][2] == wait and \
+                steps[-1][1] < MACRO_MAX_REPETITIONS:
+            steps[-1][1] += 1
+        else:
+            steps.append([button, 1, wait])
+    if len(steps) > MACRO_MAX_STEPS:
+        raise ValueError("Macro has {} steps, more than the maximum of "
+                         "{}".format(len(steps), MACRO_MAX_STEPS))
+
+    command = [0x02 << 6 | len(steps)]
+    n_states = 0
+    for button, repetitions, wait in steps:
+        command.append(button << 4 | (repetitions - 1))
+        command.append(wait)
+        n_states += repetitions * (1 + wait)
+    return b"".join(chr(c) for c in command), n_states * INPUT_STATE_TIME
+
 
 class GamecubeController(Controller):
     BUTTON_BITS = {
@@ -54,16 +143,21 @@ class GamecubeController(Controller):
         Args:
             device: Serial device name of the arduino programmed to interact
                 with the Gamecube. On Linux this might be something like
-                "/dev/ttyACM0" or "/dev/ttyUSB0".
+                "/dev/ttyACM0" or "/dev/ttyUSB0". An already open serial
+                port object may be given instead.
         """
         self.gc_dev = None
-        self.gc_dev = serial.Serial(device, 115200, timeout=0.01)
+        if isinstance(device, basestring):
+            self.gc_dev = serial.Serial(device, 115200, timeout=0.01)
+        else:
+            self.gc_dev = device
 
     def __del__(self):
         if self.gc_dev:
             self.gc_dev.close()
 
-    def puyo_move(self, pos, rot, down_fast=True):
+    def move_command(self, pos, rot, down_fast=True):
+        """Return the bytes of the Puyo Move command for a move."""
         rot = rot % 4
         if pos > 5 or pos < 0:
             raise ValueError("`pos` must be between 0 and 5 inclusive")
@@ -77,12 +171,180 @@ class GamecubeController(Controller):
         rot_bits = rot << 1
         down_fast_bits = 0x1 if down_fast else 0x0
 
-        to_send = pos_bits | rot_bits | down_fast_bits
-        self.gc_dev.write(chr(to_send))
+        return chr(pos_bits | rot_bits | down_fast_bits)
 
-    def push_button(self, button):
+    def button_command(self, button):
+        """Return the bytes of the Single Button command for `button`."""
         cmd_bits = 0x01 << 6
         button_bits = self.BUTTON_BITS[button.lower()] << 2
         rep_bits = 0x00
-        to_send = cmd_bits | button_bits | rep_bits
-        self.gc_dev.write(chr(to_send))
+        return chr(cmd_bits | button_bits | rep_bits)
+
+    def puyo_move(self, pos, rot, down_fast=True):
+        return self.send(self.move_command(pos, rot, down_fast))
+
+    def push_button(self, button):
+        return self.send(self.button_command(button))
+
+    def run_macro(self, presses):
+        """Send the whole sequence to the Arduino in one Macro command.
+
+        The Arduino times the presses itself. See `encode_macro()` for how
+        the sequence is encoded.
+
+        """
+        command, duration = encode_macro(presses, self.BUTTON_BITS)
+        self.send(command)
+        return duration
+
+    def send(self, command):
+        """Write the bytes of a command to the Arduino."""
+        for start in range(0, len(command), SERIAL_CHUNK_SIZE):
+            if start:
+                sleep(FRAME_TIME)
+            self.gc_dev.write(command[start:start+SERIAL_CHUNK_SIZE])
+        self.last_command_time = time()
+
+
+class ControllerCommand(object):
+    """A command sent by `AsyncGamecubeController`, and when it got through
+    each stage.
+
+    Attributes:
+        data: The bytes of the command.
+        queued_time: When it was given to the controller.
+        sent_time: When it was written to the serial port.
+        received_time: When the Arduino acknowledged receiving it.
+        done_time: When the Arduino acknowledged finishing it, or gave up
+            waiting for it to be received.
+        failed: True if it was never acknowledged as received, so it may
+            have been dropped.
+
+    Times are from `time.time()`, and None until they happen.
+
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.queued_time = time()
+        self.sent_time = None
+        self.received_time = None
+        self.done_time = None
+        self.failed = False
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait until the command is done. Return False on a timeout."""
+        return self._done.wait(timeout)
+
+    def add_done_callback(self, callback):
+        """Call `callback` with the command when it's done, from the
+        controller's thread. Called right away if it's already done."""
+        with self._lock:
+            if not self.done:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _finish(self, t, failed=False):
+        with self._lock:
+            self.done_time = t
+            self.failed = failed
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
+class AsyncGamecubeController(GamecubeController):
+    """A `GamecubeController` that doesn't wait for the serial port, and
+    keeps track of when the Arduino has received and finished each command.
+
+    Commands are queued, and a background thread sends them one at a time,
+    each after the Arduino acknowledges receiving the one before. That way a
+    busy Arduino can't drop commands because its serial buffer overflowed.
+    If a command is never acknowledged, it's marked failed after
+    `ack_timeout` seconds and the next one is sent.
+
+    `puyo_move()`, `push_button()` and `send()` return a `ControllerCommand`,
+    which can be waited on until the Arduino has finished it. `run_macro()`
+    returns the macro's duration like the other controllers, and sets
+    `last_command`.
+
+    Requires the firmware to send acknowledgements. See
+    "arduino/gamecube_control/PROTOCOL.md".
+
+    """
+
+    def __init__(self, device, ack_timeout=0.5):
+        GamecubeController.__init__(self, device)
+        self.ack_timeout = ack_timeout
+        self.last_command = None
+        self.n_failed = 0
+        self._queue = Queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        name="AsyncGamecubeController")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def send(self, command):
+        command = ControllerCommand(command)
+        self.last_command = command
+        self._queue.put(command)
+        return command
+
+    def close(self):
+        """Stop the background thread and close the serial port."""
+        self._stop.set()
+        self._thread.join()
+        if self.gc_dev:
+            self.gc_dev.close()
+            self.gc_dev = None
+
+    def _run(self):
+        in_flight = None  # Sent, but not acknowledged as received
+        received = []  # Received, but not acknowledged as done
+        while not self._stop.is_set():
+            if in_flight is None:
+                try:
+                    # Don't wait long for a command if there are
+                    # acknowledgements to read.
+                    in_flight = self._queue.get(timeout=0.001 if received
+                                                else 0.01)
+                except Queue.Empty:
+                    pass
+                else:
+                    GamecubeController.send(self, in_flight.data)
+                    in_flight.sent_time = self.last_command_time
+
+            if in_flight is not None:
+                # Blocks until the acknowledgement, or the serial timeout
+                data = self.gc_dev.read(self.gc_dev.in_waiting or 1)
+            elif self.gc_dev.in_waiting:
+                data = self.gc_dev.read(self.gc_dev.in_waiting)
+            else:
+                data = b""
+            now = time()
+            for byte in data:
+                if byte == ACK_RECEIVED and in_flight is not None:
+                    in_flight.received_time = now
+                    received.append(in_flight)
+                    in_flight = None
+                elif byte == ACK_DONE:
+                    for command in received:
+                        command._finish(now)
+                    received = []
+
+            if in_flight is not None and \
+                    now - in_flight.sent_time > self.ack_timeout:
+                print "Warning: Controller command was not acknowledged"
+                self.n_failed += 1
+                in_flight._finish(now, failed=True)
+                in_flight = None
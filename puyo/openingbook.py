@@ -0,0 +1,186 @@
+"""An on-disk table of precomputed moves for the start of a game.
+
+The first few moves of every game are made on nearly empty boards, so the
+same positions come up again and again. `build_book()` runs a slow AI over
+every position reachable in the first few moves, and `write_book()` saves its
+answers as a table of fixed size records sorted by key. `OpeningBook` looks
+positions up in the table with a binary search over a `numpy.memmap`, so only
+the few pages the search touches are read from disk, and opening a book is
+instant no matter how big it is.
+
+A position is the board, the current beans and the next beans. Its key is a
+64 bit hash of all three, after renaming the colors with
+`Board.canonicalize()`. Positions that only differ by which color is which
+share a key, so the book only stores and searches one of them. That cuts the
+book's size and build time by a factor of up to 120 (the number of ways to
+rename 5 colors).
+
+"""
+from __future__ import division
+import struct
+import random
+import hashlib
+import itertools
+import multiprocessing
+
+import numpy
+
+from puyo.board import Board, BEAN_COLORS
+
+MAGIC = b"PUYOBOOK"
+VERSION = 2
+HEADER_FORMAT = "<8sII"  # Magic, version, number of records
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+RECORD_DTYPE = numpy.dtype([
+    ("key", "<u8"),
+    ("position", "u1"),
+    ("rotation", "u1"),
+])
+
+DEFAULT_N_MOVES = 2
+
+
+class OpeningBookError(Exception):
+    pass
+
+
+def canonical_position(board, beans, next_beans):
+    """Return the canonical `(board, beans)` of a position. The board's
+    `next_beans` is replaced by `next_beans`."""
+    board = board.copy()
+    board.next_beans = next_beans
+    board, beans, _ = board.canonicalize(beans)
+    return board, beans
+
+def _canonical_key(board, beans):
+    digest = hashlib.md5(board.get_uint8_array().tostring() +
+                         b"".join(beans) + b"".join(board.next_beans)).digest()
+    return struct.unpack("<Q", digest[:8])[0]
+
+def position_key(board, beans, next_beans):
+    """Return the 64 bit key of a position, as an int."""
+    return _canonical_key(*canonical_position(board, beans, next_beans))
+
+
+class OpeningBook(object):
+    """A read only opening book, memory mapped from `filename`."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            header = f.read(HEADER_SIZE)
+        if len(header) != HEADER_SIZE:
+            raise OpeningBookError("Truncated opening book")
+        magic, version, n_records = struct.unpack(HEADER_FORMAT, header)
+        if magic != MAGIC:
+            raise OpeningBookError("Not an opening book")
+        if version != VERSION:
+            raise OpeningBookError("Unsupported opening book version "
+                                   "{}".format(version))
+
+        if n_records:
+            self._records = numpy.memmap(filename, RECORD_DTYPE, mode="r",
+                                         offset=HEADER_SIZE,
+                                         shape=(n_records,))
+        else:
+            # A zero length memmap can't be created
+            self._records = numpy.empty(0, RECORD_DTYPE)
+        self._keys = self._records["key"]
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, key):
+        """Return the `(position, rotation)` stored for `key`, or None."""
+        i = numpy.searchsorted(self._keys, numpy.uint64(key))
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        record = self._records[i]
+        return int(record["position"]), int(record["rotation"])
+
+    def lookup(self, board, beans):
+        """Return the book move for a position, or None if it isn't in the
+        book. `board.next_beans` must be known for the position to be found.
+        """
+        if board.next_beans is None:
+            return None
+        return self.get(position_key(board, beans, board.next_beans))
+
+
+def write_book(entries, filename):
+    """Write a book file from a dict mapping keys to moves."""
+    records = numpy.empty(len(entries), RECORD_DTYPE)
+    for i, key in enumerate(sorted(entries)):
+        records[i] = (key,) + tuple(entries[key])
+    with open(filename, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, VERSION, len(records)))
+        f.write(records.tostring())
+
+
+def _search_worker(args):
+    ai_name, key, cells, beans, next_beans = args
+    import puyo
+    # Seed with the position, so AIs that break ties randomly give the same
+    # book every time.
+    random.seed(key)
+    return puyo.AI_REGISTRY[ai_name]().get_move(Board(cells, next_beans),
+                                                beans)
+
+def build_book(ai_name, n_moves=DEFAULT_N_MOVES, colors=BEAN_COLORS,
+               processes=None, callback=None):
+    """Return book entries for the first `n_moves` moves of a game.
+
+    Every sequence of bean pairs is played from an empty board, with the AI
+    named `ai_name` in `puyo.AI_REGISTRY` choosing each move. Its choice for
+    every position is returned in a dict mapping keys to moves, for
+    `write_book()`. There are `len(colors)**2` pairs, so the number of
+    positions is multiplied by up to that with every move, though far fewer
+    are searched since most share a canonical form with another.
+
+    Positions are searched across a process pool with `processes` processes,
+    defaulting to the number of CPUs. `callback`, if given, is called with
+    the move number and number of positions after each move is searched.
+
+    """
+    pairs = list(itertools.product(colors, repeat=2))
+    entries = {}
+    # Boards before the move, each with the beans it's about to drop
+    frontier = [(Board(), beans) for beans in pairs]
+    pool = None if processes == 1 else multiprocessing.Pool(processes)
+    try:
+        for move_number in range(n_moves):
+            # Only one of the positions that share a canonical form is
+            # searched, and it's searched in its canonical form so the move
+            # is the same for all of them.
+            positions = {}
+            for board, beans in frontier:
+                for next_beans in pairs:
+                    position = canonical_position(board, beans, next_beans)
+                    key = _canonical_key(*position)
+                    if key not in entries and key not in positions:
+                        positions[key] = position
+            keys = list(positions)
+            tasks = [(ai_name, key, positions[key][0].get_array(),
+                      positions[key][1], positions[key][0].next_beans)
+                     for key in keys]
+            if pool is None:
+                moves = map(_search_worker, tasks)
+            else:
+                moves = pool.map(_search_worker, tasks, chunksize=16)
+
+            frontier = []
+            for key, move in zip(keys, moves):
+                entries[key] = move
+                board, beans = positions[key]
+                board = board.copy()
+                combo = board.make_move(beans, *move)
+                if combo is not False and not combo.game_over:
+                    frontier.append((board, board.next_beans))
+            if callback is not None:
+                callback(move_number, len(positions))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return entries
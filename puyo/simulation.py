@@ -0,0 +1,203 @@
+"""Headless simulation of complete games, for evaluating AIs.
+
+Each game is played from a seed, which determines the bean sequence, where
+random nuisance beans fall, and any random choices the AI makes. Playing the
+same AI with the same seed gives the same game, and different AIs given the
+same seed see the same beans.
+
+Games are independent, so `play_games()` spreads them across a process pool.
+AIs are passed to the workers by their name in `puyo.AI_REGISTRY`, since AI
+instances aren't necessarily picklable.
+
+"""
+from __future__ import division
+import random
+import multiprocessing
+from time import time
+from collections import namedtuple, Counter
+
+import puyo
+
+BEAN_COLORS = (b'r', b'g', b'b', b'y', b'p')
+
+# Stop games that go on this long, so an AI that never loses can't hang the
+# simulation. Games stopped this way don't count as game overs.
+DEFAULT_MAX_MOVES = 1000
+
+# The result of a single game.
+#
+# Items:
+#   seed: The seed the game was played with.
+#   score: Total score of every combo in the game.
+#   n_moves: Number of moves made.
+#   chain_lengths: A list with the length of every chain, in order. Moves
+#       that didn't eliminate anything aren't included.
+#   game_over: True if the game ended in a game over, False if it was stopped
+#       after the maximum number of moves.
+#   invalid_move: True if the game over was caused by the AI returning a move
+#       that can't be made.
+GameResult = namedtuple("GameResult",
+                        "seed score n_moves chain_lengths game_over invalid_move")
+
+
+def random_bean(rng=random):
+    return rng.choice(BEAN_COLORS)
+
+def random_next_beans(rng=random):
+    return (random_bean(rng), random_bean(rng))
+
+def is_game_over(board):
+    """Return True if the spawn point of new beans is blocked."""
+    return board[2][11] != b' '
+
+def play_game(ai, seed, nuisance_probability=0, max_moves=DEFAULT_MAX_MOVES,
+              on_move=None):
+    """Play one game with `ai` until a game over, and return a `GameResult`.
+
+    Args:
+        ai: An `AI` instance.
+        seed: Integer that determines the bean sequence. The global `random`
+            module is also seeded with it, since the AIs and
+            `Board.drop_nuisance()` use it.
+        nuisance_probability: Probability (0-1) of a nuisance bean being
+            dropped after each move.
+        max_moves: Stop the game after this many moves.
+        on_move: If given, called with the board and the `Combo` after each
+            valid move, before any nuisance falls.
+
+    """
+    bean_rng = random.Random(seed)
+    random.seed(seed)
+
+    board = puyo.Board(next_beans=random_next_beans(bean_rng))
+    score = 0
+    chain_lengths = []
+    game_over = False
+    invalid_move = False
+    n_moves = 0
+    while n_moves < max_moves:
+        current_beans = board.next_beans
+        board.next_beans = random_next_beans(bean_rng)
+        position, rotation = ai.get_move(board.copy(), current_beans)
+        n_moves += 1
+
+        combo = board.make_move(current_beans, position, rotation)
+        if combo is False:
+            game_over = invalid_move = True
+            break
+        if on_move is not None:
+            on_move(board, combo)
+        if combo.length:
+            score += combo.score
+            chain_lengths.append(combo.length)
+        if combo.game_over or is_game_over(board):
+            game_over = True
+            break
+
+        if random.uniform(0, 1) < nuisance_probability:
+            board.drop_nuisance(1)
+
+    return GameResult(seed, score, n_moves, chain_lengths, game_over,
+                      invalid_move)
+
+def _play_game_worker(args):
+    ai_name, seed, nuisance_probability, max_moves = args
+    ai = puyo.AI_REGISTRY[ai_name]()
+    return play_game(ai, seed, nuisance_probability, max_moves)
+
+def play_games(ai_name, n_games, first_seed=0, nuisance_probability=0,
+               max_moves=DEFAULT_MAX_MOVES, processes=None):
+    """Play `n_games` games and return a list of `GameResult`s.
+
+    Game `i` is played with seed `first_seed + i`. The results are in the same
+    order.
+
+    Args:
+        ai_name: Name of the AI in `puyo.AI_REGISTRY`.
+        n_games: Number of games to play.
+        first_seed: Seed of the first game.
+        nuisance_probability, max_moves: Same as for `play_game()`.
+        processes: Number of worker processes. Defaults to the number of
+            CPUs. If 1, games are played in this process.
+
+    """
+    args = [(ai_name, first_seed + i, nuisance_probability, max_moves)
+            for i in range(n_games)]
+    if processes == 1:
+        return map(_play_game_worker, args)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # Small chunks keep every process busy until the end, since game
+        # lengths vary a lot.
+        return pool.map(_play_game_worker, args, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+class SimulationSummary(object):
+    """Aggregate statistics over a list of `GameResult`s."""
+
+    def __init__(self, ai_name, results, duration):
+        """
+        Args:
+            ai_name: Name of the AI that played, for `format()`.
+            results: A list of `GameResult`s.
+            duration: Wall time it took to play all of the games, in seconds.
+        """
+        self.ai_name = ai_name
+        self.results = results
+        self.duration = duration
+
+        self.n_games = len(results)
+        self.n_moves = sum(r.n_moves for r in results)
+        scores = [r.score for r in results]
+        self.mean_score = sum(scores) / len(scores) if scores else 0
+        self.max_score = max(scores) if scores else 0
+        self.n_game_overs = sum(1 for r in results if r.game_over)
+        self.n_invalid_moves = sum(1 for r in results if r.invalid_move)
+        self.chain_lengths = Counter(length for r in results
+                                            for length in r.chain_lengths)
+
+    @property
+    def games_per_second(self):
+        return self.n_games / self.duration if self.duration else 0.0
+
+    @property
+    def moves_per_second(self):
+        return self.n_moves / self.duration if self.duration else 0.0
+
+    @property
+    def game_over_rate(self):
+        return self.n_game_overs / self.n_games if self.n_games else 0.0
+
+    def format(self):
+        lines = [
+            "{}: {} games, {} moves in {:.1f}s ({:.2f} games/s, "
+            "{:.1f} moves/s)".format(
+                self.ai_name, self.n_games, self.n_moves, self.duration,
+                self.games_per_second, self.moves_per_second),
+            "  score: mean={:.1f} max={}".format(self.mean_score,
+                                                 self.max_score),
+            "  game over rate: {:.1%} ({} from invalid moves)".format(
+                self.game_over_rate, self.n_invalid_moves),
+            "  chain lengths:",
+        ]
+        n_chains = sum(self.chain_lengths.values())
+        for length in sorted(self.chain_lengths):
+            count = self.chain_lengths[length]
+            lines.append("    {:>3}: {:>8} ({:.1%})".format(
+                length, count, count / n_chains))
+        return "\n".join(lines)
+
+
+def simulate(ai_name, n_games, **kwargs):
+    """Play games with `play_games()` and return a `SimulationSummary`.
+
+    Keyword arguments are passed on to `play_games()`.
+
+    """
+    start = time()
+    results = play_games(ai_name, n_games, **kwargs)
+    return SimulationSummary(ai_name, results, time() - start)
@@ -0,0 +1,161 @@
+"""Throughput and latency statistics for the stages of the `Driver`."""
+
+import sys
+import threading
+import Queue
+from collections import deque
+
+import numpy
+
+
+class StageStats(object):
+    """Running totals for one processing stage.
+
+    Every time the stage finishes processing an item, `record()` is called
+    with when the stage started and finished working on it, and when the
+    video frame the item came from was captured.
+
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.busy_time = 0.0  # Total time spent processing
+        self.total_latency = 0.0  # Total time from frame capture to finishing
+        self.first_time = None
+        self.last_time = None
+        self._lock = threading.Lock()
+
+    def record(self, start, end, captured=None):
+        with self._lock:
+            self.count += 1
+            self.busy_time += end - start
+            if captured is not None:
+                self.total_latency += end - captured
+            if self.first_time is None:
+                self.first_time = start
+            self.last_time = end
+
+    @property
+    def throughput(self):
+        """Items finished per second of wall time."""
+        if self.count == 0 or self.last_time <= self.first_time:
+            return 0.0
+        return self.count / (self.last_time - self.first_time)
+
+    @property
+    def mean_service_time(self):
+        if self.count == 0:
+            return 0.0
+        return self.busy_time / self.count
+
+    @property
+    def mean_latency(self):
+        """Mean time from frame capture until this stage finished."""
+        if self.count == 0:
+            return 0.0
+        return self.total_latency / self.count
+
+    def summary(self):
+        return "{:<12} n={:<6} {:8.2f}/s  service={:7.1f}ms  " \
+               "latency={:7.1f}ms".format(
+            self.name, self.count, self.throughput,
+            self.mean_service_time*1000, self.mean_latency*1000
+        )
+
+
+class LatencyHistogram(object):
+    """Rolling window of the most recent latency samples.
+
+    Only the last `window` samples are kept, so percentiles follow changes in
+    performance instead of being dominated by the start of a long run.
+
+    """
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0  # Total samples ever added, including forgotten ones
+        self._lock = threading.Lock()
+
+    def add(self, value):
+        with self._lock:
+            self.samples.append(value)
+            self.count += 1
+
+    def percentiles(self, ps=(50, 95, 99)):
+        """Return a list of the given percentiles, or Nones if empty."""
+        with self._lock:
+            samples = list(self.samples)
+        if not samples:
+            return [None for p in ps]
+        return list(numpy.percentile(samples, ps))
+
+    def max(self):
+        with self._lock:
+            return max(self.samples) if self.samples else None
+
+
+class LatencyTracker(object):
+    """Latency from frame capture to each event in the processing of a frame.
+
+    Events are named by the caller, for example "vision" when a frame has
+    been recognized, or "command" when a move has been sent to the
+    controller. Each event gets its own `LatencyHistogram`.
+
+    """
+
+    def __init__(self, events, window=1000):
+        self.events = tuple(events)
+        self.histograms = dict((event, LatencyHistogram(window))
+                               for event in self.events)
+
+    def record(self, event, captured, t):
+        """Record that `event` happened at time `t` for a frame captured at
+        time `captured`."""
+        self.histograms[event].add(t - captured)
+
+    def dump(self, f=None):
+        """Write a table of latency percentiles, in milliseconds, to `f`.
+
+        `f` defaults to stdout.
+
+        """
+        if f is None:
+            f = sys.stdout
+        f.write("Latency since frame capture (ms):\n")
+        f.write("{:<12} {:>8} {:>8} {:>8} {:>8} {:>8}\n".format(
+                "event", "n", "p50", "p95", "p99", "max"))
+        for event in self.events:
+            histogram = self.histograms[event]
+            values = histogram.percentiles() + [histogram.max()]
+            values = ["-" if v is None else "{:.1f}".format(v*1000)
+                      for v in values]
+            f.write("{:<12} {:>8} {:>8} {:>8} {:>8} {:>8}\n".format(
+                    event, histogram.count, *values))
+        f.flush()
+
+
+class LatestQueue(Queue.Queue):
+    """A bounded queue that drops the oldest item instead of blocking.
+
+    Use `put_latest()` to add items. When the consumer can't keep up, stale
+    items are discarded so the consumer always gets the most recent work. The
+    number of discarded items is kept in `n_dropped`.
+
+    """
+
+    def __init__(self, maxsize=1):
+        Queue.Queue.__init__(self, maxsize)
+        self.n_dropped = 0
+
+    def put_latest(self, item):
+        while True:
+            try:
+                self.put_nowait(item)
+                return
+            except Queue.Full:
+                try:
+                    self.get_nowait()
+                    self.n_dropped += 1
+                except Queue.Empty:
+                    pass
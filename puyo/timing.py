@@ -0,0 +1,110 @@
+"""How long the game takes to play out a move.
+
+These are estimates of the game's animation timing, in seconds, used to order
+events when simulating versus matches and to predict when the board will
+settle after a move, so `Vision` can skip frames while it's animating. They
+were estimated from video at 60 frames per second, so treat them as accurate
+to a frame or two.
+
+"""
+from __future__ import division
+
+FRAME_TIME = 1 / 60
+
+# The Arduino holds each controller state for 5 polls of the console, about
+# one frame each. See "arduino/gamecube_control/gamecube_control.ino".
+INPUT_STATE_TIME = 5 * FRAME_TIME
+
+# Controller states the Arduino holds down for after a move, when dropping
+# fast.
+DOWN_FAST_STATES = 8
+
+# From a pair landing until the next pair appears.
+SPAWN_TIME = 0.25
+
+# Time for a pair to fall one row, while holding down and while not.
+FAST_FALL_ROW_TIME = 0.025
+FALL_ROW_TIME = 0.25
+
+# Each step of a chain: the popping animation, then the beans above falling.
+POP_TIME = 0.5
+CHAIN_FALL_TIME = 0.3
+CHAIN_STEP_TIME = POP_TIME + CHAIN_FALL_TIME
+
+# Nuisance beans falling onto the board.
+NUISANCE_FALL_TIME = 0.6
+
+EMPTY = ord(b' ')
+
+
+def steer_time(position, rotation):
+    """Return how long the controller takes to move and rotate a pair into
+    place, before it's dropped.
+
+    Moves and rotations are pressed at the same time, alternating with
+    releasing the controller, like `GamecubeController.puyo_move()` does.
+
+    """
+    if rotation == 3:
+        position += 1  # The pair is one further from the left side
+    n_rotations = {0: 0, 1: 1, 2: 2, 3: 1}[rotation]
+    n_steps = max(abs(position - 2), n_rotations, 1)
+    # A release between steps, and one at the end
+    return 2 * n_steps * INPUT_STATE_TIME
+
+def input_time(position, rotation, down_fast=True):
+    """Return how long the controller takes to input a move, including
+    holding down afterwards when dropping fast."""
+    t = steer_time(position, rotation)
+    if down_fast:
+        t += DOWN_FAST_STATES * INPUT_STATE_TIME
+    return t
+
+def drop_rows(board, position, rotation):
+    """Return how many rows a pair falls before landing on `board`."""
+    filled = board.get_uint8_array() != EMPTY
+    columns = (position,) if rotation % 2 == 0 else (position, position + 1)
+    height = max(filled[x].sum() for x in columns)
+    # The bottom bean starts in the second row from the top
+    return max(0, 11 - height)
+
+def drop_time(n_rows, down_fast=True):
+    return n_rows * (FAST_FALL_ROW_TIME if down_fast else FALL_ROW_TIME)
+
+def chain_time(length):
+    """Return how long a chain of `length` steps takes to finish."""
+    return length * CHAIN_STEP_TIME
+
+def move_time(board, position, rotation, chain_length=0, n_nuisance=0,
+              down_fast=True):
+    """Return how long a move takes, from the pair appearing until the board
+    settles.
+
+    Args:
+        board: The board before the move is made.
+        position, rotation: The move. See `Board.make_move()`.
+        chain_length: Length of the chain the move causes.
+        n_nuisance: Number of nuisance beans falling after the move.
+        down_fast: Whether down is held to drop the pair quickly.
+
+    """
+    # Holding down is what makes the pair drop, so it's timed by the drop,
+    # not by how long the controller keeps holding it.
+    t = steer_time(position, rotation)
+    t += drop_time(drop_rows(board, position, rotation), down_fast)
+    t += chain_time(chain_length)
+    if n_nuisance:
+        t += NUISANCE_FALL_TIME
+    return t
+
+def settle_time(board, beans, position, rotation, down_fast=True):
+    """Return how long a move takes, like `move_time()`, predicting the
+    chain length by making the move on a copy of `board`.
+
+    Nuisance beans aren't predicted, since they depend on the opponent.
+
+    """
+    combo = board.copy().make_move(beans, position, rotation)
+    chain_length = combo.length if combo else 0
+    return move_time(board, position, rotation, chain_length,
+                     down_fast=down_fast)
@@ -0,0 +1,318 @@
+"""Round-robin tournaments between the AIs in `puyo.AI_REGISTRY`.
+
+There are two kinds of tournament:
+
+ * Solo: Every AI plays the same seeded games (see `puyo.simulation`), so
+   each pair of AIs is compared on identical bean sequences. For each seed,
+   the AI that survives wins. If both have a game over, or neither does, the
+   higher score wins. Equal results are draws. Each game only depends on the
+   AI and the seed, so every (AI, seed) game is played once and shared by all
+   of that AI's pairings.
+ * Versus: Every pair of AIs plays head to head matches with nuisance
+   exchange, one per seed (see `puyo.versus`).
+
+Games are appended to a `ResultStore` as they finish, and games already in
+the store are skipped, so an interrupted tournament picks up where it left
+off.
+
+"""
+from __future__ import division
+import json
+import multiprocessing
+from math import sqrt
+from itertools import combinations
+
+import puyo
+from puyo import simulation, versus
+
+# z value for 95% confidence intervals.
+CONFIDENCE_Z = 1.96
+
+
+class ResultStore(object):
+    """Game records appended to a file, one JSON object per line.
+
+    A record is a dict. The fields that identify the game, given by
+    `key_fields`, are used to check whether a game was already played. A
+    partially written last line, left by an interrupted run, is ignored.
+
+    """
+
+    key_fields = ("mode", "ais", "seed", "nuisance_probability", "max_moves")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.records = {}
+        try:
+            with open(filename) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.records[self.key(record)] = record
+        except IOError:
+            pass
+
+    def key(self, record):
+        return tuple(json.dumps(record[field]) for field in self.key_fields)
+
+    def __contains__(self, record):
+        return self.key(record) in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record):
+        self.records[self.key(record)] = record
+        with open(self.filename, "a") as f:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    def get(self, record):
+        """Return the stored record of the same game, or None."""
+        return self.records.get(self.key(record))
+
+
+def wilson_interval(successes, n, z=CONFIDENCE_Z):
+    """Return the Wilson score interval of a proportion as `(low, high)`."""
+    if n == 0:
+        return (0.0, 1.0)
+    p = successes / n
+    denominator = 1 + z*z/n
+    center = (p + z*z/(2*n)) / denominator
+    margin = z * sqrt(p*(1-p)/n + z*z/(4*n*n)) / denominator
+    return (max(0.0, center - margin), min(1.0, center + margin))
+
+def mean_interval(values, z=CONFIDENCE_Z):
+    """Return `(mean, low, high)`, a normal confidence interval of the mean."""
+    n = len(values)
+    if n == 0:
+        return (0.0, 0.0, 0.0)
+    mean = sum(values) / n
+    if n == 1:
+        return (mean, mean, mean)
+    variance = sum((v - mean)**2 for v in values) / (n - 1)
+    margin = z * sqrt(variance / n)
+    return (mean, mean - margin, mean + margin)
+
+
+def solo_record(ai_name, seed, nuisance_probability, max_moves):
+    """Return the record of a solo game, without its result fields."""
+    return {
+        "mode": "solo",
+        "ais": [ai_name],
+        "seed": seed,
+        "nuisance_probability": float(nuisance_probability),
+        "max_moves": max_moves,
+    }
+
+def _play_solo_worker(record):
+    ai = puyo.AI_REGISTRY[record["ais"][0]]()
+    result = simulation.play_game(ai, record["seed"],
+                                  record["nuisance_probability"],
+                                  record["max_moves"])
+    record = dict(record)
+    record.update(result._asdict())
+    return record
+
+def play_records(store, records, worker, processes=None, callback=None):
+    """Play the games in `records` that aren't in `store` yet.
+
+    Each record is passed to `worker`, which returns it with the game results
+    added. Results are added to `store` as soon as they finish, in whatever
+    order that is. `callback`, if given, is called with each finished record.
+    Records that are the same game, by `ResultStore.key()`, are only played
+    once. Returns the number of games played.
+
+    """
+    todo = []
+    keys = set()
+    for record in records:
+        key = store.key(record)
+        if record not in store and key not in keys:
+            keys.add(key)
+            todo.append(record)
+    if not todo:
+        return 0
+
+    if processes == 1:
+        results = (worker(record) for record in todo)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(worker, todo)
+    try:
+        for record in results:
+            store.add(record)
+            if callback is not None:
+                callback(record)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return len(todo)
+
+def play_solo_games(store, ai_names, n_games, first_seed=0,
+                    nuisance_probability=0,
+                    max_moves=simulation.DEFAULT_MAX_MOVES, processes=None,
+                    callback=None):
+    """Play every AI in `ai_names` on `n_games` seeds.
+
+    See `play_records()` for the rest of the arguments and return value.
+
+    """
+    records = [solo_record(ai_name, seed, nuisance_probability, max_moves)
+               for seed in range(first_seed, first_seed + n_games)
+               for ai_name in ai_names]
+    return play_records(store, records, _play_solo_worker, processes,
+                        callback)
+
+
+def versus_record(ai1, ai2, seed, max_moves):
+    """Return the record of a versus match, without its result fields."""
+    return {
+        "mode": "versus",
+        "ais": [ai1, ai2],
+        "seed": seed,
+        "nuisance_probability": 0.0,
+        "max_moves": max_moves,
+    }
+
+def _play_versus_worker(record):
+    ai1, ai2 = [puyo.AI_REGISTRY[name]() for name in record["ais"]]
+    result = versus.play_match(ai1, ai2, record["seed"], record["max_moves"])
+    record = dict(record)
+    record.update(result._asdict())
+    return record
+
+def play_versus_games(store, ai_names, n_games, first_seed=0,
+                      max_moves=simulation.DEFAULT_MAX_MOVES, processes=None,
+                      callback=None):
+    """Play `n_games` versus matches between every pair of AIs.
+
+    See `play_records()` for the rest of the arguments and return value.
+
+    """
+    records = [versus_record(ai1, ai2, seed, max_moves)
+               for seed in range(first_seed, first_seed + n_games)
+               for ai1, ai2 in combinations(ai_names, 2)]
+    return play_records(store, records, _play_versus_worker, processes,
+                        callback)
+
+
+def compare_solo(record1, record2):
+    """Return 1 if `record1` beat `record2`, -1 if it lost, 0 for a draw."""
+    if record1["game_over"] != record2["game_over"]:
+        return -1 if record1["game_over"] else 1
+    return cmp(record1["score"], record2["score"])
+
+
+class Standings(object):
+    """Win/loss records and score statistics from a tournament."""
+
+    def __init__(self, ai_names):
+        self.ai_names = list(ai_names)
+        self.scores = dict((name, []) for name in self.ai_names)
+        # (ai, opponent) -> [wins, losses, draws]
+        self.pairs = dict(((a, b), [0, 0, 0]) for a in self.ai_names
+                                              for b in self.ai_names if a != b)
+
+    def add_game(self, ai1, ai2, outcome):
+        """Count a game between `ai1` and `ai2`.
+
+        `outcome` is 1 if `ai1` won, -1 if it lost and 0 for a draw.
+
+        """
+        index = {1: 0, -1: 1, 0: 2}
+        self.pairs[(ai1, ai2)][index[outcome]] += 1
+        self.pairs[(ai2, ai1)][index[-outcome]] += 1
+
+    def win_rate(self, ai, opponent=None):
+        """Return `(rate, low, high)` for `ai`, counting draws as half a win.
+
+        If `opponent` is None, games against every opponent are counted.
+
+        """
+        opponents = [opponent] if opponent else \
+                    [name for name in self.ai_names if name != ai]
+        wins = losses = draws = 0
+        for name in opponents:
+            w, l, d = self.pairs[(ai, name)]
+            wins += w
+            losses += l
+            draws += d
+        n = wins + losses + draws
+        rate = (wins + draws/2) / n if n else 0.0
+        low, high = wilson_interval(wins + draws/2, n)
+        return rate, low, high
+
+    def format(self):
+        lines = ["{:<16} {:>6} {:>24} {:>26} {:>8}".format(
+                 "ai", "games", "win rate (95% CI)", "mean score (95% CI)",
+                 "max")]
+        ranked = sorted(self.ai_names, key=lambda name: -self.win_rate(name)[0])
+        for name in ranked:
+            scores = self.scores[name]
+            rate, low, high = self.win_rate(name)
+            mean, mean_low, mean_high = mean_interval(scores)
+            lines.append("{:<16} {:>6} {:>24} {:>26} {:>8}".format(
+                name, len(scores),
+                "{:.1%} ({:.1%}-{:.1%})".format(rate, low, high),
+                "{:.0f} ({:.0f}-{:.0f})".format(mean, mean_low, mean_high),
+                max(scores) if scores else 0))
+
+        lines.append("")
+        lines.append("Head to head (row's win rate against column):")
+        lines.append(" "*16 + "".join("{:>18}".format(name[:16])
+                                      for name in ranked))
+        for name in ranked:
+            cells = []
+            for opponent in ranked:
+                if opponent == name:
+                    cells.append("{:>18}".format("-"))
+                else:
+                    rate, low, high = self.win_rate(name, opponent)
+                    cells.append("{:>18}".format(
+                        "{:.0%} ({:.0%}-{:.0%})".format(rate, low, high)))
+            lines.append("{:<16}".format(name[:15]) + "".join(cells))
+        return "\n".join(lines)
+
+def solo_standings(store, ai_names, seeds, nuisance_probability=0,
+                   max_moves=simulation.DEFAULT_MAX_MOVES):
+    """Return `Standings` from the solo games in `store`.
+
+    Only seeds that every AI in `ai_names` has played are compared.
+
+    """
+    standings = Standings(ai_names)
+    for seed in seeds:
+        records = {}
+        for ai_name in ai_names:
+            record = store.get(solo_record(ai_name, seed,
+                                           nuisance_probability, max_moves))
+            if record is not None:
+                records[ai_name] = record
+        if len(records) != len(ai_names):
+            continue
+
+        for ai_name, record in records.items():
+            standings.scores[ai_name].append(record["score"])
+        for ai1, ai2 in combinations(ai_names, 2):
+            standings.add_game(ai1, ai2,
+                               compare_solo(records[ai1], records[ai2]))
+    return standings
+
+def versus_standings(store, ai_names, seeds,
+                     max_moves=simulation.DEFAULT_MAX_MOVES):
+    """Return `Standings` from the versus matches in `store`."""
+    standings = Standings(ai_names)
+    for seed in seeds:
+        for ai1, ai2 in combinations(ai_names, 2):
+            record = store.get(versus_record(ai1, ai2, seed, max_moves))
+            if record is None:
+                continue
+            standings.scores[ai1].append(record["scores"][0])
+            standings.scores[ai2].append(record["scores"][1])
+            outcome = {0: 1, 1: -1, None: 0}[record["winner"]]
+            standings.add_game(ai1, ai2, outcome)
+    return standings
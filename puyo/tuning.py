@@ -0,0 +1,189 @@
+"""Tuning `SimpleComboAI` weights by self-play.
+
+A simple evolution strategy is used. Each generation, candidate weights are
+sampled around the current mean, and each candidate plays the same seeded
+games (see `puyo.simulation`). The mean of the best candidates becomes the
+next mean, and the sampling step size grows when more than a fifth of the
+candidates beat the current mean and shrinks otherwise.
+
+Fitness is the mean score of a candidate's games. Games are capped at a
+maximum number of moves, so AIs that lose early score less.
+
+The state of the search is a JSON serializable dict, so it can be saved as a
+checkpoint after each generation and resumed later. Each generation's random
+numbers only depend on the seed and the generation number, so a resumed
+search continues exactly as if it hadn't stopped.
+
+"""
+from __future__ import division
+import os
+import json
+import random
+import multiprocessing
+from time import time
+
+from puyo.ai import SimpleComboAI
+from puyo import simulation
+
+TUNED_WEIGHTS = ("potential_chain", "single_chain", "chain", "connected",
+                 "danger_fill", "danger_chain")
+
+# Sampling step size of each weight when `sigma` is 1.
+WEIGHT_SCALES = {
+    "potential_chain": 0.5,
+    "single_chain": 0.5,
+    "chain": 1.0,
+    "connected": 0.5,
+    "danger_fill": 8.0,
+    "danger_chain": 2.0,
+}
+
+SUCCESS_RATE = 1 / 5
+SIGMA_INCREASE = 1.2
+SIGMA_DECREASE = 0.85
+
+
+def initial_state(seed=0, population_size=12, n_games=8,
+                  max_moves=simulation.DEFAULT_MAX_MOVES, sigma=1.0):
+    """Return the state of a search that hasn't started yet."""
+    return {
+        "seed": seed,
+        "population_size": population_size,
+        "n_games": n_games,
+        "max_moves": max_moves,
+        "generation": 0,
+        "sigma": sigma,
+        "mean": dict((name, SimpleComboAI.DEFAULT_WEIGHTS[name])
+                     for name in TUNED_WEIGHTS),
+        "history": [],
+    }
+
+def load_checkpoint(filename):
+    """Return the state saved in `filename`, or None if it doesn't exist."""
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except IOError:
+        return None
+
+def save_checkpoint(state, filename):
+    # Write to a temporary file first, so an interrupted write doesn't
+    # destroy the previous checkpoint.
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True,
+                  separators=(",", ": "))
+    os.rename(tmp_filename, filename)
+
+def export_weights(state, filename):
+    """Write the mean weights of `state` in the format `TunedComboAI` reads."""
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    history = state["history"]
+    with open(filename, "w") as f:
+        json.dump({
+            "weights": state["mean"],
+            "generation": state["generation"],
+            "fitness": history[-1]["mean_fitness"] if history else None,
+        }, f, indent=2, sort_keys=True, separators=(",", ": "))
+        f.write("\n")
+
+def sample_candidates(state):
+    """Return the candidate weights for the current generation.
+
+    The first candidate is the mean itself, so it can be compared against
+    the others on the same games.
+
+    """
+    rng = random.Random(state["seed"] * 1000003 + state["generation"])
+    candidates = [dict(state["mean"])]
+    for i in range(state["population_size"] - 1):
+        candidates.append(dict(
+            (name, value + rng.gauss(0, 1) * state["sigma"] *
+                   WEIGHT_SCALES[name])
+            for name, value in state["mean"].items()))
+    return candidates
+
+def generation_seeds(state):
+    first = state["seed"] + state["generation"] * state["n_games"]
+    return range(first, first + state["n_games"])
+
+def _evaluate_worker(args):
+    weights, seed, max_moves = args
+    return simulation.play_game(SimpleComboAI(weights), seed,
+                                max_moves=max_moves).score
+
+def evaluate(candidates, seeds, max_moves, pool=None):
+    """Return the fitness of each candidate: its mean score on `seeds`."""
+    tasks = [(weights, seed, max_moves) for weights in candidates
+                                        for seed in seeds]
+    if pool is None:
+        scores = map(_evaluate_worker, tasks)
+    else:
+        scores = pool.map(_evaluate_worker, tasks, chunksize=1)
+    n = len(seeds)
+    return [sum(scores[i*n:(i+1)*n]) / n for i in range(len(candidates))]
+
+def step(state, pool=None):
+    """Run one generation, updating `state`. Return the new history entry."""
+    candidates = sample_candidates(state)
+    seeds = generation_seeds(state)
+    start = time()
+    fitnesses = evaluate(candidates, seeds, state["max_moves"], pool)
+    duration = time() - start
+
+    # Best first. Ties go to the earlier candidate, so the mean is only
+    # replaced by candidates that actually did better.
+    ranked = sorted(range(len(candidates)),
+                    key=lambda i: (-fitnesses[i], i))
+    n_parents = max(1, len(candidates) // 4)
+    parents = [candidates[i] for i in ranked[:n_parents]]
+    new_mean = dict((name, sum(p[name] for p in parents) / n_parents)
+                    for name in state["mean"])
+
+    # The 1/5 success rule: widen the search if more than a fifth of the
+    # samples beat the mean, otherwise narrow it.
+    best = ranked[0]
+    n_better = sum(1 for fitness in fitnesses[1:] if fitness > fitnesses[0])
+    if n_better > SUCCESS_RATE * (len(candidates) - 1):
+        state["sigma"] *= SIGMA_INCREASE
+    else:
+        state["sigma"] *= SIGMA_DECREASE
+
+    n_games = len(candidates) * len(seeds)
+    entry = {
+        "generation": state["generation"],
+        "mean_fitness": fitnesses[0],
+        "best_fitness": fitnesses[best],
+        "best_weights": candidates[best],
+        "n_games": n_games,
+        "duration": duration,
+        "games_per_second": n_games / duration if duration else 0.0,
+    }
+    state["history"].append(entry)
+    state["mean"] = new_mean
+    state["generation"] += 1
+    return entry
+
+def tune(state, n_generations, checkpoint_filename=None, processes=None,
+         callback=None):
+    """Run generations until `state` has done `n_generations`.
+
+    `state` is saved to `checkpoint_filename` after each generation if given.
+    `callback`, if given, is called with each new history entry.
+
+    """
+    pool = None if processes == 1 else multiprocessing.Pool(processes)
+    try:
+        while state["generation"] < n_generations:
+            entry = step(state, pool)
+            if checkpoint_filename:
+                save_checkpoint(state, checkpoint_filename)
+            if callback is not None:
+                callback(entry)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return state
@@ -0,0 +1,252 @@
+"""A learned board evaluation function.
+
+`ValueModel` predicts how many points a board is worth from now on, from a
+small set of features computed by `board_features()`. Both work on whole
+batches of boards at once, so evaluating every leaf of a search is a few
+array operations and one matrix multiply per layer, instead of a Python
+loop over each board.
+
+The model is either linear (no hidden layers) or a small multilayer
+perceptron with ReLU hidden layers. It is trained from self-play by
+"train_value.py" and stored as a ".npz" file.
+
+"""
+from __future__ import division
+import random
+
+import numpy
+
+EMPTY = ord(b' ')
+NUISANCE = ord(b'k')
+
+N_FEATURES = 17
+
+# Games are scored for training with this discount per move, and game overs
+# count as this many points lost.
+DISCOUNT = 0.9
+GAME_OVER_PENALTY = 5000
+
+
+def board_features(cells):
+    """Return an (n, `N_FEATURES`) float array of features of each board.
+
+    `cells` is an (n, 6, 12) uint8 array of boards, like the ones returned by
+    `Board.get_uint8_array()`. Boards are assumed to be at rest.
+
+    """
+    cells = numpy.asarray(cells, dtype=numpy.uint8)
+    n = cells.shape[0]
+    filled = cells != EMPTY
+    colored = filled & (cells != NUISANCE)
+    heights = filled.sum(axis=2)
+
+    # Same colored neighbors
+    horizontal = colored[:,:-1,:] & (cells[:,:-1,:] == cells[:,1:,:])
+    vertical = colored[:,:,:-1] & (cells[:,:,:-1] == cells[:,:,1:])
+    neighbors = numpy.zeros(cells.shape, dtype=numpy.int8)
+    neighbors[:,:-1,:] += horizontal
+    neighbors[:,1:,:] += horizontal
+    neighbors[:,:,:-1] += vertical
+    neighbors[:,:,1:] += vertical
+    neighbors = numpy.minimum(neighbors, 3)
+
+    features = numpy.empty((n, N_FEATURES))
+    features[:,0] = filled.sum(axis=(1, 2)) / 72
+    features[:,1:7] = heights / 12
+    features[:,7] = heights.max(axis=1) / 12
+    features[:,8] = numpy.abs(numpy.diff(heights, axis=1)).sum(axis=1) / 60
+    features[:,9] = horizontal.sum(axis=(1, 2)) / 60
+    features[:,10] = vertical.sum(axis=(1, 2)) / 66
+    features[:,11] = (cells == NUISANCE).sum(axis=(1, 2)) / 72
+    for i in range(4):
+        features[:,12+i] = ((neighbors == i) & colored).sum(axis=(1, 2)) / 72
+    features[:,16] = heights[:,2] >= 10
+    return features
+
+
+class ValueModel(object):
+    """Predicts the future points of boards from their features.
+
+    Attributes:
+        layers: List of `(weights, biases)` arrays. Every layer but the last
+            is followed by a ReLU. The last layer has a single output.
+        mean, std: Features are normalized with these before the first layer.
+        scale: The output is multiplied by this to get points.
+
+    """
+
+    def __init__(self, layers, mean, std, scale):
+        self.layers = layers
+        self.mean = mean
+        self.std = std
+        self.scale = scale
+
+    def predict(self, features):
+        x = (features - self.mean) / self.std
+        for weights, biases in self.layers[:-1]:
+            x = numpy.maximum(x.dot(weights) + biases, 0)
+        weights, biases = self.layers[-1]
+        return (x.dot(weights) + biases)[:,0] * self.scale
+
+    def evaluate(self, cells):
+        """Return the predicted points of each board in `cells`.
+
+        See `board_features()` for the format of `cells`.
+
+        """
+        return self.predict(board_features(cells))
+
+    def save(self, filename):
+        arrays = {"mean": self.mean, "std": self.std,
+                  "scale": numpy.array(self.scale)}
+        for i, (weights, biases) in enumerate(self.layers):
+            arrays["weights{}".format(i)] = weights.astype(numpy.float32)
+            arrays["biases{}".format(i)] = biases.astype(numpy.float32)
+        numpy.savez_compressed(filename, **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        arrays = numpy.load(filename)
+        layers = []
+        for i in range(len(arrays.files)):
+            if "weights{}".format(i) not in arrays.files:
+                break
+            layers.append((arrays["weights{}".format(i)],
+                           arrays["biases{}".format(i)]))
+        return cls(layers, arrays["mean"], arrays["std"],
+                   float(arrays["scale"]))
+
+
+# Models already loaded by `get_model()`, by filename.
+_model_cache = {}
+
+def get_model(filename):
+    """Return the model stored at `filename`, only loading it once per
+    process."""
+    model = _model_cache.get(filename)
+    if model is None:
+        model = ValueModel.load(filename)
+        _model_cache[filename] = model
+    return model
+
+
+def discounted_returns(scores, game_over, discount=DISCOUNT,
+                       game_over_penalty=GAME_OVER_PENALTY):
+    """Return the training target for the board after each move of a game.
+
+    `scores` are the points scored by each move. The target for the board
+    after move `i` is the discounted sum of the points scored by the moves
+    after it, minus `game_over_penalty` if the game ended in a game over.
+
+    """
+    targets = numpy.empty(len(scores))
+    future = -game_over_penalty if game_over else 0
+    for i in reversed(range(len(scores))):
+        targets[i] = future
+        future = scores[i] + discount * future
+    return targets
+
+def fit(features, targets, hidden=(32,), epochs=40, batch_size=256,
+        learning_rate=0.003, seed=0):
+    """Train a `ValueModel` with mean squared error, using Adam.
+
+    Args:
+        features: (n, `N_FEATURES`) array, from `board_features()`.
+        targets: Array of n points to predict.
+        hidden: Size of each hidden layer. Empty for a linear model.
+
+    """
+    rng = numpy.random.RandomState(seed)
+    mean = features.mean(axis=0)
+    std = features.std(axis=0)
+    std[std == 0] = 1
+    scale = max(1.0, float(numpy.abs(targets).std()))
+    x_all = (features - mean) / std
+    y_all = targets / scale
+
+    sizes = [features.shape[1]] + list(hidden) + [1]
+    params = []
+    for n_in, n_out in zip(sizes[:-1], sizes[1:]):
+        params.append(rng.normal(0, numpy.sqrt(2 / n_in), (n_in, n_out)))
+        params.append(numpy.zeros(n_out))
+    moments = [numpy.zeros_like(p) for p in params]
+    velocities = [numpy.zeros_like(p) for p in params]
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    t = 0
+
+    for epoch in range(epochs):
+        order = rng.permutation(len(x_all))
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start+batch_size]
+            x = x_all[batch]
+            y = y_all[batch]
+
+            # Forward
+            activations = [x]
+            for i in range(0, len(params) - 2, 2):
+                x = numpy.maximum(x.dot(params[i]) + params[i+1], 0)
+                activations.append(x)
+            output = x.dot(params[-2]) + params[-1]
+
+            # Backward
+            grad = 2 * (output[:,0] - y)[:,None] / len(batch)
+            grads = [None] * len(params)
+            for i in reversed(range(0, len(params), 2)):
+                inputs = activations[i//2]
+                grads[i] = inputs.T.dot(grad)
+                grads[i+1] = grad.sum(axis=0)
+                if i:
+                    grad = grad.dot(params[i].T) * (inputs > 0)
+
+            t += 1
+            for p, g, m, v in zip(params, grads, moments, velocities):
+                m *= beta1
+                m += (1 - beta1) * g
+                v *= beta2
+                v += (1 - beta2) * g * g
+                m_hat = m / (1 - beta1**t)
+                v_hat = v / (1 - beta2**t)
+                p -= learning_rate * m_hat / (numpy.sqrt(v_hat) + epsilon)
+
+    layers = [(params[i], params[i+1]) for i in range(0, len(params), 2)]
+    return ValueModel(layers, mean, std, scale)
+
+
+class _ExploringAI(object):
+    """Makes a random move with probability `epsilon`, otherwise asks `ai`."""
+
+    def __init__(self, ai, epsilon):
+        self.ai = ai
+        self.epsilon = epsilon
+
+    def get_move(self, board, beans):
+        if random.uniform(0, 1) < self.epsilon:
+            return random.choice(list(board.iter_moves()))
+        return self.ai.get_move(board, beans)
+
+def self_play_data(ai, seed, epsilon=0.1, max_moves=200):
+    """Play a game and return `(cells, targets)` for training.
+
+    `cells` has the board after every move, in the format of
+    `board_features()`, and `targets` is from `discounted_returns()`. The
+    moves are made by `ai`, except for random ones with probability
+    `epsilon` so more kinds of boards are seen.
+
+    """
+    from puyo import simulation
+
+    boards = []
+    scores = []
+    def record(board, combo):
+        boards.append(board.get_uint8_array().copy())
+        scores.append(combo.score)
+    result = simulation.play_game(_ExploringAI(ai, epsilon), seed,
+                                  max_moves=max_moves, on_move=record)
+
+    cells = numpy.array(boards, dtype=numpy.uint8).reshape((-1, 6, 12))
+    targets = discounted_returns(scores, result.game_over)
+    # The last board of a game over isn't a board anyone will play from
+    if result.game_over:
+        cells = cells[:-1]
+        targets = targets[:-1]
+    return cells, targets
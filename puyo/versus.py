@@ -0,0 +1,186 @@
+"""Headless simulation of two AIs playing a versus match.
+
+Both players get the same bean sequence, as in the game. Each player's
+chains send nuisance beans to the other, following the usual rules:
+
+ * Every `NUISANCE_TARGET_POINTS` points of a chain's score is one nuisance
+   bean. Leftover points carry over to the player's next chain.
+ * Nuisance generated by a chain first cancels nuisance waiting to fall on
+   the player's own board (offsetting). Whatever is left is sent.
+ * Nuisance sent to a player falls after their next move that doesn't start
+   a chain, at most `MAX_NUISANCE_PER_DROP` at a time.
+
+Each player has their own clock, advanced by how long their moves take
+according to `puyo.timing`. Moves are simulated in order of time, so
+nuisance arrives when it would in a real match. Nuisance can't fall on a
+player before the chain that sends it has finished.
+
+A player loses when the spawn point of new beans is blocked.
+
+"""
+from __future__ import division
+import random
+from collections import namedtuple
+
+import puyo
+from puyo import timing
+from puyo.simulation import random_next_beans, is_game_over, \
+        DEFAULT_MAX_MOVES
+
+NUISANCE_TARGET_POINTS = 70
+MAX_NUISANCE_PER_DROP = 30
+
+# The result of a versus match.
+#
+# Items:
+#   seed: The seed the match was played with.
+#   winner: Index of the winning player, 0 or 1, or None if the match was
+#       stopped after the maximum number of moves.
+#   scores: Tuple with each player's total score.
+#   n_moves: Tuple with the number of moves each player made.
+#   nuisance_sent: Tuple with the number of nuisance beans each player sent,
+#       after offsetting.
+#   max_chains: Tuple with the length of each player's longest chain.
+#   game_time: Simulated time the match took, in seconds.
+VersusResult = namedtuple("VersusResult",
+    "seed winner scores n_moves nuisance_sent max_chains game_time")
+
+
+class BeanSequence(object):
+    """The sequence of bean pairs, shared by both players."""
+
+    def __init__(self, seed):
+        self._rng = random.Random(seed)
+        self._pairs = []
+
+    def __getitem__(self, i):
+        while len(self._pairs) <= i:
+            self._pairs.append(random_next_beans(self._rng))
+        return self._pairs[i]
+
+
+class VersusPlayer(object):
+    """State of one side of a versus match."""
+
+    def __init__(self, ai):
+        self.ai = ai
+        self.board = puyo.Board()
+        self.time = 0.0  # When the next pair appears
+        self.n_moves = 0
+        self.score = 0
+        self.leftover_points = 0
+        self.nuisance_sent = 0
+        self.max_chain = 0
+        self.lost = False
+        # Nuisance sent to this player, as [time it can fall, n] lists, in
+        # order of time.
+        self.incoming = []
+
+    def pending_nuisance(self):
+        return sum(n for t, n in self.incoming)
+
+    def offset(self, n):
+        """Cancel up to `n` incoming nuisance, oldest first. Return what's
+        left of `n`."""
+        while n and self.incoming:
+            cancelled = min(n, self.incoming[0][1])
+            n -= cancelled
+            self.incoming[0][1] -= cancelled
+            if not self.incoming[0][1]:
+                self.incoming.pop(0)
+        return n
+
+    def take_nuisance(self, t):
+        """Remove and return how many nuisance beans fall at time `t`."""
+        n = 0
+        while self.incoming and self.incoming[0][0] <= t and \
+                n < MAX_NUISANCE_PER_DROP:
+            taken = min(MAX_NUISANCE_PER_DROP - n, self.incoming[0][1])
+            n += taken
+            self.incoming[0][1] -= taken
+            if not self.incoming[0][1]:
+                self.incoming.pop(0)
+        return n
+
+
+def nuisance_for_score(score, leftover_points=0):
+    """Return `(n_nuisance, leftover_points)` for a chain's score."""
+    return divmod(score + leftover_points, NUISANCE_TARGET_POINTS)
+
+def _make_move(player, opponent, beans):
+    """Have `player` make its next move. Return False if it lost."""
+    board = player.board
+    position, rotation = player.ai.get_move(board.copy(), beans)
+    player.n_moves += 1
+    n_rows = 0
+    if board.can_make_move(position, rotation):
+        n_rows = timing.drop_rows(board, position, rotation)
+    combo = board.make_move(beans, position, rotation)
+    if combo is False or combo.game_over:
+        return False
+
+    t = player.time + timing.steer_time(position, rotation) + \
+        timing.drop_time(n_rows)
+    n_nuisance = 0
+    if combo.length:
+        t += timing.chain_time(combo.length)
+        player.score += combo.score
+        player.max_chain = max(player.max_chain, combo.length)
+        n_sent, player.leftover_points = nuisance_for_score(
+                combo.score, player.leftover_points)
+        n_sent = player.offset(n_sent)
+        if n_sent:
+            opponent.incoming.append([t, n_sent])
+            player.nuisance_sent += n_sent
+    else:
+        n_nuisance = player.take_nuisance(t)
+        if n_nuisance:
+            board.drop_nuisance(n_nuisance)
+            t += timing.NUISANCE_FALL_TIME
+
+    player.time = t + timing.SPAWN_TIME
+    return not is_game_over(board)
+
+def play_match(ai1, ai2, seed, max_moves=DEFAULT_MAX_MOVES):
+    """Play a versus match between two AI instances.
+
+    Args:
+        ai1, ai2: `AI` instances for players 0 and 1.
+        seed: Integer that determines the bean sequence. The global `random`
+            module is also seeded with it, since the AIs and
+            `Board.drop_nuisance()` use it.
+        max_moves: Stop the match when both players have made this many
+            moves.
+
+    Returns: A `VersusResult`.
+
+    """
+    random.seed(seed)
+    sequence = BeanSequence(seed)
+    players = (VersusPlayer(ai1), VersusPlayer(ai2))
+
+    winner = None
+    while True:
+        # Whoever's next pair appears first moves next
+        i = 0 if players[0].time <= players[1].time else 1
+        player, opponent = players[i], players[1-i]
+        if player.n_moves >= max_moves:
+            if opponent.n_moves >= max_moves:
+                break
+            i = 1 - i
+            player, opponent = opponent, player
+
+        player.board.next_beans = sequence[player.n_moves + 1]
+        if not _make_move(player, opponent, sequence[player.n_moves]):
+            player.lost = True
+            winner = 1 - i
+            break
+
+    return VersusResult(
+        seed, winner,
+        tuple(p.score for p in players),
+        tuple(p.n_moves for p in players),
+        tuple(p.nuisance_sent for p in players),
+        tuple(p.max_chain for p in players),
+        max(p.time for p in players),
+    )
@@ -1,13 +1,31 @@
 
 from collections import namedtuple
 from time import time
-from itertools import product
 
-from puyo import BeanFinder
+import numpy
+
+from puyo import BeanFinder, DualBeanFinder
+from puyo import timing
+from puyo.calibration import DEFAULT_SCREEN_OFFSET
 
 
 MIN_NEW_MOVE_WAIT_TIME = 0.3
 
+# While the board is predicted to be animating after a move, only one frame
+# in this many seconds needs to be recognized. Full rate recognition resumes
+# this long before the board is predicted to settle. See
+# `Vision.predict_move()`.
+SKIPPED_FRAME_INTERVAL = 0.2
+SETTLE_MARGIN = 0.15
+
+EMPTY = ord(b' ')
+
+# Cells that may be filled with an empty cell below them when a board is at
+# rest, indexed [x, y-1] for y in 1 to 11. The falling pair appears at the top
+# of the third column.
+FLOATING_ALLOWED = numpy.zeros((6, 11), dtype=bool)
+FLOATING_ALLOWED[2, 9:11] = True
+
 
 # The state of a single player's half of the game.
 #
@@ -27,7 +45,8 @@ class Vision(object):
 
     """
 
-    def __init__(self, bean_finder=None, player=None, timing_scheme="absolute"):
+    def __init__(self, bean_finder=None, player=None, timing_scheme="absolute",
+                 screen_offset=None, field=None, clock=time):
         """
         Args:
             bean_finder: A `BeanFinder` instance, or None if one should be
@@ -38,35 +57,91 @@ class Vision(object):
             timing_scheme: "relative" or "absolute". If "relative", `dt` must
                 be given to each call of `get_state`, otherwise `dt` cannot be
                 given.
+            screen_offset: If `bean_finder` is None, the screen offset to
+                construct the `BeanFinder` with. Defaults to
+                `DEFAULT_SCREEN_OFFSET`. See `puyo.calibration`.
+            field: If `bean_finder` is None, which field of the interlaced
+                video to recognize. See `BeanFinder`.
+            clock: Function returning the current time, used with the
+                "absolute" timing scheme. Defaults to `time.time()`.
         """
         if bean_finder is None:
             assert player in (None, 1, 2)
             if player is None:
                 player = 1
-            bean_finder = BeanFinder((38, 13), player)
+            if screen_offset is None:
+                screen_offset = DEFAULT_SCREEN_OFFSET
+            bean_finder = BeanFinder(screen_offset, player, field)
         else:
-            assert player is None
+            assert player is None and screen_offset is None and field is None
         self.bean_finder = bean_finder
+        self.clock = clock
 
         if timing_scheme == "relative":
             self.relative_timing = True
-            self.prev_time = float('-inf')
-            self.current_time = 0
         elif timing_scheme == "absolute":
             self.relative_timing = False
-            self.prev_time = float('-inf')
-            self.current_time = float('-inf')
         else:
             raise ValueError('`timing_scheme` must be "relative" or "absolute"')
 
+        self.reset()
+
+    def reset(self):
+        """Forget everything seen so far, as if no frames had been given.
+
+        Use this when a new match starts. The `BeanFinder` is kept, so this is
+        much cheaper than creating a new `Vision` instance.
+
+        """
+        self.prev_time = float('-inf')
+        if self.relative_timing:
+            self.current_time = 0
+        else:
+            self.current_time = float('-inf')
+
         self.old_board = None  # Board from the previous frame
         self.next_beans = None  # Beans next to fall
         self.current_beans = None  # Beans currently falling
         self.beans_falling = False
         self.last_new_move_time = float('-inf')
         self.frames_since_last_new_move = 0
+        self.settle_time = float('-inf')
+        self.last_wanted_frame_time = float('-inf')
 
-    def get_state(self, img, dt=None):
+    def predict_move(self, board, beans, move, start_time):
+        """Predict when the board settles after a move is made.
+
+        Until shortly before then, `wants_frame()` only asks for a few frames,
+        since the board is animating and nothing about it can be decided.
+        The timing model in `puyo.timing` and the chain the move causes on
+        `board` are used for the prediction.
+
+        Args:
+            board, beans: The board and current beans the move is made with.
+            move: The `(position, rotation)` being made.
+            start_time: When the pair appeared, in the same clock as the
+                timestamps given to `wants_frame()`.
+
+        """
+        self.settle_time = start_time + \
+                           timing.settle_time(board, beans, *move)
+
+    def wants_frame(self, timestamp):
+        """Return False if the frame captured at `timestamp` can be skipped.
+
+        Every frame is wanted unless the board is animating after a move
+        given to `predict_move()`. Call this once for each frame, before
+        deciding whether to call `get_state()` with it.
+
+        """
+        if timestamp < self.settle_time - SETTLE_MARGIN and \
+                timestamp - self.last_wanted_frame_time < \
+                SKIPPED_FRAME_INTERVAL:
+            return False
+        self.last_wanted_frame_time = timestamp
+        return True
+
+    def get_state(self, img, dt=None, board=None):
         """Return a PlayerState object representing the current player state.
 
         Args:
@@ -75,6 +150,9 @@ class Vision(object):
                 `set_state`. If `timing_scheme` was set to "absolute" this
                 parameter cannot be used. If `timing_scheme is "relative", it
                 must be used.
+            board: The Board already recognized from `img`, for example by a
+                `DualBeanFinder`. If None (default), `bean_finder` is used to
+                recognize it.
 
         Returns: PlayerState object representing the state of the player's half
             of the game
@@ -85,9 +163,10 @@ class Vision(object):
             self.prev_time, self.current_time = self.current_time, self.current_time + dt
         else:
             assert dt is None
-            self.prev_time, self.current_time = self.current_time, time()
+            self.prev_time, self.current_time = self.current_time, self.clock()
 
-        board = self.bean_finder.get_board(img)
+        if board is None:
+            board = self.bean_finder.get_board(img)
 
         if self.next_beans is None:
             self.next_beans = board.next_beans
@@ -121,6 +200,8 @@ class Vision(object):
             self.last_new_move_time = self.current_time
             self.frames_since_last_new_move = 0
             self.old_board = board
+            # The board must have settled, whatever was predicted
+            self.settle_time = float('-inf')
         else:
             self.frames_since_last_new_move += 1
 
@@ -135,10 +216,10 @@ class Vision(object):
 
         # Ignore boards that are impossible at rest.
         # i.e. when there are blank spaces under a filled cell.
-        for x, y in product(range(6), range(1, 12)):
-            if not (x == 2 and (y == 11 or y == 10)):
-                if new_board[x][y] != b' ' and new_board[x][y-1] == b' ':
-                    return old_board, False
+        filled = new_board.get_uint8_array() != EMPTY
+        floating = filled[:,1:] & ~filled[:,:-1] & ~FLOATING_ALLOWED
+        if floating.any():
+            return old_board, False
 
         # If beans are still falling, wait until they're finished
         if self.beans_falling:
@@ -187,44 +268,82 @@ class Vision(object):
         return new_board, False
 
     def _finished_falling(self, old_board, new_board):
+        if self.current_beans is None:
+            return False
+        bean1, bean2 = [ord(bean) for bean in self.current_beans]
+        old = old_board.get_uint8_array()
+        new = new_board.get_uint8_array()
+        old_empty = old == EMPTY
+        xs = numpy.arange(6)
+
+        def is_current_pair(seen1, seen2):
+            return ((seen1 == bean1) & (seen2 == bean2)) | \
+                   ((seen1 == bean2) & (seen2 == bean1))
 
         # Top row
         # We only require one bean to be seen, since the other may be off the
         # top of the screen.
-        for x in range(6):
-            if old_board[x][11] == b' ' and \
-                old_board[x][10] != b' ' and \
-                new_board[x][11] in self.current_beans:
-
-                    return True
-
-        bottom_indexes = []  # Lowest point not filled in each column
-        for x in range(6):
-            bottom_index_found = False
-            for y in range(12):
-                if old_board[x][y] == b' ':
-                    bottom_indexes.append(y)
-                    bottom_index_found = True
-                    break
-            if not bottom_index_found:
-                bottom_indexes.append(12)
+        new_top_is_current = (new[:,11] == bean1) | (new[:,11] == bean2)
+        if (old_empty[:,11] & ~old_empty[:,10] & new_top_is_current).any():
+            return True
+
+        # Lowest point not filled in each column, or 12 if the column is full
+        bottom_indexes = numpy.where(old_empty.any(axis=1),
+                                     old_empty.argmax(axis=1), 12)
 
         # Vertically oriented
-        for x, bot_idx in enumerate(bottom_indexes):
-            if bot_idx >= 11:
-                continue
-            seen1 = new_board[x][bot_idx  ]
-            seen2 = new_board[x][bot_idx+1]
-            if self.current_beans in ((seen1, seen2), (seen2, seen1)):
-                return True
+        lower = numpy.minimum(bottom_indexes, 10)
+        vertical = is_current_pair(new[xs, lower], new[xs, lower+1])
+        if (vertical & (bottom_indexes < 11)).any():
+            return True
 
         # Horizontally oriented
-        for x in range(5):
-            if bottom_indexes[x] == 12 or bottom_indexes[x+1] == 12:
-                continue
-            seen1 = new_board[x  ][bottom_indexes[x  ]]
-            seen2 = new_board[x+1][bottom_indexes[x+1]]
-            if self.current_beans in ((seen1, seen2), (seen2, seen1)):
-                return True
+        not_full = bottom_indexes < 12
+        seen = new[xs, numpy.minimum(bottom_indexes, 11)]
+        horizontal = is_current_pair(seen[:-1], seen[1:])
+        if (horizontal & not_full[:-1] & not_full[1:]).any():
+            return True
 
         return False
+
+class DualVision(object):
+    """Keeps track of the game state of both players over time.
+
+    Both boards are recognized in a single pass with a `DualBeanFinder`, then
+    handed to a `Vision` instance for each player.
+
+    """
+
+    def __init__(self, bean_finder=None, timing_scheme="absolute",
+                 screen_offset=None, field=None):
+        """
+        Args:
+            bean_finder: A `DualBeanFinder` instance, or None if one should be
+                automatically created.
+            timing_scheme: Same as for `Vision`.
+            screen_offset: Same as for `Vision`.
+            field: Same as for `Vision`.
+        """
+        if bean_finder is None:
+            if screen_offset is None:
+                screen_offset = DEFAULT_SCREEN_OFFSET
+            bean_finder = DualBeanFinder(screen_offset, field)
+        self.bean_finder = bean_finder
+        self.visions = tuple(
+            Vision(bean_finder=player_bean_finder, timing_scheme=timing_scheme)
+            for player_bean_finder in bean_finder.bean_finders
+        )
+
+    def reset(self):
+        for vision in self.visions:
+            vision.reset()
+
+    def get_state(self, img, dt=None):
+        """Return a `(player1_state, player2_state)` tuple of PlayerStates.
+
+        Args are the same as `Vision.get_state`.
+
+        """
+        boards = self.bean_finder.get_boards(img)
+        return tuple(vision.get_state(img, dt, board)
+                     for vision, board in zip(self.visions, boards))
@@ -4,26 +4,11 @@ Recognizes and reconstructs a Puyo 1 board from a video stream.
 """
 
 import pickle
-import time
 
 import cv2
 
-from puyo import BeanFinder
-
-def open_video(source):
-    video = cv2.VideoCapture(source)
-
-    if not video.isOpened():
-        try:
-            integer = int(source)
-        except ValueError:
-            pass
-        else:
-            video = cv2.VideoCapture(integer)
-
-    if not video.isOpened():
-        return None
-    return video
+from puyo import BeanFinder, calibration
+from puyo.capture import LatestFrameCapture
 
 def main():
     import argparse
@@ -37,17 +22,35 @@ def main():
         "of the screen.")
     parser.add_argument("--output", "-o", default=None,
         help="Record list of (board, timestamp) tuples to a pickle file.")
+    parser.add_argument("--all-frames", "-a", dest="drop_frames",
+        default=True, action="store_false", help="Process every frame, even "
+        "if processing falls behind the video. Useful for video files. By "
+        "default, only the most recent frame is processed.")
+    parser.add_argument("--field", "-f", default=None,
+        type=lambda f: f if f == "alternate" else int(f),
+        choices=(0, 1, "alternate"), help="Only recognize one field of the "
+        "interlaced video: 0 (even rows), 1 (odd rows), or alternate between "
+        "them each frame. Default: use the whole frame.")
+    parser.add_argument("--calibration", "-c",
+        default=calibration.DEFAULT_CALIBRATION_FILE, help="File the screen "
+        "offset is saved to after calibration, and loaded from on later runs. "
+        "(default: {})".format(calibration.DEFAULT_CALIBRATION_FILE))
+    parser.add_argument("--recalibrate", default=False, action="store_true",
+        help="Find the screen offset from the video even if a saved "
+        "calibration exists.")
 
     args = parser.parse_args()
 
-    video = open_video(args.source)
-    if not video:
+    try:
+        video = LatestFrameCapture(args.source, args.drop_frames)
+    except RuntimeError:
         print("Cannot open video stream")
         import sys
         sys.exit(1)
 
-    #TODO: Make screen offset configurable
-    bean_finder = BeanFinder((38, 13), args.player)
+    screen_offset = calibration.calibrate(video, args.calibration,
+                                          args.recalibrate)
+    bean_finder = BeanFinder(screen_offset, args.player, args.field)
     cv2.namedWindow("Frame")
     cv2.namedWindow("Grid")
 
@@ -56,12 +59,13 @@ def main():
     start_time = None
     while True:
 
-        was_read, img = video.read()
-        if not was_read:
+        frame = video.read_frame()
+        if frame is None:
             print("Error: Could not read video frame!")
             if cv2.waitKey(-1) % 256:
                 break
             continue
+        img = frame.img
         cv2.imshow("Frame", img)
 
         board = bean_finder.get_board(img)
@@ -69,7 +73,7 @@ def main():
 
         # Append to board_data
         if args.output is not None:
-            t = time.time()
+            t = frame.timestamp
             if start_time is None:
                 start_time = t
             if last_board is not None and board == last_board:
@@ -84,6 +88,12 @@ def main():
 
         last_board = board
 
+    video.release()
+    print("Frames dropped: {} of {}".format(video.n_dropped, video.n_captured))
+    cache = bean_finder.cell_reader.cache
+    print("Classification cache hit rate: {:.1%} ({} entries)".format(
+          cache.hit_rate, len(cache)))
+
     if args.output is not None:
         pickle.dump(board_data, open(args.output, 'wb'))
 
@@ -4,11 +4,12 @@ Play Puyo Puyo by taking video input and sending commands to an Arduino based
 Gamecube controller.
 """
 
-from time import sleep
-
-import cv2
+import signal
 
 import puyo
+from puyo import calibration
+from puyo.ai import OpeningBookAI
+from puyo.capture import LatestFrameCapture
 
 
 
@@ -26,6 +27,9 @@ def main():
     parser.add_argument("-a", "--ai", choices=ai_names,
         default=puyo.DEFAULT_AI_NAME, help="AI to use. Choose one of: {} "
         "(default: {})".format(ai_names, puyo.DEFAULT_AI_NAME))
+    parser.add_argument("--opening-book", "-b", default=None,
+        help="Opening book file, made by \"build_opening_book.py\". Moves "
+        "found in it are made without asking the AI.")
     parser.add_argument("--player2", "-2", dest="player", const=2,
         action="store_const", help="Play as player 2. Plays on the right side "
         "of the screen.")
@@ -42,17 +46,73 @@ def main():
             "scenario level, specified by --level (-l).")
     parser.add_argument("--debug", "-d", default=False, action="store_true",
         help="Show debug window and other debug information.")
+    parser.add_argument("--pipelined", "-p", default=False,
+        action="store_true", help="Run vision, AI and controller "
+        "concurrently in separate threads.")
+    parser.add_argument("--skip-frames", "-s", default=False,
+        action="store_true", help="Only recognize a few frames while the "
+        "board is animating after each move, until shortly before it's "
+        "predicted to settle.")
+    parser.add_argument("--async-controller", default=False,
+        action="store_true", help="Send commands to the Arduino from a "
+        "background thread, waiting for it to acknowledge each one. Needs "
+        "firmware that sends acknowledgements.")
+    parser.add_argument("--calibration", "-c",
+        default=calibration.DEFAULT_CALIBRATION_FILE, help="File the screen "
+        "offset is saved to after calibration, and loaded from on later runs. "
+        "(default: {})".format(calibration.DEFAULT_CALIBRATION_FILE))
+    parser.add_argument("--recalibrate", default=False, action="store_true",
+        help="Find the screen offset from the video even if a saved "
+        "calibration exists.")
+    parser.add_argument("--field", "-f", default=None,
+        type=lambda f: f if f == "alternate" else int(f),
+        choices=(0, 1, "alternate"), help="Only recognize one field of the "
+        "interlaced video: 0 (even rows), 1 (odd rows), or alternate between "
+        "them each frame. Default: use the whole frame.")
+    parser.add_argument("--latency-log", default=None,
+        help="File to append latency statistics to when exiting or when "
+        "SIGUSR1 is received. Default: print them to stdout.")
     args = parser.parse_args()
 
-    #TODO: Make screen offset configurable
-    controller = puyo.GamecubeController(args.gc_dev)
-    driver = puyo.Driver(controller, args.ai, args.player, debug=args.debug)
+    video = LatestFrameCapture(args.video)
+    screen_offset = calibration.calibrate(video, args.calibration,
+                                          args.recalibrate)
+
+    ai = puyo.AI_REGISTRY[args.ai]()
+    if args.opening_book:
+        ai = OpeningBookAI(ai, args.opening_book)
+
+    if args.async_controller:
+        controller = puyo.AsyncGamecubeController(args.gc_dev)
+    else:
+        controller = puyo.GamecubeController(args.gc_dev)
+    driver = puyo.Driver(controller, ai, args.player, debug=args.debug,
+                         pipelined=args.pipelined, screen_offset=screen_offset,
+                         field=args.field, skip_frames=args.skip_frames)
+
+    def dump_latency(*signal_args):
+        if args.latency_log is None:
+            driver.latency.dump()
+        else:
+            with open(args.latency_log, "a") as f:
+                driver.latency.dump(f)
+    signal.signal(signal.SIGUSR1, dump_latency)
+
+    try:
+        play(parser, args, driver, video)
+    finally:
+        dump_latency()
+        driver.close()
+        if args.async_controller:
+            controller.close()
+        video.release()
 
+def play(parser, args, driver, video):
     if args.level is not None:
         driver.reset_to_level(args.level)
 
     if args.mode == "scenario":
-        driver.run(args.video, video_out=args.video_out)
+        driver.run(video, video_out=args.video_out)
     elif args.mode == "repeat":
         if not args.level:
             parser.error("level argument must be given when mode is repeat")
@@ -60,7 +120,7 @@ def main():
         won = 0
         total = 0
         while True:
-            state = driver.run(args.video, video_out=args.video_out, on_special_state="exit", debug=args.debug)
+            state = driver.run(video, video_out=args.video_out, on_special_state="exit")
             if state.special_state == "unknown":
                 break  # Must have exited manually from debug mode
 
@@ -1,6 +1,10 @@
 #!/usr/bin/python
 """
 Simulates an AI playing the game.
+
+By default, one game is shown in a window and advances one move per keypress.
+With --headless, many complete games are played without a window, spread
+across all CPUs, and statistics are printed for each AI.
 """
 
 import random
@@ -8,13 +12,8 @@ import random
 import cv2
 
 import puyo
-
-
-def random_bean():
-    return random.choice((b'r', b'g', b'b', b'y', b'p'))
-
-def random_next_beans():
-    return (random_bean(), random_bean())
+from puyo import simulation
+from puyo.simulation import random_next_beans
 
 def print_combo(combo):
     if not combo.length:
@@ -30,19 +29,55 @@ def main():
     import argparse
     parser = argparse.ArgumentParser(description=__doc__)
     ai_names = list(puyo.AI_REGISTRY.keys())
-    parser.add_argument("-a", "--ai", choices=ai_names,
-        default=puyo.DEFAULT_AI_NAME, help="AI to run. Choose one of: {} "
-        "(default: {})".format(ai_names, puyo.DEFAULT_AI_NAME))
+    parser.add_argument("-a", "--ai", choices=ai_names, action="append",
+        dest="ais", help="AI to run. Choose one of: {} (default: {}). In "
+        "headless mode, may be given more than once to compare AIs.".format(
+        ai_names, puyo.DEFAULT_AI_NAME))
     parser.add_argument("-n", "--nuisance", type=float, default=0,
          dest="nuisance_probability", help="Probability (0-1) of a nuisance "
          "bean being dropped.")
+    parser.add_argument("--headless", action="store_true", default=False,
+        help="Play complete games without a window and print statistics.")
+    parser.add_argument("-g", "--games", type=int, default=100,
+        help="Number of games to play per AI in headless mode (default: "
+        "%(default)s).")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+        help="Seed of the first game in headless mode. Game i uses seed "
+        "SEED+i, so every AI gets the same bean sequences (default: "
+        "%(default)s).")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+        help="Number of processes to play games with in headless mode "
+        "(default: number of CPUs).")
+    parser.add_argument("--max-moves", type=int,
+        default=simulation.DEFAULT_MAX_MOVES, help="Stop games after this "
+        "many moves in headless mode (default: %(default)s).")
     args = parser.parse_args()
     if args.nuisance_probability < 0 or args.nuisance_probability > 1:
         parser.error("Nuisance probability (-n, --nuisance) must be between "
             "0 and 1.")
+    if not args.ais:
+        args.ais = [puyo.DEFAULT_AI_NAME]
+
+    if args.headless:
+        run_headless(args)
+    else:
+        if len(args.ais) > 1:
+            parser.error("Only one AI (-a, --ai) can be given without "
+                "--headless.")
+        run_interactive(args)
+
+def run_headless(args):
+    for ai_name in args.ais:
+        summary = simulation.simulate(ai_name, args.games,
+            first_seed=args.seed,
+            nuisance_probability=args.nuisance_probability,
+            max_moves=args.max_moves, processes=args.processes)
+        print summary.format()
+
+def run_interactive(args):
 
     board = puyo.Board(next_beans=random_next_beans())
-    ai = puyo.AI_REGISTRY[args.ai]()
+    ai = puyo.AI_REGISTRY[args.ais[0]]()
 
     print("Keys:")
     print("  Space: Make move")
@@ -0,0 +1,163 @@
+#!/usr/bin/python
+
+import unittest
+
+from puyo import arduino, timing
+from puyo.arduino import Firmware, PtyArduino, DEFAULT_STATE
+from puyo.gccontrol import GamecubeController, AsyncGamecubeController, \
+    encode_macro, ACK_RECEIVED, ACK_DONE
+
+
+def run_until_done(firmware, data, max_polls=1000):
+    """Send `data`, then poll until the firmware says it's done. Return the
+    state of each poll and everything written back."""
+    states = []
+    output = firmware.poll(data)
+    states.append(firmware.state)
+    while ACK_DONE not in output and len(states) < max_polls:
+        output += firmware.poll()
+        states.append(firmware.state)
+    return states, output
+
+def presses(states):
+    """Return the states, one per controller state instead of per poll."""
+    return states[::arduino.POLLS_PER_STATE]
+
+
+class TestFirmware(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = GamecubeController.__new__(GamecubeController)
+        self.controller.gc_dev = None
+
+    def test_move(self):
+        firmware = Firmware()
+        states, output = run_until_done(
+            firmware, self.controller.move_command(3, 1))
+        self.assertEqual(output, ACK_RECEIVED + ACK_DONE)
+        self.assertEqual(presses(states), [
+            frozenset(["right", "x"])] + [frozenset(["down"])] * 8 +
+            [DEFAULT_STATE, DEFAULT_STATE])
+        # Matches how long the rest of the code expects it to take
+        self.assertAlmostEqual((len(states) - 1) * arduino.POLL_TIME,
+                               timing.input_time(3, 1))
+
+        command, = firmware.commands
+        self.assertEqual(str(command), "move x=+1 rotation=1 down_fast")
+        self.assertAlmostEqual(command.done_time - command.received_time,
+                               timing.input_time(3, 1))
+
+    def test_move_with_releases(self):
+        firmware = Firmware()
+        states, output = run_until_done(
+            firmware, self.controller.move_command(0, 2, down_fast=False))
+        self.assertEqual(presses(states), [
+            frozenset(["left", "x"]), DEFAULT_STATE,
+            frozenset(["left", "x"]), DEFAULT_STATE, DEFAULT_STATE])
+
+    def test_button(self):
+        firmware = Firmware()
+        states, output = run_until_done(
+            firmware, self.controller.button_command("start"))
+        self.assertEqual(presses(states), [
+            frozenset(["start"]), DEFAULT_STATE, DEFAULT_STATE])
+
+    def test_macro(self):
+        log = []
+        firmware = Firmware(lambda t, message: log.append(message))
+        command, duration = encode_macro(
+            [("up", 0.2), ("up", 0.2), ("a", 0.5)],
+            GamecubeController.BUTTON_BITS)
+
+        # Split across polls, like a long command would be
+        firmware.poll(command[:2])
+        self.assertFalse(firmware.idle)
+        states, output = run_until_done(firmware, command[2:])
+        self.assertEqual(output, ACK_RECEIVED + ACK_DONE)
+        up = frozenset(["up"])
+        a = frozenset(["a"])
+        self.assertEqual(presses(states), [
+            DEFAULT_STATE, up, DEFAULT_STATE, DEFAULT_STATE, up,
+            DEFAULT_STATE, DEFAULT_STATE, a] + [DEFAULT_STATE] * 6)
+        self.assertTrue(firmware.idle)
+        self.assertEqual(log[0], "received macro [upx2/2 ax1/5]")
+        self.assertEqual(log[1], "done with 1 command(s)")
+
+    def test_replaced(self):
+        firmware = Firmware()
+        firmware.poll(self.controller.move_command(0, 0))
+        for i in range(10):
+            firmware.poll()
+        states, output = run_until_done(
+            firmware, self.controller.move_command(4, 0, down_fast=False))
+        self.assertEqual(presses(states), [
+            frozenset(["right"]), DEFAULT_STATE, frozenset(["right"]),
+            DEFAULT_STATE, DEFAULT_STATE])
+        self.assertEqual(output, ACK_RECEIVED + ACK_DONE)
+        first, second = firmware.commands
+        self.assertTrue(first.overlapped)
+        self.assertFalse(second.overlapped)
+        self.assertEqual(first.done_time, second.done_time)
+
+    def test_buffers_full(self):
+        firmware = Firmware()
+        firmware.poll(self.controller.button_command("a") * 70)
+        self.assertEqual(len(firmware.commands), arduino.SERIAL_BUFFER_SIZE)
+        self.assertEqual(firmware.n_dropped_bytes,
+                         70 - arduino.SERIAL_BUFFER_SIZE)
+        # Every press is two states
+        self.assertEqual(firmware.n_dropped_states,
+                         2 * arduino.SERIAL_BUFFER_SIZE -
+                         arduino.STATE_QUEUE_MAX)
+
+
+class TestPtyArduino(unittest.TestCase):
+
+    def setUp(self):
+        self.arduino = PtyArduino()
+        self.arduino.start()
+
+    def tearDown(self):
+        self.arduino.close()
+
+    def test_controller(self):
+        controller = GamecubeController(self.arduino.device)
+        controller.push_button("a")
+        # Generous timeouts, since the emulator's thread may be slow to get
+        # the CPU on a busy machine
+        controller.gc_dev.timeout = 2
+        self.assertEqual(controller.gc_dev.read(1), ACK_RECEIVED)
+        self.assertEqual(controller.gc_dev.read(1), ACK_DONE)
+        command, = self.arduino.firmware.commands
+        self.assertEqual(str(command), "button a x1")
+        controller.gc_dev.close()
+        controller.gc_dev = None
+
+    def test_async_controller_burst(self):
+        controller = AsyncGamecubeController(self.arduino.device)
+        try:
+            # Presses are added to the firmware's state queue, which only
+            # empties once they're all done, so more than this would
+            # overflow it.
+            commands = [controller.push_button(button)
+                        for button in ("left", "right") * 2]
+            for command in commands:
+                self.assertTrue(command.wait(2))
+                self.assertFalse(command.failed)
+        finally:
+            controller.close()
+
+        firmware = self.arduino.firmware
+        self.assertEqual([str(c) for c in firmware.commands],
+                         ["button left x1", "button right x1"] * 2)
+        self.assertEqual(firmware.n_dropped_bytes, 0)
+        self.assertEqual(firmware.n_dropped_states, 0)
+        # Sent one after another as they're acknowledged, one poll apart
+        for first, second in zip(commands, commands[1:]):
+            self.assertLessEqual(first.received_time, second.sent_time)
+            self.assertGreater(second.received_time - first.received_time,
+                               arduino.POLL_TIME / 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
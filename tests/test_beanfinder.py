@@ -4,8 +4,11 @@ import os
 import unittest
 
 import cv2
+import numpy
 
 import puyo
+from puyo.beanfinder import get_template, cell_hashes, ClassificationCache, \
+    TEMPLATE_DIR
 
 from helper import board_from_strs, PuyoTestCase
 
@@ -13,15 +16,30 @@ from helper import board_from_strs, PuyoTestCase
 TEST_IMG_FOLDER = os.path.join(os.path.dirname(__file__), "img")
 
 
+TEST_IMAGES = (
+    "beanfinder_1.png",
+    "beanfinder_2.png",
+    "beanfinder_yellow_similar_to_green.png",
+)
+
+
 class TestBeanFinder(PuyoTestCase):
 
+    def read_image(self, img_filename):
+        img = cv2.imread(os.path.join(TEST_IMG_FOLDER, img_filename))
+        if img is None:
+            raise OSError("Image not found")
+        return img
+
     def assertImageMatchesBoard(self, img_filename, board):
-        bean_finder = puyo.BeanFinder((38, 13), 1)
+        """Check recognition of the whole frame and of each single field."""
         img = cv2.imread(os.path.join(TEST_IMG_FOLDER, img_filename))
         if img is None:
             raise OSError("Image not found")
-        recognized_board = bean_finder.get_board(img)
-        self.assertBoardEquals(board, recognized_board)
+        for field in (None, 0, 1):
+            bean_finder = puyo.BeanFinder((38, 13), 1, field)
+            recognized_board = bean_finder.get_board(img)
+            self.assertBoardEquals(board, recognized_board)
 
     def assertImageHasSpecialState(self, img_filename, actual_state):
         bean_finder = puyo.BeanFinder((38, 13), 1)
@@ -98,6 +116,112 @@ class TestBeanFinder(PuyoTestCase):
     def test_board_state_continue(self):
         self.assertImageHasSpecialState("beanfinder_scenario_continue.png", "scenario_continue")
 
+    def test_batched_matches_single_cells(self):
+        """Batched classification should agree with `_detect_color`."""
+        for player in (1, 2):
+            bean_finder = puyo.BeanFinder((38, 13), player)
+            for img_filename in TEST_IMAGES:
+                img = self.read_image(img_filename)
+                board = bean_finder.get_board(img)
+                for x in range(6):
+                    for y in range(12):
+                        self.assertEqual(board[x][y],
+                                         bean_finder._get_bean_at(img, x, y))
+                self.assertEqual(board.next_beans,
+                                 bean_finder._get_next_beans(img))
+
+    def test_dual_bean_finder(self):
+        dual_bean_finder = puyo.DualBeanFinder((38, 13))
+        bean_finder1 = puyo.BeanFinder((38, 13), 1)
+        bean_finder2 = puyo.BeanFinder((38, 13), 2)
+        for img_filename in TEST_IMAGES:
+            img = self.read_image(img_filename)
+            board1, board2 = dual_bean_finder.get_boards(img)
+            self.assertBoardEquals(board1, bean_finder1.get_board(img))
+            self.assertBoardEquals(board2, bean_finder2.get_board(img))
+
+    def test_alternate_fields(self):
+        bean_finder = puyo.BeanFinder((38, 13), 1, "alternate")
+        # Interlace two images: field 0 has 32 beans, field 1 has 50
+        img = self.read_image("beanfinder_1.png")
+        img[1::2] = self.read_image("beanfinder_2.png")[1::2]
+        self.assertEqual(bean_finder.get_board(img).count(), 32)
+        self.assertEqual(bean_finder.get_board(img).count(), 50)
+        self.assertEqual(bean_finder.get_board(img).count(), 32)
+
+    def test_classification_cache(self):
+        """Cached colors should match classifying every cell."""
+        bean_finder = puyo.BeanFinder((38, 13), 1)
+        uncached = puyo.BeanFinder((38, 13), 1, cache_size=0)
+        self.assertIsNone(uncached.cell_reader.cache)
+        img = self.read_image("beanfinder_1.png")
+        board = uncached.get_board(img)
+        self.assertBoardEquals(board, bean_finder.get_board(img))
+        cache = bean_finder.cell_reader.cache
+        self.assertEqual(cache.hits, 0)
+
+        # Unchanged cells are hits, unless another cell with the same hash
+        # replaced their entry
+        self.assertBoardEquals(board, bean_finder.get_board(img))
+        self.assertGreater(cache.hits, 74 // 2)
+
+        # Slightly noisy copy of the same frame, like the next video frame
+        noise = numpy.random.RandomState(0).normal(0, 2, img.shape)
+        noisy_img = numpy.clip(img + noise, 0, 255).astype(numpy.uint8)
+        self.assertBoardEquals(board, bean_finder.get_board(noisy_img))
+
+        for img_filename in TEST_IMAGES:
+            img = self.read_image(img_filename)
+            self.assertBoardEquals(uncached.get_board(img),
+                                   bean_finder.get_board(img))
+
+    def test_classification_cache_hash_collision(self):
+        """Cells with the same hash but different pixels aren't mixed up."""
+        img = self.read_image("beanfinder_scenario_continue.png")
+        bean_finder = puyo.BeanFinder((38, 13), 2)
+        board = puyo.BeanFinder((38, 13), 2, cache_size=0).get_board(img)
+        # Cell 47 is empty, but hashes like the purple cells
+        hashes = cell_hashes(bean_finder.cell_reader.cell_indexes[None].crop(
+            img))
+        self.assertEqual(board[3][11], b' ')
+        self.assertIn(hashes[47], [hashes[i] for i in range(72)
+                                   if board[i // 12][i % 12] == b'p'])
+        for i in range(2):
+            self.assertBoardEquals(board, bean_finder.get_board(img))
+
+    def test_classification_cache_eviction(self):
+        cache = ClassificationCache(2)
+        cache.put("a", b'r')
+        cache.put("b", b'g')
+        self.assertEqual(cache.get("a"), b'r')
+        cache.put("c", b'b')  # Evicts "b", the least recently used
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), b'b')
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_classification_cache_pixels(self):
+        cache = ClassificationCache(2)
+        cache.put("a", b'r', "pixels")
+        self.assertIsNone(cache.get("a", "other pixels"))
+        self.assertEqual(cache.get("a", "pixels"), b'r')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_invalid_field(self):
+        with self.assertRaises(ValueError):
+            puyo.BeanFinder((38, 13), 1, 2)
+
+    def test_templates_shared(self):
+        """Templates should only be loaded once per process."""
+        bean_finder1 = puyo.BeanFinder((38, 13), 1)
+        bean_finder2 = puyo.BeanFinder((38, 13), 2)
+        self.assertIs(bean_finder1.bar_template, bean_finder2.bar_template)
+        self.assertFalse(bean_finder1.bar_template.flags.writeable)
+
+    def test_missing_template(self):
+        with self.assertRaises(IOError):
+            get_template(os.path.join(TEMPLATE_DIR, "does_not_exist.png"))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,49 @@
+#!/usr/bin/python
+
+import os
+import unittest
+
+import puyo
+from puyo import benchmark
+
+from helper import TEST_DATA_FOLDER
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_recording_positions(self):
+        filename = os.path.join(TEST_DATA_FOLDER, "board_recording2.pickle")
+        positions = benchmark.load_recording_positions(filename, 20)
+        self.assertEqual(len(positions), 20)
+        for position in positions:
+            self.assertEqual(position.source, "board_recording2.pickle")
+            self.assertTrue(benchmark._at_rest(position.board))
+
+    def test_synthetic_positions(self):
+        positions = benchmark.synthetic_positions(2, levels=(0, 30))
+        self.assertEqual(len(positions), 4)
+        self.assertEqual(positions[0].board.count(), 0)
+        self.assertGreaterEqual(positions[3].board.count(), 30)
+        for position in positions:
+            self.assertTrue(benchmark._at_rest(position.board))
+
+        # Same seed, same corpus
+        positions2 = benchmark.synthetic_positions(2, levels=(0, 30))
+        self.assertEqual([p.board for p in positions],
+                         [p.board for p in positions2])
+
+    def test_run_and_compare(self):
+        positions = benchmark.synthetic_positions(2, levels=(0, 24))
+        results = benchmark.run_benchmark(["random"], positions, repeat=2)
+        self.assertEqual(results["corpus"], {"synthetic": 4})
+        result = results["ais"]["random"]
+        self.assertEqual(result["n"], 8)
+        self.assertLessEqual(result["p50_ms"], result["max_ms"])
+        self.assertGreater(result["moves_per_second"], 0)
+        self.assertEqual(sorted(result["by_fill"]), ["0", "24"])
+        self.assertIn("random", benchmark.format_results(results))
+        self.assertIn("+0.0%", benchmark.compare_results(results, results))
+
+
+if __name__ == "__main__":
+    unittest.main()
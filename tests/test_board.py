@@ -2,6 +2,8 @@
 
 import unittest
 
+import numpy
+
 import puyo
 
 from helper import PuyoTestCase
@@ -44,6 +46,46 @@ class TestBoard(PuyoTestCase):
         self.assertEquals(board2[1][1], b'r')
         self.assertEquals(board2[1, 1], b'r')
 
+    def test_uint8_array(self):
+        board = self.board_from_strs([b"rg   k"])
+        array = board.get_uint8_array()
+        self.assertEqual(array.dtype, numpy.uint8)
+        self.assertEqual(array.shape, (6, 12))
+        self.assertEqual(array[0, 0], ord(b'r'))
+        self.assertEqual(array[5, 0], ord(b'k'))
+        self.assertEqual(array[2, 0], ord(b' '))
+
+        # It's a view of the board
+        array[2, 0] = ord(b'y')
+        self.assertEqual(board[2][0], b'y')
+
+    def test_canonicalize(self):
+        board = self.board_from_strs([
+            b"b     ",
+            b"pk  yb",
+        ], next_beans=(b'y', b'g'))
+        canonical, beans, mapping = board.canonicalize((b'g', b'g'))
+        self.assertEqual(beans, (b'r', b'r'))
+        self.assertEqual(canonical.next_beans, (b'g', b'r'))
+        self.assertEqual(canonical[0][0], b'b')  # Purple
+        self.assertEqual(canonical[0][1], b'y')  # Blue
+        self.assertEqual(canonical[1][0], b'k')
+        self.assertEqual(canonical[4][0], b'g')
+        self.assertEqual(mapping, {b'r': b'g', b'g': b'y', b'b': b'p',
+                                   b'y': b'b'})
+        self.assertEqual(canonical.relabel(mapping), board)
+
+        # Relabeling doesn't change the canonical form
+        relabeled = board.relabel({b'g': b'r', b'r': b'g', b'y': b'p',
+                                   b'p': b'y'})
+        other, other_beans, _ = relabeled.canonicalize((b'r', b'r'))
+        self.assertEqual(other, canonical)
+        self.assertEqual(other_beans, beans)
+
+        # Moves are the same on the canonical board
+        combo = board.copy().make_move((b'g', b'g'), 4, 0)
+        self.assertEqual(canonical.copy().make_move(beans, 4, 0), combo)
+
     def test_can_make_move(self):
         """Many test vectors for `can_make_move` method."""
         # Each test vector is a tuple of:
@@ -209,6 +251,73 @@ class TestBoard(PuyoTestCase):
         # different for Puyo 1.
         self.assertEquals(combo.score, 440280)  # This is a puyo puyo (1)
 
+    def test_resolve_chain(self):
+        rows = [
+            b" pyybg",
+            b"bbppyg",
+            b"bpyrbb",
+            b"ygprpb",
+            b"gprpgg",
+            b"gbprpr",
+            b"gypypb",
+            b"ybbbyy",
+            b"yrgrgy",
+            b"rgrgrb",
+            b"rgrgrb",
+            b"rgrgrb",
+        ]
+        board = self.board_from_strs(list(rows))
+        steps = list(board.iter_drop_beans([0], [b'b']))
+        self.assertEquals([step.length for step in steps], range(1, 19))
+        self.assertEquals(sum(step.n_beans for step in steps), 6*12)
+        self.assertEquals(sum(step.score for step in steps), 440280)
+        self.assertEquals(steps[-1].total_score, 440280)
+        self.assertTrue(all(step.board is board for step in steps))
+        self.assertBoardEmpty(board)
+
+        # Stop early once the score is high enough
+        board = self.board_from_strs(list(rows))
+        for step in board.iter_drop_beans([0], [b'b']):
+            if step.total_score > 1000:
+                break
+        self.assertLess(step.length, 18)
+        self.assertGreater(board.count(), 0)
+        # Resolving the rest gives the rest of the chain
+        rest = list(board.resolve_chain(step.length, step.total_score))
+        self.assertEquals([s.length for s in rest],
+                          range(step.length + 1, 19))
+        self.assertEquals(rest[-1].total_score, 440280)
+        self.assertBoardEmpty(board)
+
+    def test_find_chain_seed(self):
+        board = self.board_from_strs([
+            b"g     ",
+            b"r     ",
+            b"rg    ",
+            b"rgg   ",
+        ])
+        # A red at x=1 pops the reds, then the greens fall together
+        seed = board.find_chain_seed(1)
+        self.assertEquals(seed.placements, ((1, b'r'),))
+        self.assertEquals(seed.length, 2)
+        combo = board.copy().drop_bean(1, b'r')
+        self.assertEquals(seed.score, combo.score)
+
+        # More beans can only do better, and the placements work
+        seed = board.find_chain_seed(2)
+        self.assertGreaterEqual(seed.length, 2)
+        tmp_board = board.copy()
+        for x, color in seed.placements[:-1]:
+            self.assertEquals(tmp_board.drop_bean(x, color).length, 0)
+        x, color = seed.placements[-1]
+        combo = tmp_board.drop_bean(x, color)
+        self.assertEquals((combo.length, combo.score),
+                          (seed.length, seed.score))
+
+        self.assertIsNone(self.make_board().find_chain_seed(3))
+        # Out of time before anything was tried
+        self.assertIsNone(board.find_chain_seed(3, time_limit=-1))
+
     def test_drop_nuisance_1(self):
         board = self.make_board()
         board.drop_nuisance(1)
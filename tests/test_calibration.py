@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy
+
+import puyo
+from puyo import calibration
+from puyo.beanfinder import CellIndex
+
+from helper import PuyoTestCase
+
+
+TEST_IMG_FOLDER = os.path.join(os.path.dirname(__file__), "img")
+
+
+def shift_image(img, dx, dy):
+    """Move the contents of `img` right by `dx` and down by `dy` pixels."""
+    shifted = numpy.zeros_like(img)
+    h, w = img.shape[:2]
+    shifted[dy:, dx:] = img[:h-dy, :w-dx]
+    return shifted
+
+
+class TestCalibration(PuyoTestCase):
+
+    def setUp(self):
+        self.img = cv2.imread(os.path.join(TEST_IMG_FOLDER, "beanfinder_2.png"))
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_find_screen_offset(self):
+        for dx, dy in ((0, 0), (3, 0), (0, 5), (17, 9)):
+            offset = calibration.find_screen_offset(shift_image(self.img, dx, dy))
+            self.assertEqual(offset, (38+dx, 13+dy))
+
+    def test_calibrated_recognition(self):
+        shifted = shift_image(self.img, 11, 6)
+        offset = calibration.find_screen_offset(shifted)
+        expected = puyo.BeanFinder((38, 13)).get_board(self.img)
+        recognized = puyo.BeanFinder(offset).get_board(shifted)
+        self.assertBoardEquals(expected, recognized)
+
+    def test_not_found(self):
+        with self.assertRaises(ValueError):
+            calibration.find_screen_offset(numpy.zeros_like(self.img))
+
+    def test_save_load(self):
+        filename = os.path.join(self.tmp_dir, "calibration.json")
+        self.assertIs(calibration.load_screen_offset(filename), None)
+        calibration.save_screen_offset((40, 12), filename)
+        self.assertEqual(calibration.load_screen_offset(filename), (40, 12))
+
+        # A saved calibration is used without reading any video
+        self.assertEqual(calibration.calibrate(None, filename), (40, 12))
+
+    def test_cell_index(self):
+        """Cropping with the cell index should match `_crop_cell`."""
+        bean_finder = puyo.BeanFinder((38, 13))
+        cell_index = CellIndex(bean_finder.cell_origins)
+        cells = cell_index.crop(self.img)
+        self.assertTrue(numpy.array_equal(
+            cells, cell_index.crop(self.img[:, :700])))
+        for x in range(6):
+            for y in range(12):
+                self.assertTrue(numpy.array_equal(
+                    cells[x*12 + y], bean_finder._crop_cell(self.img, x, y)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+import threading
+import unittest
+
+from puyo.capture import LatestFrameCapture
+
+
+class MockVideo(object):
+    """
+    Stands in for a `cv2.VideoCapture` object. Returns the integers 0 to
+    `n_frames`-1 as frames. If `gate` is given, each read waits for the gate
+    to be set first.
+    """
+
+    def __init__(self, n_frames, gate=None):
+        self.frames = iter(range(n_frames))
+        self.gate = gate
+        self.released = False
+
+    def read(self):
+        if self.gate is not None:
+            self.gate.wait()
+        try:
+            return True, next(self.frames)
+        except StopIteration:
+            return False, None
+
+    def release(self):
+        self.released = True
+
+
+class TestLatestFrameCapture(unittest.TestCase):
+
+    def test_no_drop(self):
+        """With `drop_frames` False, every frame is returned in order."""
+        capture = LatestFrameCapture(MockVideo(50), drop_frames=False)
+        imgs = []
+        while True:
+            frame = capture.read_frame()
+            if frame is None:
+                break
+            imgs.append(frame.img)
+            self.assertEqual(frame.index, frame.img)
+        self.assertEqual(imgs, list(range(50)))
+        self.assertEqual(capture.n_dropped, 0)
+
+    def test_drop_stale(self):
+        """Only the newest frame is returned when reading falls behind."""
+        video = MockVideo(50)
+        capture = LatestFrameCapture(video)
+        capture._thread.join()  # Wait until every frame has been read
+
+        frame = capture.read_frame()
+        self.assertEqual(frame.img, 49)
+        self.assertEqual(capture.n_captured, 50)
+        self.assertEqual(capture.n_dropped, 49)
+        self.assertIs(capture.read_frame(), None)
+        self.assertEqual(capture.latest().img, 49)
+
+        capture.release()
+        self.assertTrue(video.released)
+
+    def test_non_blocking(self):
+        gate = threading.Event()
+        capture = LatestFrameCapture(MockVideo(2, gate))
+        self.assertIs(capture.read_frame(block=False), None)
+        self.assertIs(capture.read_frame(timeout=0.01), None)
+        gate.set()
+        self.assertGreater(capture.read_frame().timestamp, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,259 @@
+#!/usr/bin/python
+
+import unittest
+from time import time, sleep
+from StringIO import StringIO
+
+import puyo
+from puyo.capture import LatestFrameCapture
+from puyo.vision import PlayerState
+
+from helper import PuyoTestCase
+
+
+class MockVideo(object):
+    """Gives each item of `frames` as a video frame."""
+
+    def __init__(self, frames):
+        self.frames = iter(frames)
+
+    def read(self):
+        try:
+            return True, next(self.frames)
+        except StopIteration:
+            return False, None
+
+    def release(self):
+        pass
+
+
+class MockVision(object):
+    """Vision whose "images" are the PlayerState to return."""
+
+    def __init__(self, player=None, screen_offset=None, field=None):
+        self.predicted_moves = []
+        self.skip = False
+
+    def get_state(self, state):
+        return state
+
+    def predict_move(self, board, beans, move, start_time):
+        self.predicted_moves.append(move)
+        self.skip = True
+
+    def wants_frame(self, timestamp):
+        return not self.skip
+
+    def reset(self):
+        pass
+
+
+class MockController(puyo.gccontrol.Controller):
+
+    def __init__(self):
+        self.moves = []
+        self.buttons = []
+        self.button_times = []
+        self.macros = []
+
+    def puyo_move(self, pos, rot, down_fast=True):
+        self.moves.append((pos, rot))
+
+    def push_button(self, button):
+        self.buttons.append(button)
+        self.button_times.append(time())
+
+    def run_macro(self, presses):
+        self.macros.append(presses)
+        return 0.01
+
+
+class MockAsyncController(MockController):
+    """Returns a `ControllerCommand` for each move, finished by the test."""
+
+    def __init__(self):
+        MockController.__init__(self)
+        self.commands = []
+
+    def puyo_move(self, pos, rot, down_fast=True):
+        MockController.puyo_move(self, pos, rot, down_fast)
+        command = puyo.ControllerCommand(chr(pos))
+        self.commands.append(command)
+        return command
+
+
+class FirstMoveAI(puyo.ai.AI):
+
+    def get_move(self, board, beans):
+        return next(iter(board.iter_moves()))
+
+
+def make_states(new_moves):
+    board = puyo.Board(next_beans=(b'r', b'g'))
+    return [PlayerState(board, new_move, (b'b', b'y'), "unknown")
+            for new_move in new_moves]
+
+
+class TestDriver(PuyoTestCase):
+
+    def make_driver(self, **kwargs):
+        controller = MockController()
+        driver = puyo.Driver(controller, FirstMoveAI(), vision_cls=MockVision,
+                             **kwargs)
+        self.addCleanup(driver.close)
+        return driver, controller
+
+    def test_step(self):
+        driver, controller = self.make_driver()
+        for state in make_states([False, True, False]):
+            self.assertIs(driver.step(state), state)
+        self.assertEqual(controller.moves, [(0, 0)])
+        self.assertEqual(driver.stats["vision"].count, 3)
+        self.assertEqual(driver.stats["ai"].count, 1)
+        self.assertEqual(driver.stats["controller"].count, 1)
+
+    def test_latency(self):
+        driver, controller = self.make_driver()
+        states = make_states([False, True])
+        driver.step(states[0], time() - 0.5)
+        driver.step(states[1], time() - 0.5)
+
+        histograms = driver.latency.histograms
+        self.assertEqual(histograms["vision"].count, 2)
+        for event in ("new_move", "ai", "command"):
+            self.assertEqual(histograms[event].count, 1)
+            p50, p95, p99 = histograms[event].percentiles()
+            self.assertGreaterEqual(p50, 0.5)
+            self.assertLess(p99, 1)
+
+        f = StringIO()
+        driver.latency.dump(f)
+        self.assertIn("command", f.getvalue())
+
+    def test_wait_for_move(self):
+        driver, controller = self.make_driver()
+        driver.step(make_states([True])[0])
+        self.assertIsNone(driver.wait_for_move(0))
+
+        controller = MockAsyncController()
+        driver = puyo.Driver(controller, FirstMoveAI(), vision_cls=MockVision)
+        self.addCleanup(driver.close)
+        driver.step(make_states([True])[0], time() - 0.5)
+        self.assertFalse(driver.wait_for_move(0.01))
+        self.assertEqual(driver.latency.histograms["done"].count, 0)
+        # Not sent yet
+        self.assertEqual(driver.latency.histograms["command"].count, 0)
+
+        command = controller.commands[0]
+        command.sent_time = command.queued_time + 0.25
+        command._finish(time())
+        self.assertTrue(driver.wait_for_move(0))
+        self.assertEqual(driver.latency.histograms["done"].count, 1)
+        self.assertGreaterEqual(driver.latency.histograms["done"].max(), 0.5)
+        # Timed from when it was written, not queued
+        self.assertEqual(driver.latency.histograms["command"].count, 1)
+        self.assertGreaterEqual(driver.latency.histograms["command"].max(),
+                                0.75)
+
+    def test_buttons_during_vision(self):
+        driver, controller = self.make_driver()
+        driver.queue_button_press("start", 0.2)
+
+        # Vision runs while buttons are pressed, but no moves are made
+        state = make_states([True])[0]
+        self.assertIs(driver.step(state), state)
+        self.assertEqual(driver.stats["vision"].count, 1)
+        self.assertEqual(controller.moves, [])
+
+        self.assertTrue(driver.wait_for_buttons(1))
+        self.assertEqual(controller.buttons, ["start"])
+        driver.step(state)
+        self.assertEqual(controller.moves, [(0, 0)])
+
+    def test_button_timing(self):
+        driver, controller = self.make_driver()
+        for button in ("up", "down", "a"):
+            driver.queue_button_press(button, 0.05)
+        self.assertTrue(driver.buttons.busy)
+        self.assertTrue(driver.wait_for_buttons(1))
+        self.assertFalse(driver.buttons.busy)
+
+        self.assertEqual(controller.buttons, ["up", "down", "a"])
+        times = controller.button_times
+        for t1, t2 in zip(times, times[1:]):
+            self.assertGreaterEqual(t2 - t1, 0.05)
+            self.assertLess(t2 - t1, 0.07)
+
+        # Stopping doesn't wait for the rest of a long delay
+        driver.queue_button_press("b", 10)
+        driver.queue_button_press("x")
+        while controller.buttons[-1] != "b":
+            sleep(0.001)
+        start = time()
+        driver.buttons.stop()
+        self.assertLess(time() - start, 1)
+        self.assertEqual(controller.buttons[-1], "b")
+
+    def test_skip_frames(self):
+        driver, controller = self.make_driver(skip_frames=True)
+        states = make_states([True, False, False])
+        self.assertIs(driver.step(states[0]), states[0])
+        self.assertEqual(driver.vision.predicted_moves, [(0, 0)])
+        self.assertIs(driver.step(states[1]), None)
+        self.assertEqual(driver.n_skipped_frames, 1)
+
+        driver.vision.skip = False
+        self.assertIs(driver.step(states[2]), states[2])
+        self.assertEqual(driver.stats["vision"].count, 2)
+
+    def test_reset_macros(self):
+        driver, controller = self.make_driver()
+        driver.reset_to_level(7)
+        self.assertTrue(driver.wait_for_buttons(1))
+        self.assertEqual(controller.buttons, [])
+        self.assertEqual(len(controller.macros), 3)
+        # Password "pbgc": 3 right to "p", 1 left to "b", 2 right to "g", 2
+        # to "c" and 3 to "end", pressing "b" at each
+        password = controller.macros[-1]
+        self.assertEqual([button for button, delay in password
+                          if button == "b"], ["b"] * 5)
+        self.assertEqual(len(password), 3 + 1 + 2 + 2 + 3 + 5)
+
+    def test_close(self):
+        driver, controller = self.make_driver()
+        driver.queue_button_press("start", 0)
+        self.assertTrue(driver.wait_for_buttons(1))
+        driver.close()
+        self.assertFalse(driver.buttons._thread.is_alive())
+        self.assertEqual(controller.buttons, ["start"])
+
+    def test_special_state_taken_once(self):
+        driver, controller = self.make_driver(pipelined=True)
+        board = puyo.Board(next_beans=(b'r', b'g'))
+        won = PlayerState(board, False, None, "scenario_won")
+        driver._vision_stage(won, 0)
+        self.assertTrue(driver.wait_for_buttons(1))
+        self.assertEqual(controller.buttons, ["start"])
+        self.assertIs(driver._take_special_state(), won)
+        self.assertIsNone(driver._take_special_state())
+
+    def test_run_pipelined(self):
+        driver, controller = self.make_driver(pipelined=True)
+        states = make_states([False, True, False, False, True, False])
+        capture = LatestFrameCapture(MockVideo(states), drop_frames=False)
+        driver.run(capture)
+
+        # Every frame is seen, but new moves may be dropped or still be
+        # waiting for the AI when the video runs out.
+        self.assertEqual(driver.stats["vision"].count, len(states))
+        self.assertEqual(driver.stats["ai"].count +
+                         driver._ai_queue.n_dropped +
+                         driver._ai_queue.qsize(), 2)
+        self.assertEqual(len(controller.moves),
+                         driver.stats["controller"].count)
+        self.assertEqual(driver.n_captured_frames, len(states))
+        self.assertEqual(driver.n_dropped_frames, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+#!/usr/bin/python
+
+import unittest
+
+import numpy
+
+from puyo import timing
+from puyo.arduino import DEFAULT_STATE
+from puyo.beanfinder import BeanFinder
+from puyo.calibration import find_screen_offset, DEFAULT_SCREEN_OFFSET
+from puyo.emulator import Emulator, EmulatedGame, FrameRenderer, \
+    SimulatedClock, SPRITE_CELLS
+from puyo.timing import FRAME_TIME
+
+from helper import PuyoTestCase, board_from_strs
+
+
+def run_frames(game, states, start=0):
+    """Update `game` once per frame with each controller state in `states`.
+    Return the frame after the last one."""
+    for frame, state in enumerate(states, start):
+        game.update(frame * FRAME_TIME, state)
+    return start + len(states)
+
+
+class TestFrameRenderer(PuyoTestCase):
+
+    def setUp(self):
+        rng = numpy.random.RandomState(0)
+        self.cells = [[SPRITE_CELLS[rng.randint(len(SPRITE_CELLS))]
+                       for y in range(12)] for x in range(6)]
+
+    def test_recognized(self):
+        for player in (1, 2):
+            img = FrameRenderer(player=player).render(self.cells,
+                                                      (b'r', b'g'))
+            for field in (None, 0, 1):
+                bean_finder = BeanFinder(DEFAULT_SCREEN_OFFSET, player,
+                                         field=field)
+                board = bean_finder.get_board(img)
+                self.assertEqual(board.get_array().tolist(), self.cells)
+                self.assertEqual(board.next_beans, (b'r', b'g'))
+
+    def test_calibration(self):
+        offset = (30, 20)
+        img = FrameRenderer(offset).render(self.cells)
+        self.assertEqual(find_screen_offset(img), offset)
+
+
+class TestEmulatedGame(PuyoTestCase):
+
+    def test_fall(self):
+        game = EmulatedGame()
+        frame = run_frames(game, [DEFAULT_STATE] * 16)
+        self.assertEqual((game.pair.x, game.pair.y), (2, 11))
+        self.assertEqual(game.cells[2][11], game.pair.beans[1])
+        beans = game.pair.beans
+
+        # Land on the floor, rotated to the right
+        states = [frozenset(["x"]), DEFAULT_STATE] + \
+                 [frozenset(["down"])] * 30
+        frame = run_frames(game, states, frame)
+        self.assertIsNone(game.pair)
+        landed, = game.landed
+        self.assertEqual((landed.position, landed.rotation), (2, 1))
+        self.assertEqual(game.board[2][0], beans[1])
+        self.assertEqual(game.board[3][0], beans[0])
+
+        # The next pair appears once the board has settled
+        frames = int(round(timing.SPAWN_TIME / FRAME_TIME)) + 1
+        run_frames(game, [DEFAULT_STATE] * frames, frame)
+        self.assertIsNotNone(game.pair)
+
+    def test_moves_blocked(self):
+        game = EmulatedGame()
+        game.board = board_from_strs([
+            b"  r   ",
+            b"  g   ",
+            b" rg   ",
+        ])
+        frame = run_frames(game, [DEFAULT_STATE] * 16)
+        # Can't rotate into the wall or move past the left side
+        states = [frozenset(["left"]), DEFAULT_STATE] * 3 + \
+                 [frozenset(["a"]), DEFAULT_STATE]
+        run_frames(game, states, frame)
+        self.assertEqual((game.pair.x, game.pair.rotation), (0, 0))
+
+    def test_chain(self):
+        game = EmulatedGame()
+        game.board = board_from_strs([
+            b"rrr   ",
+        ])
+        frame = run_frames(game, [DEFAULT_STATE] * 16)
+        game.pair.beans = (b'g', b'r')
+        states = [frozenset(["right"]), DEFAULT_STATE] + \
+                 [frozenset(["down"])] * 30
+        frame = run_frames(game, states, frame)
+        # Shown before it pops
+        self.assertEqual(game.board[3][0], b'r')
+        self.assertEqual(game.board[3][1], b'g')
+        frames = int(timing.CHAIN_STEP_TIME / FRAME_TIME) + 1
+        run_frames(game, [DEFAULT_STATE] * frames, frame)
+        self.assertBoardEquals(game.board, board_from_strs([b"   g  "]))
+        self.assertEqual(game.chain_lengths, [1])
+        self.assertGreater(game.score, 0)
+
+    def test_game_over(self):
+        game = EmulatedGame()
+        game.board = board_from_strs([b"  r   ", b"  g   "] * 6)
+        game.update(timing.SPAWN_TIME)
+        self.assertTrue(game.game_over)
+        self.assertIsNone(game.pair)
+
+
+class TestSimulatedClock(unittest.TestCase):
+
+    def test_advance(self):
+        clock = SimulatedClock()
+        self.assertLess(clock(), 1)
+        clock.advance_to(100)
+        self.assertGreaterEqual(clock(), 100)
+        clock.advance_to(50)
+        self.assertGreaterEqual(clock(), 100)
+
+
+class TestEmulator(unittest.TestCase):
+
+    def test_run(self):
+        emulator = Emulator(seed=1)
+        self.addCleanup(emulator.close)
+        stats = emulator.run(max_pairs=10)
+        self.assertEqual(stats.n_pairs, 10)
+        self.assertEqual(stats.n_processed + stats.n_dropped, stats.n_frames)
+        self.assertEqual(stats.n_missed + stats.n_misplaced, 0)
+        self.assertEqual(stats.decision_latency.count, 10)
+        self.assertEqual(stats.n_extra_moves, 0)
+        self.assertEqual(stats.n_board_errors, 0)
+        self.assertIn("10 pairs", stats.format())
+
+    def test_run_skip_frames(self):
+        emulator = Emulator(seed=1, skip_frames=True)
+        self.addCleanup(emulator.close)
+        stats = emulator.run(max_pairs=10)
+        self.assertEqual(stats.n_pairs, 10)
+        self.assertGreater(emulator.driver.n_skipped_frames, 0)
+        self.assertEqual(stats.n_missed + stats.n_misplaced, 0)
+        self.assertEqual(stats.n_extra_moves, 0)
+        self.assertEqual(stats.n_board_errors, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
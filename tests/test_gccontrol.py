@@ -0,0 +1,209 @@
+#!/usr/bin/python
+
+import unittest
+import threading
+from time import time, sleep
+
+from puyo import gccontrol, timing
+from puyo.gccontrol import GamecubeController, AsyncGamecubeController
+
+
+class MockSerial(object):
+
+    def __init__(self):
+        self.written = b""
+
+    def write(self, data):
+        self.written += data
+
+
+class MockArduino(object):
+    """A serial port that acknowledges commands like the firmware.
+
+    Every whole command written is acknowledged as received, unless
+    `auto_ack` is False, in which case `ack()` must be called. `finish()`
+    acknowledges that everything is done.
+
+    """
+
+    def __init__(self, auto_ack=True):
+        self.auto_ack = auto_ack
+        self.written = b""
+        self.writes = []
+        self._bytes_left = 0
+        self._replies = b""
+        self._cond = threading.Condition()
+
+    def write(self, data):
+        with self._cond:
+            self.written += data
+            self.writes.append(data)
+            for c in data:
+                if self._bytes_left:
+                    self._bytes_left -= 1
+                elif ord(c) >> 6 == 0x2:
+                    self._bytes_left = 2 * (ord(c) & 0x3F)
+                if not self._bytes_left and self.auto_ack:
+                    self._reply(gccontrol.ACK_RECEIVED)
+
+    def ack(self):
+        with self._cond:
+            self._reply(gccontrol.ACK_RECEIVED)
+
+    def finish(self):
+        with self._cond:
+            self._reply(gccontrol.ACK_DONE)
+
+    def _reply(self, data):
+        self._replies += data
+        self._cond.notify_all()
+
+    @property
+    def in_waiting(self):
+        return len(self._replies)
+
+    def read(self, size=1):
+        with self._cond:
+            if not self._replies:
+                self._cond.wait(0.01)
+            data = self._replies[:size]
+            self._replies = self._replies[size:]
+            return data
+
+    def close(self):
+        pass
+
+
+def wait_until(condition, timeout=1):
+    end = time() + timeout
+    while not condition() and time() < end:
+        sleep(0.001)
+    return condition()
+
+
+class TestMacro(unittest.TestCase):
+
+    def test_encode(self):
+        bits = GamecubeController.BUTTON_BITS
+        command, duration = gccontrol.encode_macro(
+            [("Right", 0.2), ("right", 0.2), ("b", 0.1), ("start", 2)], bits)
+        self.assertEqual([ord(c) for c in command], [
+            0x80 | 3,
+            bits["right"] << 4 | 1, 2,
+            bits["b"] << 4, 1,
+            bits["start"] << 4, 23,
+        ])
+        self.assertAlmostEqual(duration, (2*3 + 2 + 24) *
+                               timing.INPUT_STATE_TIME)
+
+    def test_macro_delays_not_shortened(self):
+        # Like the steps of `Driver.enter_password()`
+        bits = GamecubeController.BUTTON_BITS
+        for delay in (0.1, 0.2, 0.25, 0.3, 1):
+            command, duration = gccontrol.encode_macro([("up", delay)], bits)
+            self.assertGreaterEqual(duration, delay - 1e-9)
+            self.assertLess(duration, delay + timing.INPUT_STATE_TIME)
+        command, duration = gccontrol.encode_macro([("up", 0.2)], bits)
+        self.assertEqual(ord(command[2]), 2)
+        self.assertAlmostEqual(duration, 0.25)
+
+    def test_repetition_limit(self):
+        presses = [("up", 0.1)] * (gccontrol.MACRO_MAX_REPETITIONS + 1)
+        command, duration = gccontrol.encode_macro(
+            presses, GamecubeController.BUTTON_BITS)
+        self.assertEqual(ord(command[0]), 0x80 | 2)
+        self.assertEqual(ord(command[1]) & 0x0F,
+                         gccontrol.MACRO_MAX_REPETITIONS - 1)
+
+    def test_too_many_steps(self):
+        presses = [("up", 0.1), ("down", 0.1)] * 32
+        with self.assertRaises(ValueError):
+            gccontrol.encode_macro(presses, GamecubeController.BUTTON_BITS)
+
+    def test_run_macro(self):
+        controller = GamecubeController.__new__(GamecubeController)
+        controller.gc_dev = MockSerial()
+        duration = controller.run_macro([("a", 1)])
+        self.assertEqual(len(controller.gc_dev.written), 3)
+        self.assertGreater(duration, 0.9)
+        self.assertIsNotNone(controller.last_command_time)
+        controller.gc_dev = None
+
+
+class TestAsyncGamecubeController(unittest.TestCase):
+
+    def setUp(self):
+        self.arduino = MockArduino()
+        self.controller = AsyncGamecubeController(self.arduino)
+
+    def tearDown(self):
+        self.controller.close()
+
+    def test_acknowledgements(self):
+        move = self.controller.puyo_move(2, 1)
+        button = self.controller.push_button("a")
+        self.assertTrue(wait_until(lambda: button.received_time is not None))
+        self.assertEqual(self.arduino.written,
+                         self.controller.move_command(2, 1) +
+                         self.controller.button_command("a"))
+        self.assertFalse(move.done)
+
+        self.arduino.finish()
+        self.assertTrue(move.wait(1))
+        self.assertTrue(button.wait(1))
+        for command in (move, button):
+            self.assertFalse(command.failed)
+            self.assertLessEqual(command.queued_time, command.sent_time)
+            self.assertLessEqual(command.sent_time, command.received_time)
+            self.assertLessEqual(command.received_time, command.done_time)
+        self.assertLessEqual(move.received_time, button.sent_time)
+
+    def test_flow_control(self):
+        self.arduino.auto_ack = False
+        first = self.controller.push_button("a")
+        second = self.controller.push_button("b")
+        sleep(0.05)
+        self.assertEqual(self.arduino.written,
+                         self.controller.button_command("a"))
+
+        self.arduino.ack()
+        self.assertTrue(wait_until(lambda: second.sent_time is not None))
+        self.assertEqual(self.arduino.written,
+                         self.controller.button_command("a") +
+                         self.controller.button_command("b"))
+        self.assertIsNotNone(first.received_time)
+        self.assertIsNone(second.received_time)
+
+    def test_timeout(self):
+        self.arduino.auto_ack = False
+        self.controller.ack_timeout = 0.05
+        command = self.controller.push_button("a")
+        self.assertTrue(command.wait(1))
+        self.assertTrue(command.failed)
+        self.assertIsNone(command.received_time)
+        self.assertEqual(self.controller.n_failed, 1)
+
+    def test_done_callback(self):
+        done = []
+        command = self.controller.push_button("a")
+        command.add_done_callback(done.append)
+        self.assertTrue(wait_until(lambda: command.received_time is not None))
+        self.assertEqual(done, [])
+        self.arduino.finish()
+        self.assertTrue(wait_until(lambda: done == [command]))
+        command.add_done_callback(done.append)
+        self.assertEqual(done, [command, command])
+
+    def test_long_macro(self):
+        presses = [("up", 0.1), ("down", 0.1)] * 20
+        duration = self.controller.run_macro(presses)
+        self.assertGreater(duration, 0)
+        command = self.controller.last_command
+        self.assertTrue(wait_until(lambda: command.received_time is not None))
+        self.assertEqual(len(self.arduino.written), 81)
+        self.assertEqual([len(data) for data in self.arduino.writes],
+                         [32, 32, 17])
+
+
+if __name__ == "__main__":
+    unittest.main()
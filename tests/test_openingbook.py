@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import puyo
+from puyo import openingbook
+from puyo.ai import AI, OpeningBookAI
+
+
+class FixedAI(AI):
+
+    def __init__(self, move):
+        self.move = move
+        self.n_calls = 0
+
+    def get_move(self, board, beans):
+        self.n_calls += 1
+        return self.move
+
+
+class TestOpeningBook(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "book.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_write_and_lookup(self):
+        board = puyo.Board(next_beans=(b'r', b'g'))
+        key = openingbook.position_key(board, (b'b', b'b'), board.next_beans)
+        entries = dict((k, (k % 6, 0)) for k in range(100, 1000, 7))
+        entries[key] = (4, 1)
+        openingbook.write_book(entries, self.filename)
+
+        book = openingbook.OpeningBook(self.filename)
+        self.assertEqual(len(book), len(entries))
+        self.assertEqual(book.lookup(board, (b'b', b'b')), (4, 1))
+        self.assertEqual(book.get(107), (5, 0))
+        self.assertIsNone(book.get(108))
+        self.assertIsNone(book.get(2**64 - 1))
+        self.assertIsNone(book.lookup(board, (b'b', b'r')))
+        self.assertIsNone(book.lookup(puyo.Board(), (b'b', b'b')))
+
+    def test_empty_book(self):
+        openingbook.write_book({}, self.filename)
+        book = openingbook.OpeningBook(self.filename)
+        self.assertEqual(len(book), 0)
+        self.assertIsNone(book.get(0))
+
+    def test_bad_file(self):
+        with open(self.filename, "wb") as f:
+            f.write(b"not a book at all")
+        with self.assertRaises(openingbook.OpeningBookError):
+            openingbook.OpeningBook(self.filename)
+
+    def test_build(self):
+        colors = (b'r', b'g')
+        # 4 pairs times 4 next pairs, but swapping red and green gives the
+        # same position, so only half of them are searched
+        entries = openingbook.build_book("simple_greedy", 1, colors,
+                                         processes=1)
+        self.assertEqual(len(entries), 8)
+
+        entries = openingbook.build_book("simple_greedy", 2, colors,
+                                         processes=1)
+        self.assertGreater(len(entries), 8)
+        self.assertLessEqual(len(entries), 8 + 8 * 4)
+        openingbook.write_book(entries, self.filename)
+
+        ai = FixedAI((0, 0))
+        book_ai = OpeningBookAI(ai, self.filename)
+        board = puyo.Board(next_beans=(b'g', b'r'))
+        move = book_ai.get_move(board.copy(), (b'r', b'r'))
+        key = openingbook.position_key(board, (b'r', b'r'), (b'g', b'r'))
+        self.assertEqual(move, entries[key])
+        # Positions with other colors are found too
+        board.next_beans = (b'y', b'p')
+        self.assertEqual(book_ai.get_move(board.copy(), (b'p', b'p')), move)
+        self.assertEqual(ai.n_calls, 0)
+
+        # Not in the book
+        self.assertEqual(book_ai.get_move(board.copy(), (b'b', b'r')), (0, 0))
+        self.assertEqual(ai.n_calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
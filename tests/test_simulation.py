@@ -0,0 +1,53 @@
+#!/usr/bin/python
+
+import unittest
+
+import puyo
+from puyo import simulation
+
+
+class TestSimulation(unittest.TestCase):
+
+    def test_same_seed_same_game(self):
+        result1 = simulation.play_game(puyo.ai.RandomAI(), 5)
+        result2 = simulation.play_game(puyo.ai.RandomAI(), 5)
+        self.assertEqual(result1, result2)
+        self.assertTrue(result1.game_over)
+        self.assertFalse(result1.invalid_move)
+        self.assertEqual(result1.score > 0, len(result1.chain_lengths) > 0)
+
+    def test_max_moves(self):
+        result = simulation.play_game(puyo.ai.RandomAI(), 0, max_moves=3)
+        self.assertEqual(result.n_moves, 3)
+        self.assertFalse(result.game_over)
+
+    def test_nuisance(self):
+        result = simulation.play_game(puyo.ai.RandomAI(), 1,
+                                      nuisance_probability=1)
+        self.assertTrue(result.game_over)
+
+    def test_pool_matches_single_process(self):
+        results = simulation.play_games("random", 6, first_seed=10,
+                                        processes=1)
+        self.assertEqual([r.seed for r in results], range(10, 16))
+        self.assertEqual(results, simulation.play_games(
+                "random", 6, first_seed=10, processes=2))
+
+    def test_summary(self):
+        results = [
+            simulation.GameResult(0, 100, 10, [1, 2], True, False),
+            simulation.GameResult(1, 300, 30, [1], False, False),
+        ]
+        summary = simulation.SimulationSummary("test", results, 2.0)
+        self.assertEqual(summary.n_moves, 40)
+        self.assertEqual(summary.moves_per_second, 20)
+        self.assertEqual(summary.games_per_second, 1)
+        self.assertEqual(summary.mean_score, 200)
+        self.assertEqual(summary.max_score, 300)
+        self.assertEqual(summary.game_over_rate, 0.5)
+        self.assertEqual(summary.chain_lengths, {1: 2, 2: 1})
+        self.assertIn("test", summary.format())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from puyo import tournament
+
+
+class TestTournament(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp_dir, "results.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_wilson_interval(self):
+        low, high = tournament.wilson_interval(5, 10)
+        self.assertAlmostEqual(low, 0.2366, places=4)
+        self.assertAlmostEqual(high, 0.7634, places=4)
+        self.assertEqual(tournament.wilson_interval(0, 0), (0.0, 1.0))
+        low, high = tournament.wilson_interval(10, 10)
+        self.assertEqual(high, 1.0)
+
+    def test_resume(self):
+        store = tournament.ResultStore(self.filename)
+        n_played = tournament.play_solo_games(store, ["random", "random"], 3,
+                                              max_moves=10, processes=1)
+        # The same AI twice is one game
+        self.assertEqual(n_played, 3)
+        self.assertEqual(len(store), 3)
+
+        # Simulate a run interrupted while writing a record
+        with open(self.filename, "a") as f:
+            f.write('{"mode": "so')
+
+        store = tournament.ResultStore(self.filename)
+        self.assertEqual(len(store), 3)
+        n_played = tournament.play_solo_games(store, ["random"], 5,
+                                              max_moves=10, processes=1)
+        self.assertEqual(n_played, 2)
+        self.assertEqual(len(store), 5)
+
+        # A different configuration is a different game
+        n_played = tournament.play_solo_games(store, ["random"], 1,
+                                              max_moves=20, processes=1)
+        self.assertEqual(n_played, 1)
+
+    def test_standings(self):
+        store = tournament.ResultStore(self.filename)
+        ais = ["random", "simple_greedy"]
+        tournament.play_solo_games(store, ais, 4, max_moves=15, processes=2)
+        self.assertEqual(len(store), 8)
+
+        standings = tournament.solo_standings(store, ais, range(5),
+                                              max_moves=15)
+        self.assertEqual(len(standings.scores["random"]), 4)
+        wins, losses, draws = standings.pairs[("random", "simple_greedy")]
+        self.assertEqual(wins + losses + draws, 4)
+        self.assertEqual(standings.pairs[("simple_greedy", "random")],
+                         [losses, wins, draws])
+        rate, low, high = standings.win_rate("random")
+        self.assertAlmostEqual(rate + standings.win_rate("simple_greedy")[0],
+                               1)
+        self.assertTrue(low <= rate <= high)
+        self.assertIn("simple_greedy", standings.format())
+
+    def test_versus(self):
+        store = tournament.ResultStore(self.filename)
+        ais = ["random", "simple_greedy"]
+        n_played = tournament.play_versus_games(store, ais, 3, max_moves=200,
+                                                processes=1)
+        self.assertEqual(n_played, 3)
+        self.assertEqual(tournament.play_versus_games(
+                store, ais, 3, max_moves=200, processes=1), 0)
+
+        standings = tournament.versus_standings(store, ais, range(3),
+                                                max_moves=200)
+        self.assertEqual(len(standings.scores["random"]), 3)
+        self.assertEqual(sum(standings.pairs[("random", "simple_greedy")]), 3)
+
+    def test_compare_solo(self):
+        survived = {"game_over": False, "score": 100}
+        lost = {"game_over": True, "score": 500}
+        self.assertEqual(tournament.compare_solo(survived, lost), 1)
+        self.assertEqual(tournament.compare_solo(lost, survived), -1)
+        self.assertEqual(tournament.compare_solo(lost, dict(lost)), 0)
+        self.assertEqual(tournament.compare_solo(
+                lost, {"game_over": True, "score": 600}), -1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import puyo
+from puyo import tuning
+from puyo.ai import SimpleComboAI, TunedComboAI
+
+
+class TestTuning(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_weights(self):
+        board = puyo.Board()
+        beans = (b'r', b'g')
+        ai = SimpleComboAI()
+        zero_ai = SimpleComboAI(dict((name, 0) for name in tuning.TUNED_WEIGHTS))
+        self.assertGreater(ai.score_move(board.copy(), beans, 0, 0), 0)
+        self.assertEqual(zero_ai.score_move(board.copy(), beans, 0, 0), 0)
+        with self.assertRaises(ValueError):
+            SimpleComboAI({"not_a_weight": 1})
+
+    def test_resume(self):
+        """Resuming from a checkpoint continues exactly where it stopped."""
+        checkpoint = os.path.join(self.tmp_dir, "checkpoint.json")
+        state = tuning.initial_state(population_size=3, n_games=1,
+                                     max_moves=5)
+        tuning.tune(state, 2, processes=1)
+
+        resumed = tuning.initial_state(population_size=3, n_games=1,
+                                       max_moves=5)
+        tuning.tune(resumed, 1, checkpoint, processes=1)
+        resumed = tuning.load_checkpoint(checkpoint)
+        self.assertEqual(resumed["generation"], 1)
+        tuning.tune(resumed, 2, checkpoint, processes=1)
+
+        self.assertEqual(resumed["mean"], state["mean"])
+        self.assertEqual(resumed["sigma"], state["sigma"])
+        entry = state["history"][-1]
+        self.assertEqual(entry["n_games"], 3)
+        self.assertGreater(entry["games_per_second"], 0)
+
+    def test_export(self):
+        filename = os.path.join(self.tmp_dir, "weights", "tuned.json")
+        state = tuning.initial_state()
+        state["mean"]["chain"] = 3
+        tuning.export_weights(state, filename)
+        with open(filename) as f:
+            self.assertEqual(json.load(f)["weights"]["chain"], 3)
+
+    def test_tuned_ai(self):
+        self.assertIn("tuned_combo", puyo.AI_REGISTRY)
+        ai = TunedComboAI()
+        self.assertEqual(set(ai.weights), set(SimpleComboAI.DEFAULT_WEIGHTS))
+
+
+if __name__ == "__main__":
+    unittest.main()
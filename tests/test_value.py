@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import puyo
+from puyo import value
+from puyo.ai import ValueAI
+
+from helper import board_from_strs
+
+
+class TestValue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_features(self):
+        board = board_from_strs([
+            "r     ",
+            "rr kg ",
+        ])
+        cells = numpy.array([puyo.Board().get_uint8_array(),
+                             board.get_uint8_array()])
+        features = value.board_features(cells)
+        self.assertEqual(features.shape, (2, value.N_FEATURES))
+        self.assertTrue((features[0,:12] == 0).all())
+        self.assertAlmostEqual(features[1,0], 5 / 72.)
+        self.assertAlmostEqual(features[1,1], 2 / 12.)
+        self.assertAlmostEqual(features[1,7], 2 / 12.)
+        self.assertAlmostEqual(features[1,9], 1 / 60.)
+        self.assertAlmostEqual(features[1,10], 1 / 66.)
+        self.assertAlmostEqual(features[1,11], 1 / 72.)
+        # "g" has no same colored neighbors, each "r" has one or two
+        self.assertAlmostEqual(features[1,12], 1 / 72.)
+        self.assertAlmostEqual(features[1,13], 2 / 72.)
+        self.assertAlmostEqual(features[1,14], 1 / 72.)
+
+    def test_discounted_returns(self):
+        targets = value.discounted_returns([0, 10, 0], False, discount=0.5)
+        self.assertEqual(list(targets), [10, 0, 0])
+        targets = value.discounted_returns([0, 10], True, discount=0.5,
+                                           game_over_penalty=100)
+        self.assertEqual(list(targets), [-40, -100])
+
+    def test_fit_save_load(self):
+        rng = numpy.random.RandomState(0)
+        features = rng.uniform(0, 1, (500, value.N_FEATURES))
+        targets = 1000 * features[:,0] - 500 * features[:,3]
+        model = value.fit(features, targets, hidden=(8,), epochs=100,
+                          batch_size=32)
+        error = numpy.abs(model.predict(features) - targets).mean()
+        self.assertLess(error, numpy.abs(targets - targets.mean()).mean() / 5)
+
+        filename = os.path.join(self.tmp_dir, "model.npz")
+        model.save(filename)
+        loaded = value.ValueModel.load(filename)
+        self.assertEqual(len(loaded.layers), 2)
+        numpy.testing.assert_allclose(loaded.predict(features),
+                                      model.predict(features), rtol=1e-4)
+
+    def test_self_play_data(self):
+        cells, targets = value.self_play_data(puyo.ai.RandomAI(), 3,
+                                              max_moves=20)
+        self.assertEqual(cells.shape[1:], (6, 12))
+        self.assertEqual(len(cells), len(targets))
+        self.assertGreater(len(cells), 0)
+
+    def test_value_ai(self):
+        features = numpy.random.RandomState(0).uniform(
+            0, 1, (50, value.N_FEATURES))
+        model = value.fit(features, features[:,0], hidden=(), epochs=1)
+        ai = ValueAI(model)
+        board = puyo.Board(next_beans=(b'r', b'g'))
+        move = ai.get_move(board.copy(), (b'b', b'y'))
+        self.assertIn(move, list(board.iter_moves()))
+
+    def test_shipped_model(self):
+        self.assertIn("value", puyo.AI_REGISTRY)
+        model = ValueAI().model
+        self.assertEqual(model.layers[0][0].shape[0], value.N_FEATURES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+
+import unittest
+
+import puyo
+from puyo import timing, versus
+
+from helper import board_from_strs
+
+
+class TestVersus(unittest.TestCase):
+
+    def test_nuisance_for_score(self):
+        self.assertEqual(versus.nuisance_for_score(40), (0, 40))
+        self.assertEqual(versus.nuisance_for_score(40, 40), (1, 10))
+        self.assertEqual(versus.nuisance_for_score(700), (10, 0))
+
+    def test_offset(self):
+        player = versus.VersusPlayer(None)
+        player.incoming = [[1.0, 5], [2.0, 10]]
+        self.assertEqual(player.offset(7), 0)
+        self.assertEqual(player.incoming, [[2.0, 8]])
+        self.assertEqual(player.offset(10), 2)
+        self.assertEqual(player.incoming, [])
+
+    def test_take_nuisance(self):
+        player = versus.VersusPlayer(None)
+        player.incoming = [[1.0, 20], [2.0, 20], [5.0, 3]]
+        self.assertEqual(player.take_nuisance(0.5), 0)  # Not sent yet
+        self.assertEqual(player.take_nuisance(3.0),
+                         versus.MAX_NUISANCE_PER_DROP)
+        self.assertEqual(player.pending_nuisance(), 13)
+        self.assertEqual(player.take_nuisance(3.0), 10)
+        self.assertEqual(player.take_nuisance(6.0), 3)
+        self.assertEqual(player.pending_nuisance(), 0)
+
+    def test_play_match(self):
+        ais = (puyo.ai.SimpleGreedyAI(), puyo.ai.RandomAI())
+        result = versus.play_match(ais[0], ais[1], 3)
+        self.assertEqual(result, versus.play_match(ais[0], ais[1], 3))
+        self.assertIn(result.winner, (0, 1))
+        self.assertGreater(result.game_time, 0)
+        # Players move in time order, so neither gets far ahead, though
+        # time spent on chains means fewer moves
+        self.assertLessEqual(max(result.n_moves), 1.5 * min(result.n_moves))
+
+    def test_max_moves(self):
+        ais = (puyo.ai.RandomAI(), puyo.ai.RandomAI())
+        result = versus.play_match(ais[0], ais[1], 0, max_moves=2)
+        self.assertIsNone(result.winner)
+        self.assertEqual(result.n_moves, (2, 2))
+
+
+class TestTiming(unittest.TestCase):
+
+    def test_drop_rows(self):
+        board = board_from_strs([
+            b"r     ",
+            b"rg    ",
+        ])
+        self.assertEqual(timing.drop_rows(board, 0, 0), 9)
+        self.assertEqual(timing.drop_rows(board, 1, 1), 10)
+        self.assertEqual(timing.drop_rows(board, 2, 1), 11)
+
+    def test_move_time(self):
+        board = puyo.Board()
+        quick = timing.move_time(board, 2, 0)
+        self.assertGreater(timing.move_time(board, 0, 0), quick)
+        self.assertAlmostEqual(timing.move_time(board, 2, 0, 2), quick +
+                               2*timing.CHAIN_STEP_TIME)
+        # The drop is timed once, not also by how long down is held
+        self.assertAlmostEqual(quick, timing.steer_time(2, 0) +
+                               timing.drop_time(11))
+        self.assertAlmostEqual(timing.input_time(2, 0) -
+                               timing.steer_time(2, 0),
+                               timing.DOWN_FAST_STATES *
+                               timing.INPUT_STATE_TIME)
+
+    def test_settle_time(self):
+        board = board_from_strs([
+            b"g     ",
+            b"r     ",
+            b"rg    ",
+            b"rgg   ",
+        ])
+        # A red at x=1 sets off a 2 chain
+        self.assertAlmostEqual(timing.settle_time(board, (b'r', b'r'), 1, 0),
+                               timing.move_time(board, 1, 0, 2))
+        self.assertAlmostEqual(timing.settle_time(board, (b'b', b'b'), 1, 0),
+                               timing.move_time(board, 1, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@
 import unittest
 
 import puyo
+from puyo import timing
 
 from helper import PuyoTestCase, read_board_recording
 
@@ -139,6 +140,83 @@ class TestVision(PuyoTestCase):
         state = vision.get_state(board2, 5)
         self.assertFalse(state.new_move)
 
+    def test_reset(self):
+        """After a reset, previously seen beans should be forgotten."""
+        bean_finder = MockBeanFinder()
+        vision = puyo.Vision(bean_finder=bean_finder, timing_scheme="relative")
+        board1 = puyo.Board(next_beans=(b'r', b'g'))
+        board2 = puyo.Board(next_beans=(b'b', b'g'))
+
+        vision.get_state(board1, 5)
+        vision.reset()
+        self.assertIs(vision.bean_finder, bean_finder)
+
+        # Would be a new move without the reset
+        state = vision.get_state(board2, 5)
+        self.assertFalse(state.new_move)
+
+        state = vision.get_state(board1, 5)
+        self.assertTrue(state.new_move)
+
+    def test_frame_skipping(self):
+        vision = puyo.Vision(bean_finder=MockBeanFinder(),
+                             timing_scheme="relative")
+        board = puyo.Board(next_beans=(b'r', b'g'))
+        self.assertTrue(vision.wants_frame(100))
+        self.assertTrue(vision.wants_frame(100.01))
+
+        # A 1 chain
+        board.drop_beans([0, 0, 0], [b'b', b'b', b'b'])
+        vision.predict_move(board, (b'y', b'b'), (0, 0), 100)
+        settle_time = vision.settle_time
+        self.assertGreater(settle_time, 100 + timing.CHAIN_STEP_TIME)
+
+        frame_times = [100 + i / 60. for i in range(int(60 * (settle_time -
+                                                              100)))]
+        wanted = [t for t in frame_times if vision.wants_frame(t)]
+        self.assertLess(len(wanted), len(frame_times) / 4)
+        # Full rate right before the board settles
+        self.assertTrue(all(vision.wants_frame(t) for t in
+                            (settle_time - 0.1, settle_time - 0.09)))
+
+        # A new move means the board settled, whatever was predicted
+        vision.predict_move(board, (b'b', b'y'), (0, 0), 200)
+        vision.get_state(board, 5)
+        vision.get_state(puyo.Board(next_beans=(b'y', b'y')), 5)
+        self.assertTrue(vision.wants_frame(200.01))
+        self.assertTrue(vision.wants_frame(200.02))
+
+
+class MockDualBeanFinder(object):
+    """Like `MockBeanFinder`, but takes a pair of boards as the image."""
+
+    def __init__(self):
+        self.bean_finders = (MockBeanFinder(), MockBeanFinder())
+        self.n_calls = 0
+
+    def get_boards(self, boards):
+        self.n_calls += 1
+        return boards
+
+
+class TestDualVision(PuyoTestCase):
+
+    def test_independent_players(self):
+        """Each player's new moves should be tracked separately."""
+        bean_finder = MockDualBeanFinder()
+        vision = puyo.DualVision(bean_finder=bean_finder, timing_scheme="relative")
+        board1 = puyo.Board(next_beans=(b'r', b'g'))
+        board2 = puyo.Board(next_beans=(b'b', b'g'))
+
+        state1, state2 = vision.get_state((board1, board1), 5)
+        self.assertFalse(state1.new_move)
+        self.assertFalse(state2.new_move)
+
+        state1, state2 = vision.get_state((board1, board2), 5)
+        self.assertFalse(state1.new_move)
+        self.assertTrue(state2.new_move)
+        self.assertEqual(bean_finder.n_calls, 2)
+
 
 class TestVisionWithRealData(PuyoTestCase):
     """Testing on recorded (board, timestamp) tuple data."""
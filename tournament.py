@@ -0,0 +1,85 @@
+#!/usr/bin/python
+"""
+Plays a round-robin tournament between AIs.
+
+By default, every AI plays the same seeded games alone, and each pair of AIs
+is compared seed by seed. With --versus, each pair of AIs plays head to head
+matches where chains send nuisance to the opponent.
+
+Games are saved to a results file as they finish. Running the same command
+again resumes an interrupted tournament, and raising --games only plays the
+new games.
+"""
+
+import sys
+
+import puyo
+from puyo import simulation, tournament
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    ai_names = sorted(puyo.AI_REGISTRY.keys())
+    parser.add_argument("-a", "--ai", choices=ai_names, action="append",
+        dest="ais", help="AI to play. Must be given at least twice if given "
+        "(default: all of {}).".format(ai_names))
+    parser.add_argument("-g", "--games", type=int, default=100,
+        help="Number of seeds each pair of AIs is compared on (default: "
+        "%(default)s).")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+        help="Seed of the first game (default: %(default)s).")
+    parser.add_argument("-v", "--versus", action="store_true", default=False,
+        help="Play head to head matches with nuisance exchange.")
+    parser.add_argument("-n", "--nuisance", type=float, default=0,
+         dest="nuisance_probability", help="Probability (0-1) of a nuisance "
+         "bean being dropped after each move. Not used with --versus.")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+        help="Number of processes to play games with (default: number of "
+        "CPUs).")
+    parser.add_argument("--max-moves", type=int,
+        default=simulation.DEFAULT_MAX_MOVES, help="Stop games after this "
+        "many moves (default: %(default)s).")
+    parser.add_argument("-o", "--results", default="tournament_results.jsonl",
+        help="File to store game results in (default: %(default)s).")
+    args = parser.parse_args()
+    if args.nuisance_probability < 0 or args.nuisance_probability > 1:
+        parser.error("Nuisance probability (-n, --nuisance) must be between "
+            "0 and 1.")
+    ais = sorted(set(args.ais)) if args.ais else ai_names
+    if len(ais) < 2:
+        parser.error("At least two different AIs (-a, --ai) are needed.")
+
+    store = tournament.ResultStore(args.results)
+    n_stored = len(store)
+
+    def progress(record):
+        sys.stdout.write("\r{} games played".format(len(store) - n_stored))
+        sys.stdout.flush()
+
+    seeds = range(args.seed, args.seed + args.games)
+    if args.versus:
+        n_games = args.games * len(ais)*(len(ais)-1)//2
+        n_played = tournament.play_versus_games(store, ais, args.games,
+            args.seed, args.max_moves, args.processes, progress)
+    else:
+        n_games = args.games * len(ais)
+        n_played = tournament.play_solo_games(store, ais, args.games,
+            args.seed, args.nuisance_probability, args.max_moves,
+            args.processes, progress)
+    if n_played:
+        print
+    print "{} games played, {} loaded from {}".format(
+        n_played, n_games - n_played, args.results)
+    print
+
+    if args.versus:
+        standings = tournament.versus_standings(store, ais, seeds,
+                                                args.max_moves)
+    else:
+        standings = tournament.solo_standings(store, ais, seeds,
+            args.nuisance_probability, args.max_moves)
+    print standings.format()
+
+if __name__ == "__main__":
+    main()
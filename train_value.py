@@ -0,0 +1,99 @@
+#!/usr/bin/python
+"""
+Trains the board evaluation model used by the "value" AI.
+
+Games are played by an existing AI, with some random moves mixed in, and the
+board after every move is labeled with the discounted points scored after
+it. A model is fit to those labels and saved for `ValueAI`.
+"""
+from __future__ import division
+
+import multiprocessing
+from time import time
+
+import numpy
+
+import puyo
+from puyo import value
+from puyo.ai import ValueAI
+
+
+def _self_play_worker(args):
+    ai_name, seed, epsilon, max_moves = args
+    return value.self_play_data(puyo.AI_REGISTRY[ai_name](), seed, epsilon,
+                                max_moves)
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    ai_names = sorted(puyo.AI_REGISTRY.keys())
+    parser.add_argument("-a", "--ai", choices=ai_names, action="append",
+        dest="ais", help="AI that plays the training games (default: "
+        "simple_greedy). May be given more than once to mix games from "
+        "several AIs, e.g. the value AI itself, so the model sees the "
+        "boards its own mistakes lead to.")
+    parser.add_argument("-g", "--games", type=int, default=200,
+        help="Number of training games per AI (default: %(default)s).")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+        help="Seed of the first game (default: %(default)s).")
+    parser.add_argument("-e", "--epsilon", type=float, default=0.1,
+        help="Probability of a random move (default: %(default)s).")
+    parser.add_argument("--max-moves", type=int, default=200,
+        help="Stop games after this many moves (default: %(default)s).")
+    parser.add_argument("--hidden", default="32",
+        help="Comma separated hidden layer sizes. Empty for a linear model "
+        "(default: %(default)s).")
+    parser.add_argument("--epochs", type=int, default=40,
+        help="Training epochs (default: %(default)s).")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+        help="Number of processes to play games with (default: number of "
+        "CPUs).")
+    parser.add_argument("-o", "--output", default=ValueAI.MODEL_FILENAME,
+        help="Where to save the model (default: %(default)s).")
+    args = parser.parse_args()
+    ais = args.ais or ["simple_greedy"]
+    hidden = [int(size) for size in args.hidden.split(",") if size.strip()]
+
+    tasks = [(ai_name, args.seed + i, args.epsilon, args.max_moves)
+             for i in range(args.games) for ai_name in ais]
+    start = time()
+    if args.processes == 1:
+        games = map(_self_play_worker, tasks)
+    else:
+        pool = multiprocessing.Pool(args.processes)
+        try:
+            games = pool.map(_self_play_worker, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+    print "Played {} games in {:.1f}s".format(len(tasks), time() - start)
+
+    def stack(games):
+        cells = numpy.concatenate([c for c, t in games] +
+                                  [numpy.empty((0, 6, 12), numpy.uint8)])
+        targets = numpy.concatenate([t for c, t in games] + [numpy.empty(0)])
+        return value.board_features(cells), targets
+    # Every tenth seed is held out to check the fit on
+    held_out = [(seed - args.seed) % 10 == 9 for _, seed, _, _ in tasks]
+    train_features, train_targets = stack(
+        [game for game, test in zip(games, held_out) if not test])
+    test_features, test_targets = stack(
+        [game for game, test in zip(games, held_out) if test])
+    print "{} training boards, {} test boards".format(len(train_targets),
+                                                       len(test_targets))
+
+    start = time()
+    model = value.fit(train_features, train_targets, hidden, args.epochs,
+                      seed=args.seed)
+    print "Trained in {:.1f}s".format(time() - start)
+    if len(test_targets):
+        error = model.predict(test_features) - test_targets
+        baseline = test_targets - train_targets.mean()
+        print "Test RMS error: {:.1f} (predicting the mean: {:.1f})".format(
+              numpy.sqrt((error**2).mean()), numpy.sqrt((baseline**2).mean()))
+
+    model.save(args.output)
+    print "Model saved to {}".format(args.output)
+
+if __name__ == "__main__":
+    main()
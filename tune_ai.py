@@ -0,0 +1,63 @@
+#!/usr/bin/python
+"""
+Tunes the weights of SimpleComboAI's heuristic by self-play.
+
+Progress is saved to a checkpoint file after each generation. Running the
+same command again resumes from the checkpoint. The tuned weights are
+exported for the "tuned_combo" AI when the search finishes.
+"""
+
+from puyo import simulation, tuning
+from puyo.ai import TunedComboAI
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-g", "--generations", type=int, default=30,
+        help="Total number of generations to run (default: %(default)s).")
+    parser.add_argument("-p", "--population", type=int, default=12,
+        help="Candidates per generation (default: %(default)s).")
+    parser.add_argument("-n", "--games", type=int, default=8,
+        help="Games each candidate plays per generation (default: "
+        "%(default)s).")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+        help="Seed of the search (default: %(default)s).")
+    parser.add_argument("--sigma", type=float, default=1.0,
+        help="Initial sampling step size (default: %(default)s).")
+    parser.add_argument("--max-moves", type=int, default=200,
+        help="Stop games after this many moves (default: %(default)s).")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+        help="Number of processes to play games with (default: number of "
+        "CPUs).")
+    parser.add_argument("-c", "--checkpoint", default="tune_checkpoint.json",
+        help="Checkpoint file (default: %(default)s).")
+    parser.add_argument("-o", "--export",
+        default=TunedComboAI.WEIGHTS_FILENAME, help="Where to write the tuned weights (default: %(default)s).")
+    args = parser.parse_args()
+
+    state = tuning.load_checkpoint(args.checkpoint)
+    if state is None:
+        state = tuning.initial_state(args.seed, args.population, args.games,
+                                     args.max_moves, args.sigma)
+    else:
+        print "Resuming from generation {} in {}".format(
+              state["generation"], args.checkpoint)
+
+    def print_entry(entry):
+        print "Generation {:>3}: mean={:9.1f} best={:9.1f} sigma={:.3f} " \
+              "{} games in {:.1f}s ({:.2f} games/s)".format(
+              entry["generation"], entry["mean_fitness"],
+              entry["best_fitness"], state["sigma"], entry["n_games"],
+              entry["duration"], entry["games_per_second"])
+
+    tuning.tune(state, args.generations, args.checkpoint, args.processes,
+                print_entry)
+
+    tuning.export_weights(state, args.export)
+    print "Weights written to {}:".format(args.export)
+    for name in sorted(state["mean"]):
+        print "    {}: {:.3f}".format(name, state["mean"][name])
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ import os.path
 import cv2
 
 from puyo import BeanFinder
+from puyo.calibration import DEFAULT_SCREEN_OFFSET
 
 
 def main():
@@ -12,7 +13,7 @@ def main():
     out_folder = sys.argv[2]
     prefix = os.path.basename(in_filename)[:-4]
 
-    bean_finder = BeanFinder((38, 13))
+    bean_finder = BeanFinder(DEFAULT_SCREEN_OFFSET)
     in_img = cv2.imread(in_filename)
     if in_img is None:
         raise OSError("Couldn't open input image")
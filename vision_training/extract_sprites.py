@@ -0,0 +1,81 @@
+"""
+Extracts a sprite of each kind of cell from screenshots, for rendering
+synthetic frames with `puyo.emulator.FrameRenderer`.
+
+Usage:
+
+    PYTHONPATH=./ python vision_training/extract_sprites.py IMAGE [IMAGE ...]
+
+Every cell of both players' boards is labeled by the classifier. Of the cells
+with each label, the one that is classified the same way from the whole
+cell and from each single field, and that is closest to the label's average
+hue histogram, is used as its sprite. The sprites are written side by side
+to `puyo/templates/bean_sprites.png`, in the order of
+`puyo.emulator.SPRITE_CELLS`.
+
+"""
+from __future__ import division
+import sys
+
+import cv2
+import numpy
+
+from puyo.beanfinder import BeanFinder, CellIndex, CELL_CROP_SIZE, \
+        classify_cells, crop_cells, HIST_BIN_LOOKUP, HIST_BIN_WIDTHS, \
+        HIST_N_BINS, HUE_HISTOGRAMS
+from puyo.calibration import DEFAULT_SCREEN_OFFSET
+from puyo.emulator import SPRITE_CELLS, SPRITES_FILENAME
+
+
+def hue_histogram(hsv_cell):
+    counts = numpy.bincount(HIST_BIN_LOOKUP[hsv_cell[:,:,0].ravel()],
+                            minlength=HIST_N_BINS)
+    return counts / HIST_BIN_WIDTHS / counts.sum()
+
+def main():
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+
+    candidates = dict((cell, []) for cell in SPRITE_CELLS)
+    for filename in sys.argv[1:]:
+        img = cv2.imread(filename)
+        if img is None:
+            raise OSError("Couldn't open input image")
+
+        for player in (1, 2):
+            bean_finder = BeanFinder(DEFAULT_SCREEN_OFFSET, player)
+            origins = bean_finder.cell_origins
+            hsv_cells = crop_cells(img, CellIndex(origins))
+            labels = classify_cells(hsv_cells)
+            field_labels = [
+                classify_cells(crop_cells(img, CellIndex(origins, field)),
+                               True)
+                for field in (0, 1)
+            ]
+            for i, label in enumerate(labels):
+                if any(f[i] != label for f in field_labels):
+                    continue
+                x, y = origins[i]
+                sprite = img[y:y+CELL_CROP_SIZE[1], x:x+CELL_CROP_SIZE[0]]
+                candidates[label].append((hue_histogram(hsv_cells[i]),
+                                          sprite))
+
+    sprites = []
+    for cell in SPRITE_CELLS:
+        if not candidates[cell]:
+            raise ValueError('No sample of "{}" found'.format(cell))
+        mean = HUE_HISTOGRAMS.get(cell)
+        if mean is None:
+            mean = numpy.mean([hist for hist, sprite in candidates[cell]],
+                              axis=0)
+        hist, sprite = min(candidates[cell],
+                           key=lambda c: numpy.sum((c[0] - mean)**2))
+        print "{!r}: {} samples".format(cell, len(candidates[cell]))
+        sprites.append(sprite)
+
+    cv2.imwrite(SPRITES_FILENAME, numpy.hstack(sprites))
+    print "Sprites written to {}".format(SPRITES_FILENAME)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Prints hue histograms for single-field (deinterlaced) recognition.
+
+Usage:
+
+    PYTHONPATH=./ python vision_training/field_histograms.py IMAGE [IMAGE ...]
+
+Each cell of each image is labeled by the full frame classifier, which was
+trained by hand (see README.md), then the hue histogram of only the even or
+odd rows of the cell is averaged by color. Nuisance beans are skipped, since
+they're told apart from the background by the value channel. The output can
+be copied to `FIELD_HUE_HISTOGRAMS` in `puyo/beanfinder.py`.
+
+"""
+from __future__ import division
+import sys
+from collections import defaultdict
+from pprint import pprint
+
+import cv2
+import numpy
+
+from puyo.beanfinder import BeanFinder, CellIndex, classify_cells, \
+        crop_cells, HIST_N_BINS, HUE_HISTOGRAMS
+from puyo.calibration import DEFAULT_SCREEN_OFFSET
+
+
+def main():
+    if len(sys.argv) < 2:
+        print __doc__
+        sys.exit(1)
+
+    hists = defaultdict(list)
+    for filename in sys.argv[1:]:
+        img = cv2.imread(filename)
+        if img is None:
+            raise OSError("Couldn't open input image")
+
+        for player in (1, 2):
+            bean_finder = BeanFinder(DEFAULT_SCREEN_OFFSET, player)
+            labels = classify_cells(crop_cells(img, CellIndex(bean_finder.cell_origins)))
+            for field in (0, 1):
+                index = CellIndex(bean_finder.cell_origins, field)
+                for label, cell in zip(labels, crop_cells(img, index)):
+                    if label not in HUE_HISTOGRAMS:
+                        continue
+                    hues = cell.reshape((-1, 3))[:,0] / 255
+                    hist, _ = numpy.histogram(hues, HIST_N_BINS, (0, 1),
+                                              density=True)
+                    hists[label].append(hist)
+
+    pprint(dict((color, list(numpy.mean(color_hists, axis=0)))
+                for color, color_hists in hists.items()))
+
+if __name__ == "__main__":
+    main()